@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+'''OrderInfo/PositionInfo decode benchmark on large listings'''
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sabitflyer.broker import OrderInfo, decode_orders              # noqa: E402
+from sabitflyer.brokerfx import PositionInfo, decode_positions      # noqa: E402
+
+
+def make_childorders(count):
+    '''Make dummy get_childorders response'''
+    rows = []
+    for i in range(count):
+        size = random.choice([0.01, 0.02, 0.05, 0.1])
+        executed = random.choice([0, 0, size])
+        rows.append({
+            'id': 138398 + i,
+            'child_order_id': 'JOR20150707-084555-022523',
+            'product_code': 'BTC_JPY',
+            'side': random.choice(['BUY', 'SELL']),
+            'child_order_type': 'LIMIT',
+            'price': random.randint(900000, 910000),
+            'average_price': 0 if executed == 0 else 905000,
+            'size': size,
+            'child_order_state': 'ACTIVE' if executed == 0 else 'COMPLETED',
+            'expire_date': '2015-07-14T07:25:52',
+            'child_order_date': '2015-07-07T08:45:53',
+            'child_order_acceptance_id': 'JRF20150707-084552-%06d' % i,
+            'outstanding_size': size - executed,
+            'cancel_size': 0,
+            'executed_size': executed,
+            'total_commission': 0
+        })
+    return rows
+
+
+def make_positions(count):
+    '''Make dummy get_getpositions response'''
+    rows = []
+    for _ in range(count):
+        rows.append({
+            'product_code': 'FX_BTC_JPY',
+            'side': 'BUY',
+            'price': random.randint(900000, 910000),
+            'size': random.choice([0.01, 0.02, 0.05, 0.1]),
+            'commission': 0,
+            'swap_point_accumulate': -35,
+            'require_collateral': 120000,
+            'open_date': '2015-11-03T10:04:45.011',
+            'leverage': 4,
+            'pnl': random.randint(-5000, 5000),
+            'sfd': 0
+        })
+    return rows
+
+
+def main(count=1000, number=20):
+    '''Run benchmark'''
+    orders = make_childorders(count)
+    positions = make_positions(count)
+    cases = [
+        ('OrderInfo x%d' % count, lambda: [OrderInfo(row) for row in orders]),
+        ('decode_orders x%d' % count, lambda: decode_orders(orders)),
+        ('PositionInfo x%d' % count, lambda: [PositionInfo(row) for row in positions]),
+        ('decode_positions x%d' % count, lambda: decode_positions(positions)),
+    ]
+    for name, func in cases:
+        sec = min(timeit.repeat(func, number=number, repeat=3)) / number
+        print('%-28s %10.3f ms  %10.0f rows/s' % (name, sec * 1000, count / sec))
+
+
+if __name__ == '__main__':
+    main()
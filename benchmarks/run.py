@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+'''
+sabitflyer benchmark suite
+
+usage:
+    python benchmarks/run.py                    # run all and compare with baseline if exists
+    python benchmarks/run.py --save-baseline    # run all and save as baseline
+    python benchmarks/run.py -k sign -k parse   # run benchmarks whose name contains keywords
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sabitflyer.common import error_parser                      # noqa: E402
+from sabitflyer.private import PrivateAPI                       # noqa: E402
+from sabitflyer.realtime import RealtimeAPI                     # noqa: E402
+from sabitflyer.broker import BrokerAPI, OrderInfo, decode_orders   # noqa: E402
+from sabitflyer.brokerfx import PositionInfo, decode_positions  # noqa: E402
+from sabitflyer.positionbook import PositionBook                # noqa: E402
+from sabitflyer.orderbook import OrderBook                      # noqa: E402
+from sabitflyer.stubserver import StubServer                    # noqa: E402
+from bench_decode import make_childorders, make_positions      # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def measure(func, *, inner=1, samples=200, warmup=5):
+    '''Return result(ops/sec, p50, p99 in usec per op) of func'''
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        for _ in range(inner):
+            func()
+        times.append((time.perf_counter() - start) / inner)
+    times.sort()
+    return {
+        'ops': len(times) / sum(times),
+        'p50': times[len(times) // 2] * 1e6,
+        'p99': times[min(len(times) - 1, int(len(times) * 0.99))] * 1e6
+    }
+
+
+class _Response(object):
+    '''requests.Response stand-in for error_parser'''
+
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+
+    def json(self):
+        '''decode'''
+        return json.loads(self.text)
+
+
+def _frame(channel, message):
+    return json.dumps({'jsonrpc': '2.0', 'method': 'channelMessage',
+                       'params': {'channel': channel, 'message': message}})
+
+
+def bench_sign():
+    '''PrivateAPI.__make_header'''
+    api = PrivateAPI('key', 'secret')
+    make_header = api._PrivateAPI__make_header  # pylint: disable-msg=W0212
+    query = 'GET/v1/me/getchildorders?product_code=FX_BTC_JPY&child_order_state=ACTIVE'
+    yield 'sign.make_header', lambda: measure(lambda: make_header(query), inner=100)
+
+
+def bench_parse():
+    '''common.error_parser + JSON decode'''
+    small = _Response(json.dumps({'child_order_acceptance_id': 'JRF20150707-050237-639234'}))
+    large = _Response(json.dumps(make_childorders(100)))
+    yield 'parse.order_response', lambda: measure(lambda: error_parser(small), inner=100)
+    yield 'parse.childorders_x100', lambda: measure(lambda: error_parser(large), inner=10)
+
+
+def bench_dispatch():
+    '''RealtimeAPI.__ws_on_message per channel'''
+    nop = lambda *_: None   # noqa: E731
+    api = RealtimeAPI([], on_message=nop, on_message_board=nop, on_message_board_snapshot=nop,
+                      on_message_ticker=nop, on_message_executions=nop)
+    on_message = api._RealtimeAPI__ws_on_message    # pylint: disable-msg=W0212
+    levels = [{'price': 1000000 + i * 5, 'size': 0.01 * (i % 7 + 1)} for i in range(50)]
+    frames = {
+        'board_snapshot': _frame('lightning_board_snapshot_FX_BTC_JPY',
+                                 {'mid_price': 1000000, 'bids': levels, 'asks': levels}),
+        'board': _frame('lightning_board_FX_BTC_JPY',
+                        {'mid_price': 1000000, 'bids': levels[:3], 'asks': levels[:2]}),
+        'ticker': _frame('lightning_ticker_FX_BTC_JPY', {
+            'product_code': 'FX_BTC_JPY', 'timestamp': '2019-04-11T05:14:12.3739915Z',
+            'tick_id': 25965446, 'best_bid': 580006, 'best_ask': 580771,
+            'best_bid_size': 2.00000013, 'best_ask_size': 0.4, 'total_bid_depth': 1581.64414981,
+            'total_ask_depth': 1415.32079982, 'ltp': 580790, 'volume': 6625.58090729,
+            'volume_by_product': 6625.58090729}),
+        'executions': _frame('lightning_executions_FX_BTC_JPY', [{
+            'id': 39361 + i, 'side': 'SELL', 'price': 35100, 'size': 0.01,
+            'exec_date': '2015-07-07T10:44:33.547Z',
+            'buy_child_order_acceptance_id': 'JRF20150707-014356-184990',
+            'sell_child_order_acceptance_id': 'JRF20150707-104433-186048'} for i in range(10)]),
+    }
+    for name, frame in frames.items():
+        yield 'dispatch.' + name, lambda frame=frame: measure(lambda: on_message(None, frame), inner=50)
+
+
+def bench_decode():
+    '''OrderInfo/PositionInfo from large listings'''
+    orders = make_childorders(1000)
+    positions = make_positions(1000)
+    yield 'decode.orderinfo_x1000', lambda: measure(lambda: [OrderInfo(row) for row in orders], samples=20)
+    yield 'decode.decode_orders_x1000', lambda: measure(lambda: decode_orders(orders), samples=20)
+    yield 'decode.positioninfo_x1000', lambda: measure(lambda: [PositionInfo(row) for row in positions], samples=20)
+    yield 'decode.decode_positions_x1000', lambda: measure(lambda: decode_positions(positions), samples=20)
+
+
+def bench_positions():
+    '''position aggregation of a fragmented position list'''
+    positions = make_positions(1000)
+
+    def _aggregate_info():
+        # as BrokerFXAPI.get_positions
+        total = ave = 0
+        for pi in decode_positions(positions):
+            total += pi.amount
+            ave += pi.price * pi.amount
+        return ave / total
+
+    book = PositionBook('FX_BTC_JPY').load(positions)
+    fills = [('SELL', 905000, 0.01), ('BUY', 905000, 0.01)]
+    yield 'positions.positioninfo_aggregate_x1000', lambda: measure(_aggregate_info, samples=20)
+    yield 'positions.positionbook_load_x1000', lambda: measure(lambda: book.load(positions), samples=20)
+    yield 'positions.positionbook_summary_x1000', lambda: measure(lambda: book.summary(905000), inner=100)
+    yield 'positions.positionbook_fill_x1000', lambda: \
+        measure(lambda: [book.apply_fill(*fill) for fill in fills], inner=100)
+
+
+def bench_orderbook():
+    '''order book update and analytics on a 2000 levels board'''
+    bids = [{'price': 1000000 - i, 'size': 0.01 * (i % 7 + 1)} for i in range(2000)]
+    asks = [{'price': 1000001 + i, 'size': 0.01 * (i % 5 + 1)} for i in range(2000)]
+    book = OrderBook('FX_BTC_JPY').load({'mid_price': 1000000.5, 'bids': bids, 'asks': asks})
+    deltas = [([{'price': 1000000 - i % 20, 'size': 0.02 * (i % 3)}],
+               [{'price': 1000001 + i % 20, 'size': 0.03 * (i % 2)}]) for i in range(100)]
+
+    def _vwap_dicts():
+        # as a strategy walking the levels list
+        remain = 0.5
+        value = 0
+        for level in asks:
+            take = min(level['size'], remain)
+            value += level['price'] * take
+            remain -= take
+            if remain <= 0:
+                break
+        return value / 0.5
+
+    def _update_query():
+        for delta_bids, delta_asks in deltas:
+            book.apply(delta_bids, delta_asks)
+            book.imbalance(levels=5)
+            book.estimate('BUY', 0.5)
+
+    yield 'orderbook.vwap_dict_walk', lambda: measure(_vwap_dicts, inner=100)
+    yield 'orderbook.estimate', lambda: measure(lambda: book.estimate('BUY', 0.5), inner=100)
+    yield 'orderbook.update_and_query_x100', lambda: measure(_update_query, samples=50)
+
+
+def bench_roundtrip():
+    '''order placement/cancel against local StubServer'''
+    with StubServer('key', 'secret') as server:
+        server.exchange.update_board('BTC_JPY', [{'price': 1000000, 'size': 1}],
+                                     [{'price': 1000100, 'size': 1}], snapshot=True)
+        broker = BrokerAPI('BTC_JPY', 'key', 'secret', log=False, endpoint=server.endpoint)
+
+        def _place_cancel():
+            _, order_id = broker.order_buy_limit(900000, 0.01)
+            broker.order_cancel(order_id)
+
+        yield 'roundtrip.get_assets', lambda: measure(broker.get_assets, samples=100)
+        yield 'roundtrip.place_cancel', lambda: measure(_place_cancel, samples=100)
+        yield 'roundtrip.order_check_detail', lambda: \
+            measure(lambda: broker.order_check_detail('JRF00000000-000000-000001'), samples=100)
+
+
+def measure_import(statement, *, samples=10):
+    '''Return result of statement executed in a fresh interpreter(cold import)'''
+    code = ('import time; start = time.perf_counter(); %s; '
+            'print(time.perf_counter() - start)' % statement)
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    times = sorted(float(subprocess.check_output([sys.executable, '-c', code], cwd=root))
+                   for _ in range(samples))
+    return {
+        'ops': len(times) / sum(times),
+        'p50': times[len(times) // 2] * 1e6,
+        'p99': times[-1] * 1e6
+    }
+
+
+def bench_import():
+    '''cold import time of the package'''
+    statements = {
+        'import.package': 'import sabitflyer',
+        'import.realtime': 'from sabitflyer import RealtimeAPI',
+        'import.broker_enums': 'from sabitflyer import BrokerAPI; BrokerAPI.OrderSide',
+        'import.private_api': 'from sabitflyer import PrivateAPI; PrivateAPI("key", "secret")',
+        'import.requests': 'import requests',     # paid on the first request
+    }
+    for name, statement in statements.items():
+        yield name, lambda statement=statement: measure_import(statement)
+
+
+BENCHMARKS = [bench_import, bench_sign, bench_parse, bench_dispatch, bench_decode, bench_positions,
+              bench_orderbook, bench_roundtrip]
+
+
+def main():
+    '''entry point'''
+    parser = argparse.ArgumentParser(description='sabitflyer benchmark suite')
+    parser.add_argument('-k', dest='keywords', action='append', default=[],
+                        help='run benchmarks whose name contains the keyword')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file(json)')
+    parser.add_argument('--save-baseline', action='store_true', help='save results as baseline')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='regression threshold of ops/sec(%%)')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as fbase:
+            baseline = json.load(fbase)
+
+    results = {}
+    regressions = []
+    print('%-34s %14s %12s %12s %9s' % ('benchmark', 'ops/sec', 'p50(us)', 'p99(us)', 'vs base'))
+    for bench in BENCHMARKS:
+        for name, run in bench():
+            if args.keywords and not any(key in name for key in args.keywords):
+                continue
+            res = results[name] = run()
+            diff = ''
+            if name in baseline:
+                ratio = (res['ops'] / baseline[name]['ops'] - 1) * 100
+                diff = '%+8.1f%%' % ratio
+                if ratio < -args.threshold:
+                    regressions.append(name)
+                    diff += ' !'
+            print('%-34s %14.1f %12.2f %12.2f %9s' % (name, res['ops'], res['p50'], res['p99'], diff))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as fbase:
+            json.dump(results, fbase, indent=2, sort_keys=True)
+        print('baseline saved: %s' % args.baseline)
+    if regressions:
+        print('regressions(< -%.1f%%): %s' % (args.threshold, ', '.join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,57 @@
-
 '''
 sabitflyer - bitFlyer Lightning API library for Python
+
+Submodules are imported on first attribute access(PEP 562), so
+`from sabitflyer import RealtimeAPI` does not load requests and
+the enums of BrokerAPI do not load websocket.
 '''
-from .public import PublicAPI
-from .private import PrivateAPI
-from .broker import BrokerAPI
-from .brokerfx import BrokerFXAPI
-from .realtime import RealtimeAPI
+import importlib
+
+_LAZY = {
+    'PublicAPI': 'public',
+    'PrivateAPI': 'private',
+    'BrokerAPI': 'broker',
+    'BrokerFXAPI': 'brokerfx',
+    'RealtimeAPI': 'realtime',
+    'FillDetector': 'filldetector',
+    'NumericMode': 'common',
+    'NumConverter': 'common',
+    'HealthMonitor': 'monitor',
+    'PaperPrivateAPI': 'paper',
+    'PaperBrokerAPI': 'paper',
+    'PaperBrokerFXAPI': 'paper',
+    'QueueModel': 'paper',
+    'MarketRecorder': 'sweep',
+    'MarketData': 'sweep',
+    'run_sweep': 'sweep',
+    'StubServer': 'stubserver',
+    'Metrics': 'metrics',
+    'BrokerHub': 'hub',
+    'RateBudget': 'common',
+    'SessionPool': 'session',
+    'RetryPolicy': 'retry',
+    'ResponseCache': 'cache',
+    'LadderManager': 'ladder',
+    'MarginEstimator': 'margin',
+    'PositionBook': 'positionbook',
+    'SFDMonitor': 'sfd',
+    'HistoryStore': 'history',
+    'ExecutionGapFiller': 'gapfill',
+    'OrderBook': 'orderbook',
+    'ParentOrderTracker': 'parenttracker',
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value     # import once
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
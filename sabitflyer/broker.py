@@ -1,11 +1,8 @@
 # -*- coding: utf-8 -*-
 '''取引所アクセスモジュール'''
 import os
-from datetime import datetime
 from enum import Enum, IntEnum, auto
-from .common import get_dt_short, get_dt_long, n2d
-from .private import PrivateAPI
-from .public import PublicAPI
+from .common import get_dt_short, get_dt_long, iso2dt, make_num, NUM_DECIMAL
 
 
 class BrokerAPI(object):
@@ -31,14 +28,12 @@ class BrokerAPI(object):
         BUY = 'BUY'
         SELL = 'SELL'
 
+    _STR2SIDE = {side.value: side for side in OrderSide}
+
     @staticmethod
     def str2side(str_side):
         '''Convert string to OrderSide type'''
-        if str_side == BrokerAPI.OrderSide.BUY.value:
-            return BrokerAPI.OrderSide.BUY
-        elif str_side == BrokerAPI.OrderSide.SELL.value:
-            return BrokerAPI.OrderSide.SELL
-        return None
+        return BrokerAPI._STR2SIDE.get(str_side)
 
     class OrderType(Enum):
         '''enumeration of order type'''
@@ -51,13 +46,12 @@ class BrokerAPI(object):
         OCO = 'OCO'
         IFDOCO = 'IFDOCO'
 
+    _STR2TYPE = {ot.value: ot for ot in OrderType}
+
     @staticmethod
     def str2type(str_type):
         '''Convert string to OrderType type'''
-        for ot in BrokerAPI.OrderType:
-            if ot.value == str_type:
-                return ot
-        return None
+        return BrokerAPI._STR2TYPE.get(str_type)
 
     class OrderState(IntEnum):
         '''enumeration of order state'''
@@ -97,29 +91,61 @@ class BrokerAPI(object):
         ORDER_ALL_CANCEL = 'ORDER_ALL_CANCEL'
         OCO_BUY_LIMIT_STOP = 'OCO_BUY_LIMIT_STOP'
         OCO_SELL_LIMIT_STOP = 'OCO_SELL_LIMIT_STOP'
+        SPECIAL_ORDER_SIMPLE = 'SPECIAL_ORDER_SIMPLE'
+        SPECIAL_ORDER_IFD = 'SPECIAL_ORDER_IFD'
+        SPECIAL_ORDER_OCO = 'SPECIAL_ORDER_OCO'
+        SPECIAL_ORDER_IFDOCO = 'SPECIAL_ORDER_IFDOCO'
         SPECIAL_ORDER_CANCEL = 'SPECIAL_ORDER_CANCEL'
 
+    # methods recorded by metrics(Metrics)
+    INSTRUMENTED_METHODS = (
+        'get_assets', 'get_margin_trading', 'get_positions', 'order_check_detail',
+        'get_depth_data', 'get_ticker', 'get_executions', 'get_depth_status', 'get_broker_status',
+        'order_buy_limit', 'order_buy_market', 'order_sell_limit', 'order_sell_market',
+        'order_cancel', 'order_all_cancel', 'parent_aid_to_oid', 'so_check_details',
+        'so_check_legs', 'so_oco_buy_limit_stop', 'so_oco_sell_limit_stop', 'so_send',
+        'so_ifdoco_buy_limit', 'so_ifdoco_sell_limit', 'so_cancel')
+
+    PARENT_ID_CACHE = 1024      # parent_order_acceptance_id -> parent_order_id
+    SPECIAL_ORDER_LEGS = {'SIMPLE': 1, 'IFD': 2, 'OCO': 2, 'IFDOCO': 3}     # number of parameters
+
     @staticmethod
     def str2dt(str_dt):
         '''Convert string to datetime type'''
-        try:
-            TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
-            return datetime.strptime(str_dt[0:18], TIMESTAMP_FORMAT)
-        except:
-            return None
+        return iso2dt(str_dt)
 
-    def __init__(self, pair, key, secret, log=True, *, get_timeout=None, post_timeout=None):
+    def __init__(self, pair, key, secret, log=True, *, get_timeout=None, post_timeout=None,
+                 numeric=None, health_monitor=None, order_wait=0, prv_api=None, endpoint=None,
+                 metrics=None, pub_api=None):
         """イニシャライザ"""
         self.broker_name = 'bitflyer'
         self.__trade_pair = pair
+        self.__num = make_num(numeric)
+        self.__health_monitor = health_monitor
+        self.__order_wait = order_wait
+        self.__parent_ids = {}
 
         self.__api_key = key
         self.__api_secret = secret
         self.__get_timeout = get_timeout
         self.__post_timeout = post_timeout
-        self.__prv_api = PrivateAPI(self.__api_key, self.__api_secret,
-                                    get_timeout=self.__get_timeout,
-                                    post_timeout=self.__post_timeout)
+        self.__endpoint = endpoint
+        if prv_api is None:
+            from .private import PrivateAPI     # requests is loaded on demand
+            prv_api = PrivateAPI(self.__api_key, self.__api_secret,
+                                 get_timeout=self.__get_timeout,
+                                 post_timeout=self.__post_timeout,
+                                 endpoint=self.__endpoint,
+                                 metrics=metrics)
+        self.__prv_api = prv_api
+        if pub_api is None:
+            from .public import PublicAPI
+            pub_api = PublicAPI(timeout=self.__get_timeout, endpoint=self.__endpoint)
+        self.__pub_api = pub_api
+        if metrics is not None:
+            for name in self.INSTRUMENTED_METHODS:
+                if hasattr(self, name):
+                    setattr(self, name, metrics.wrap_call(getattr(self, name), name))
 
         self.__log = log
         if self.__log:
@@ -159,6 +185,13 @@ class BrokerAPI(object):
             with open(self.__log_path, 'a') as flog:
                 flog.writelines(wstr)
 
+    def __wait_orderable(self):
+        '''発注可否の確認(HealthMonitor使用時、停止中は例外を発生させます)'''
+        if self.__health_monitor is not None:
+            if not self.__health_monitor.acquire(self.__order_wait):
+                raise Exception('order paused: %s %s' % (self.__health_monitor.health.value,
+                                                         self.__health_monitor.state.value))
+
     # -------------------------------------------------------------------------
     # Private API
     # -------------------------------------------------------------------------
@@ -167,11 +200,26 @@ class BrokerAPI(object):
         '''[property] private api'''
         return self.__prv_api
 
+    @property
+    def pub_api(self):
+        '''[property] public api'''
+        return self.__pub_api
+
     @property
     def trade_pair(self):
         '''[property] trade pair'''
         return self.__trade_pair
 
+    @property
+    def health_monitor(self):
+        '''[property] health monitor(None if not used)'''
+        return self.__health_monitor
+
+    @property
+    def num(self):
+        '''[property] numeric converter(NumConverter)'''
+        return self.__num
+
     class AssetInfo:
         '''資産情報'''
         name = None
@@ -194,8 +242,9 @@ class BrokerAPI(object):
             for blance in res_balances:
                 asset_info = self.AssetInfo()
                 asset_info.name = blance['currency_code']
-                asset_info.onhand_amount = n2d(blance['amount'])
-                asset_info.free_amount = n2d(blance['available'])
+                conv = self.__num.price if asset_info.name == self.Asset.JPY.value else self.__num.size
+                asset_info.onhand_amount = conv(blance['amount'])
+                asset_info.free_amount = conv(blance['available'])
                 rtn_assets[asset_info.name] = asset_info
             result = True
         except:     # pylint: disable-msg=W0702
@@ -211,7 +260,7 @@ class BrokerAPI(object):
             res_infos = self.prv_api.get_childorders(
                 self.trade_pair, child_order_acceptance_id=order_id)
             if len(res_infos) > 0:  # pylint: disable-msg=C1801
-                rtn_order = OrderInfo(res_infos[0])
+                rtn_order = OrderInfo(res_infos[0], num=self.__num)
                 result = True
             else:
                 result = True
@@ -230,7 +279,7 @@ class BrokerAPI(object):
         result = False
         res_dct = None
         try:
-            res_dct = PublicAPI(timeout=self.__get_timeout).get_markets()
+            res_dct = self.__pub_api.get_markets()
             result = True
         except:     # pylint: disable-msg=W0702
             result = False
@@ -242,7 +291,7 @@ class BrokerAPI(object):
         result = False
         res_dct = None
         try:
-            res_dct = PublicAPI(timeout=self.__get_timeout).get_depth(self.trade_pair)
+            res_dct = self.__pub_api.get_depth(self.trade_pair)
             result = True
         except:     # pylint: disable-msg=W0702
             result = False
@@ -254,7 +303,7 @@ class BrokerAPI(object):
         result = False
         res_dct = None
         try:
-            res_dct = PublicAPI(timeout=self.__get_timeout).get_ticker(self.trade_pair)
+            res_dct = self.__pub_api.get_ticker(self.trade_pair)
             result = True
         except:     # pylint: disable-msg=W0702
             result = False
@@ -266,7 +315,7 @@ class BrokerAPI(object):
         result = False
         res_dct = None
         try:
-            res_dct = PublicAPI(timeout=self.__get_timeout).get_executions(self.trade_pair)
+            res_dct = self.__pub_api.get_executions(self.trade_pair)
             result = True
         except:     # pylint: disable-msg=W0702
             result = False
@@ -293,11 +342,13 @@ class BrokerAPI(object):
 
     def get_depth_status(self):
         ''' 板の状態の取得 '''
+        if self.__health_monitor is not None:
+            return self.__health_monitor.status()
         result = False
         health = self.HealthStatus.STOP
         state = self.StateStatus.CLOSED
         try:
-            res_dct = PublicAPI(timeout=self.__get_timeout).get_boardstate(self.trade_pair)
+            res_dct = self.__pub_api.get_boardstate(self.trade_pair)
             health = self.cvt_status_health(res_dct['health'])
             state = self.cvt_status_state(res_dct['state'])
             result = True
@@ -309,10 +360,13 @@ class BrokerAPI(object):
 
     def get_broker_status(self):
         ''' 取引所の状態の取得 '''
+        if self.__health_monitor is not None:
+            result, health, _ = self.__health_monitor.status()
+            return result, health
         result = False
         health = self.HealthStatus.STOP
         try:
-            res_dct = PublicAPI(timeout=self.__get_timeout).get_health(self.trade_pair)
+            res_dct = self.__pub_api.get_health(self.trade_pair)
             health = self.cvt_status_health(res_dct['status'])
             result = True
         except:     # pylint: disable-msg=W0702
@@ -325,13 +379,35 @@ class BrokerAPI(object):
         result = False
         res_dct = None
         try:
-            res_dct = PublicAPI(timeout=self.__get_timeout).get_chats()
+            res_dct = self.__pub_api.get_chats()
             result = True
         except:     # pylint: disable-msg=W0702
             result = False
             res_dct = None
         return result, res_dct
 
+    def estimate_market_order(self, side, amount, order_book=None):
+        '''
+        成行注文の約定見積り(OrderBook.Impact、order_book省略時は板情報を取得)
+
+        order_buy_market/order_sell_marketの前にスリッページを確認できます。
+        '''
+        result = False
+        impact = None
+        try:
+            if order_book is None:
+                from .orderbook import OrderBook
+                result, res_dct = self.get_depth_data()
+                if not result:
+                    raise Exception('get_depth_data failed')
+                order_book = OrderBook(self.trade_pair).load(res_dct)
+            impact = order_book.estimate(side, self.__num.size2float(amount))
+            result = True
+        except:     # pylint: disable-msg=W0702
+            result = False
+            impact = None
+        return result, impact
+
     # -------------------------------------------------------------------------
     # Private API
     # -------------------------------------------------------------------------
@@ -340,9 +416,10 @@ class BrokerAPI(object):
         result = False
         order_id = None
         try:
+            self.__wait_orderable()
             res_order = self.prv_api.send_childorder_limit_buy(self.trade_pair,
-                                                               float(price),
-                                                               float(amount))
+                                                               self.__num.price2float(price),
+                                                               self.__num.size2float(amount))
             order_id = res_order['child_order_acceptance_id']
             result = True
         except:     # pylint: disable-msg=W0702
@@ -361,9 +438,10 @@ class BrokerAPI(object):
         result = False
         order_id = None
         try:
+            self.__wait_orderable()
             res_order = \
                 self.prv_api.send_childorder_market_buy(self.trade_pair,
-                                                        float(amount))
+                                                        self.__num.size2float(amount))
             order_id = res_order['child_order_acceptance_id']
             result = True
         except:     # pylint: disable-msg=W0702
@@ -382,8 +460,9 @@ class BrokerAPI(object):
         result = False
         order_id = None
         try:
+            self.__wait_orderable()
             res_order = self.prv_api.send_childorder_limit_sell(
-                self.trade_pair, float(price), float(amount))
+                self.trade_pair, self.__num.price2float(price), self.__num.size2float(amount))
             order_id = res_order['child_order_acceptance_id']
             result = True
         except:     # pylint: disable-msg=W0702
@@ -402,9 +481,10 @@ class BrokerAPI(object):
         result = False
         order_id = None
         try:
+            self.__wait_orderable()
             res_order = \
                 self.prv_api.send_childorder_market_sell(self.trade_pair,
-                                                         float(amount))
+                                                         self.__num.size2float(amount))
             order_id = res_order['child_order_acceptance_id']
             result = True
         except:     # pylint: disable-msg=W0702
@@ -458,11 +538,16 @@ class BrokerAPI(object):
     def parent_aid_to_oid(self, acceptance_id):
         '''Get parent_order_id from parent_order_acceptance_id'''
         result = False
-        rtn_id = None
+        rtn_id = self.__parent_ids.get(acceptance_id)
+        if rtn_id is not None:
+            return True, rtn_id
         try:
             res_info = self.__prv_api.get_parentorder(parent_order_acceptance_id=acceptance_id)
             rtn_id = res_info['parent_order_id']
             result = True
+            if len(self.__parent_ids) >= self.PARENT_ID_CACHE:
+                del self.__parent_ids[next(iter(self.__parent_ids))]
+            self.__parent_ids[acceptance_id] = rtn_id
         except:
             result = False
             rtn_id = None
@@ -478,8 +563,7 @@ class BrokerAPI(object):
                                                      parent_order_id=parent_order_id)
             rtn_orders = []
             if len(res_infos) > 0:  # pylint: disable-msg=C1801
-                for info in res_infos:
-                    rtn_orders.append(OrderInfo(info))
+                rtn_orders = decode_orders(res_infos, self.__num)
                 result = True
             else:
                 result = True
@@ -490,6 +574,31 @@ class BrokerAPI(object):
             rtn_orders = None
         return result, rtn_orders
 
+    def so_check_legs(self, *, parent_order_acceptance_id=None, parent_order_id=None):
+        '''
+        check special order information of all legs by parent order
+
+        return result, parent_order_id, list of OrderInfo(child orders of the legs)
+        '''
+        result = False
+        rtn_orders = None
+        if parent_order_id is None:
+            result, parent_order_id = self.parent_aid_to_oid(parent_order_acceptance_id)
+            if not result:
+                return False, None, None
+        result, rtn_orders = self.so_check_details(parent_order_id)
+        return result, parent_order_id, rtn_orders
+
+    def so_mk_prms_market(self, product_code, side, size) -> dict:
+        '''return parameters of dicttype parent order'''
+        res_dict = {
+            'product_code': product_code,
+            'condition_type': self.ConditionType.MARKET.value,
+            'side': side,
+            'size': size
+        }
+        return res_dict
+
     def so_mk_prms_limit(self, product_code, side, price, size) -> dict:
         '''return parameters of dicttype parent order'''
         res_dict = {
@@ -512,20 +621,124 @@ class BrokerAPI(object):
         }
         return res_dict
 
+    def so_mk_prms_stop_limit(self, product_code, side, price, trigger_price, size) -> dict:
+        '''return parameters of dicttype parent order'''
+        res_dict = {
+            'product_code': product_code,
+            'condition_type': self.ConditionType.STOP_LIMIT.value,
+            'side': side,
+            'price': price,
+            'trigger_price': trigger_price,
+            'size': size
+        }
+        return res_dict
+
+    def so_mk_prms_trail(self, product_code, side, offset, size) -> dict:
+        '''return parameters of dicttype parent order'''
+        res_dict = {
+            'product_code': product_code,
+            'condition_type': self.ConditionType.TRAIL.value,
+            'side': side,
+            'offset': offset,
+            'size': size
+        }
+        return res_dict
+
+    def so_send(self, order_type, parameters, *, minute_to_expire=None, time_in_force=None):
+        '''
+        send special order(SIMPLE/IFD/OCO/IFDOCO) of parameters(so_mk_prms_*) by one request
+
+        return result, parent_order_acceptance_id((False, None) if order_type or parameters is invalid)
+        '''
+        if hasattr(order_type, 'value'):
+            order_type = order_type.value
+        legs = self.SPECIAL_ORDER_LEGS.get(order_type) if isinstance(order_type, str) else None
+        if legs is None or not isinstance(parameters, (list, tuple)) or len(parameters) != legs \
+                or not all(isinstance(prms, dict) and 'condition_type' in prms for prms in parameters):
+            if legs is not None:
+                self.__logging_event(self.EventLog['SPECIAL_ORDER_' + order_type],
+                                     None, None, None,
+                                     False, '%s:invalid parameters' % order_type)
+            return False, None
+        result = False
+        order_id = None
+        try:
+            self.__wait_orderable()
+            res_order = self.prv_api.send_parentorder(order_type, parameters,
+                                                      minute_to_expire=minute_to_expire,
+                                                      time_in_force=time_in_force)
+            order_id = res_order['parent_order_acceptance_id']
+            result = True
+        except:     # pylint: disable-msg=W0702
+            result = False
+            order_id = None
+
+        event = self.EventLog['SPECIAL_ORDER_' + order_type]
+        for i, prms in enumerate(parameters):
+            self.__logging_event(event,
+                                 order_id,
+                                 prms.get('price', prms.get('trigger_price', prms.get('offset'))),
+                                 prms.get('size'),
+                                 result, '%s%d:%s' % (order_type, i + 1, prms['condition_type']))
+
+        return result, order_id
+
+    def so_ifd(self, first, second, **kwargs):
+        '''IFD special order(second is ordered after first is filled)'''
+        return self.so_send(self.OrderType.IFD, [first, second], **kwargs)
+
+    def so_oco(self, first, second, **kwargs):
+        '''OCO special order(one is canceled when the other is filled)'''
+        return self.so_send(self.OrderType.OCO, [first, second], **kwargs)
+
+    def so_ifdoco(self, first, second, third, **kwargs):
+        '''IFDOCO special order(OCO of second and third after first is filled)'''
+        return self.so_send(self.OrderType.IFDOCO, [first, second, third], **kwargs)
+
+    def __so_bracket(self, side, exit_side, o_price, tp_price, sl_price, amount, kwargs):
+        '''IFDOCO of limit entry, limit take profit and stop loss'''
+        try:
+            price = self.__num.price2float
+            size = self.__num.size2float(amount)
+            parameters = [
+                self.so_mk_prms_limit(self.trade_pair, side.value, price(o_price), size),
+                self.so_mk_prms_limit(self.trade_pair, exit_side.value, price(tp_price), size),
+                self.so_mk_prms_stop(self.trade_pair, exit_side.value, price(sl_price), size)]
+        except:     # pylint: disable-msg=W0702
+            for i, (leg_price, ctype) in enumerate(((o_price, 'LIMIT'), (tp_price, 'LIMIT'),
+                                                    (sl_price, 'STOP'))):
+                self.__logging_event(self.EventLog.SPECIAL_ORDER_IFDOCO,
+                                     None,
+                                     leg_price, amount,
+                                     False, 'IFDOCO%d:%s' % (i + 1, ctype))
+            return False, None
+        return self.so_send(self.OrderType.IFDOCO, parameters, **kwargs)
+
+    def so_ifdoco_buy_limit(self, o_price, tp_price, sl_price, amount, **kwargs):
+        '''ifdoco type order of buying limit, then selling limit(take profit) and stop(stop loss)'''
+        return self.__so_bracket(self.OrderSide.BUY, self.OrderSide.SELL,
+                                 o_price, tp_price, sl_price, amount, kwargs)
+
+    def so_ifdoco_sell_limit(self, o_price, tp_price, sl_price, amount, **kwargs):
+        '''ifdoco type order of selling limit, then buying limit(take profit) and stop(stop loss)'''
+        return self.__so_bracket(self.OrderSide.SELL, self.OrderSide.BUY,
+                                 o_price, tp_price, sl_price, amount, kwargs)
+
     def so_oco_buy_limit_stop(self, o_price, s_price, amount):
         '''oco type buying order of limit and trail'''
         result = False
         order_id = None
         try:
+            self.__wait_orderable()
             # make order list
             prms_order = self.so_mk_prms_limit(self.trade_pair,
                                                self.OrderSide.BUY.value,
-                                               float(o_price),
-                                               float(amount))
+                                               self.__num.price2float(o_price),
+                                               self.__num.size2float(amount))
             prms_stop = self.so_mk_prms_stop(self.trade_pair,
                                              self.OrderSide.BUY.value,
-                                             float(s_price),
-                                             float(amount))
+                                             self.__num.price2float(s_price),
+                                             self.__num.size2float(amount))
             parameters = [prms_order, prms_stop]
 
             # send order
@@ -553,15 +766,16 @@ class BrokerAPI(object):
         result = False
         order_id = None
         try:
+            self.__wait_orderable()
             # make order list
             prms_order = self.so_mk_prms_limit(self.trade_pair,
                                                self.OrderSide.SELL.value,
-                                               float(o_price),
-                                               float(amount))
+                                               self.__num.price2float(o_price),
+                                               self.__num.size2float(amount))
             prms_stop = self.so_mk_prms_stop(self.trade_pair,
                                              self.OrderSide.SELL.value,
-                                             float(s_price),
-                                             float(amount))
+                                             self.__num.price2float(s_price),
+                                             self.__num.size2float(amount))
             parameters = [prms_order, prms_stop]
 
             # send order
@@ -620,20 +834,10 @@ class BrokerAPI(object):
 
 class OrderInfo(object):
     '''order information class'''
-    order_id = None
-    order_pair = None
-    order_side = None
-    order_type = None
-    order_state = None
-    order_price = None
-    order_amount = None
-    executed_ave_price = None
-    executed_amount = None
-    executed_commission = None
-    outstanding_amount = None
-    canceled_amount = None
-    expire_date = None
-    order_date = None
+    __slots__ = ('order_id', 'order_pair', 'order_side', 'order_type', 'order_state',
+                 'order_price', 'order_amount',
+                 'executed_ave_price', 'executed_amount', 'executed_commission',
+                 'outstanding_amount', 'canceled_amount', 'expire_date', 'order_date')
 
     @property
     def executed_actual_amount(self):
@@ -642,39 +846,32 @@ class OrderInfo(object):
             return None
         return self.executed_amount - self.executed_commission
 
-    def __init__(self, info=None):
+    def __init__(self, info=None, *, num=NUM_DECIMAL):
         if info is not None:
             self.order_id = info['child_order_acceptance_id']
             self.order_pair = info['product_code']
-            self.order_side = BrokerAPI.str2side(info['side'])
-            self.order_type = BrokerAPI.str2type(info['child_order_type'])
-            self.order_price = n2d(info['price'])
-            self.order_amount = n2d(info['size'])
-            self.executed_ave_price = n2d(info['average_price'])
-            self.executed_amount = n2d(info['executed_size'])
-            self.executed_commission = n2d(info['total_commission'])
-            self.outstanding_amount = n2d(info['outstanding_size'])
-            self.canceled_amount = n2d(info['cancel_size'])
-            self.expire_date = BrokerAPI.str2dt(info['expire_date'])
-            self.order_date = BrokerAPI.str2dt(info['child_order_date'])
+            self.order_side = BrokerAPI._STR2SIDE.get(info['side'])       # pylint: disable-msg=W0212
+            self.order_type = BrokerAPI._STR2TYPE.get(info['child_order_type'])   # pylint: disable-msg=W0212
+            self.order_price = num.price(info['price'])
+            self.order_amount = num.size(info['size'])
+            self.executed_ave_price = num.price(info['average_price'])
+            self.executed_amount = num.size(info['executed_size'])
+            self.executed_commission = num.size(info['total_commission'])
+            self.outstanding_amount = num.size(info['outstanding_size'])
+            self.canceled_amount = num.size(info['cancel_size'])
+            self.expire_date = iso2dt(info['expire_date'])
+            self.order_date = iso2dt(info['child_order_date'])
             self.order_state = self.__analize_state(info['child_order_state'], self.executed_amount)
+        else:
+            for name in self.__slots__:
+                setattr(self, name, None)
 
     @staticmethod
     def __analize_state(str_state, executed_amount):
-        if str_state == 'ACTIVE':
-            if executed_amount > 0:
-                return BrokerAPI.OrderState.PARTIALLY_FILLED
-            else:
-                return BrokerAPI.OrderState.UNFILLED
-        elif str_state == 'COMPLETED':
-            return BrokerAPI.OrderState.FULLY_FILLED
-        elif str_state == 'CANCELED':
-            if executed_amount > 0:
-                return BrokerAPI.OrderState.CANCELED_PARTIALLY_FILLED
-            else:
-                return BrokerAPI.OrderState.CANCELED_UNFILLED
-        else:   # EXPIRED, REJECTED
+        states = _ORDER_STATES.get(str_state)
+        if states is None:  # EXPIRED, REJECTED
             return BrokerAPI.OrderState.CANCELED_UNFILLED
+        return states[1] if executed_amount > 0 else states[0]
 
     def out_shell(self):
         '''Display information to shell'''
@@ -694,3 +891,17 @@ class OrderInfo(object):
         print('canceled_amount', self.canceled_amount, type(self.canceled_amount))
         print('expire_date', self.expire_date, type(self.expire_date))
         print('order_date', self.order_date, type(self.order_date))
+
+
+# child_order_state -> (未約定時, 一部約定時)
+_ORDER_STATES = {
+    'ACTIVE': (BrokerAPI.OrderState.UNFILLED, BrokerAPI.OrderState.PARTIALLY_FILLED),
+    'COMPLETED': (BrokerAPI.OrderState.FULLY_FILLED, BrokerAPI.OrderState.FULLY_FILLED),
+    'CANCELED': (BrokerAPI.OrderState.CANCELED_UNFILLED, BrokerAPI.OrderState.CANCELED_PARTIALLY_FILLED),
+}
+
+
+def decode_orders(res_infos, num=NUM_DECIMAL):
+    '''Convert get_childorders response(list) to list of OrderInfo at once'''
+    num = num.cached()
+    return [OrderInfo(info, num=num) for info in res_infos]
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 '''取引所アクセスモジュール for FX'''
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from .common import n2d
+import threading
+import time
+from .common import iso2dt, NUM_DECIMAL
 from .broker import BrokerAPI
+from .positionbook import PositionBook
 
 
 class BrokerFXAPI(BrokerAPI):
@@ -17,16 +21,76 @@ class BrokerFXAPI(BrokerAPI):
         '''enumeration of trade pair'''
         FX_BTC_JPY = 'FX_BTC_JPY'
 
+    def __init__(self, *args, snapshot_max_age=0, **kwargs):
+        '''
+        snapshot_max_age: freshness window(seconds) in which get_margin_trading/
+            get_positions/get_assets reuse the last account snapshot(0: always request)
+
+        The snapshot requests run on worker threads, call close() when done.
+        '''
+        super().__init__(*args, **kwargs)
+        self.snapshot_max_age = snapshot_max_age
+        self.__snapshot = None
+        self.__snapshot_lock = threading.Lock()
+        self.__executor = None
+
+    def close(self):
+        '''
+        Shutdown worker threads of get_account_snapshot
+        (call when the broker is no longer used, it can be used again after that)
+        '''
+        with self.__snapshot_lock:
+            executor = self.__executor
+            self.__executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
     # -------------------------------------------------------------------------
     # Private API
     # -------------------------------------------------------------------------
+    def __fresh_snapshot(self):
+        '''Return the last snapshot if within snapshot_max_age'''
+        snapshot = self.__snapshot
+        if snapshot is not None and snapshot.age() <= self.snapshot_max_age:
+            return snapshot
+        return None
+
+    def get_account_snapshot(self, max_age=None):
+        '''
+        Get collateral and positions of all pairs concurrently
+        (PrivateAPI使用回数: 1 + pair数分 回, 所要時間は約1往復)
+
+        The last snapshot is returned if it is younger than max_age
+        (default: snapshot_max_age) seconds. Raise exception on failure.
+        '''
+        max_age = self.snapshot_max_age if max_age is None else max_age
+        with self.__snapshot_lock:
+            snapshot = self.__snapshot
+            if snapshot is not None and max_age > 0 and snapshot.age() <= max_age:
+                return snapshot
+            executor = self.__executor
+            if executor is None:
+                executor = self.__executor = ThreadPoolExecutor(max_workers=1 + len(self.TradePair))
+            pairs = [pair.value for pair in self.TradePair]
+            fut_collateral = executor.submit(self.prv_api.get_getcollateral)
+            fut_positions = [executor.submit(self.prv_api.get_getpositions, pair) for pair in pairs]
+            res_positions = {pair: future.result() for pair, future in zip(pairs, fut_positions)}
+            snapshot = AccountSnapshot(fut_collateral.result(), res_positions,
+                                       num=self.num, assets=self.Asset, asset_info=self.AssetInfo)
+            self.__snapshot = snapshot
+            return snapshot
+
     def get_margin_trading(self):
         '''証拠金の状態を取得'''
         result = False
         rtn_mti = None
         try:
-            res_cll = self.prv_api.get_getcollateral()
-            rtn_mti = MarginTradingInfo(res_cll)
+            snapshot = self.__fresh_snapshot()
+            if snapshot is not None:
+                rtn_mti = snapshot.margin
+            else:
+                res_cll = self.prv_api.get_getcollateral()
+                rtn_mti = MarginTradingInfo(res_cll, num=self.num)
             result = True
         except:     # pylint: disable-msg=W0702
             result = False
@@ -37,18 +101,21 @@ class BrokerFXAPI(BrokerAPI):
         '''Get open positions'''
         result = False
         rtn_pi_list = []
-        rtn_ave_price = n2d(0)
-        rtn_total_amount = n2d(0)
+        rtn_ave_price = self.num.zero
+        rtn_total_amount = self.num.zero
         try:
-            res_postions = self.prv_api.get_getpositions(self.trade_pair)
-            ave_divisor = n2d(0)
-            for pos in res_postions:
-                pi = PositionInfo(pos)
-                rtn_pi_list.append(pi)
+            snapshot = self.__fresh_snapshot()
+            if snapshot is not None and self.trade_pair in snapshot.positions:
+                rtn_pi_list = snapshot.positions[self.trade_pair]
+            else:
+                res_postions = self.prv_api.get_getpositions(self.trade_pair)
+                rtn_pi_list = decode_positions(res_postions, self.num)
+            ave_divisor = self.num.zero
+            for pi in rtn_pi_list:
                 rtn_total_amount += pi.amount
                 ave_divisor = ave_divisor + (pi.price * pi.amount)
             if rtn_total_amount > 0:
-                rtn_ave_price = ave_divisor / rtn_total_amount
+                rtn_ave_price = self.num.average(ave_divisor, rtn_total_amount)
             result = True
         except:
             result = False
@@ -57,73 +124,96 @@ class BrokerFXAPI(BrokerAPI):
             rtn_total_amount = None
         return result, rtn_pi_list, rtn_ave_price, rtn_total_amount
 
+    def get_position_book(self):
+        '''Get open positions as PositionBook(aggregated in a single pass)'''
+        try:
+            res_postions = self.prv_api.get_getpositions(self.trade_pair)
+            return True, PositionBook(self.trade_pair).load(res_postions)
+        except:     # pylint: disable-msg=W0702
+            return False, None
+
     def get_assets(self):
-        '''資産残高を取得(PrivateAPI使用回数: 1 + pair数分 回)'''
-        result = False
-        rtn_assets = {}
+        '''資産残高を取得(PrivateAPI使用回数: 1 + pair数分 回, 並列に取得)'''
         try:
-            # JPY(証拠金残高)を取得する
-            res_collateral = self.prv_api.get_getcollateral()
-            asset_jpy = self.AssetInfo()
-            asset_jpy.name = self.Asset.JPY.value
-            asset_jpy.onhand_amount = n2d(res_collateral['collateral'])  # 預託証拠金
-            wk_req_amount = n2d(res_collateral['require_collateral'])    # 必要証拠金
-            asset_jpy.free_amount = asset_jpy.onhand_amount - wk_req_amount
-            rtn_assets[asset_jpy.name] = asset_jpy
-
-            # 仮想通貨(建玉)を取得する
-            for pair in self.TradePair:
-                res_posiotns = self.prv_api.get_getpositions(pair.value)
-                for position in res_posiotns:
-                    # 通貨名の取得
-                    name = position['product_code'].split('_')[1]
-                    # 保持量の取得(ショートポジションの場合は-とする)
-                    amount = n2d(position['size'])
-                    if position['side'] == 'SELL':
-                        amount = amount * n2d(-1)
-                    # 資産情報の生成
-                    if name not in rtn_assets:
-                        asset_vc = self.AssetInfo()
-                        asset_vc.name = name
-                        asset_vc.onhand_amount = amount
-                        asset_vc.free_amount = amount
-                    else:
-                        asset_vc = rtn_assets[name]
-                        asset_vc.name = name
-                        asset_vc.onhand_amount += amount
-                        asset_vc.free_amount += amount
-                    rtn_assets[asset_vc.name] = asset_vc
-
-            # 生成されなかった資産情報を擬似的に生成する
-            for asset in self.Asset:
-                if asset.value not in rtn_assets:
-                    asset_vc = self.AssetInfo()
-                    asset_vc.name = asset.value
-                    asset_vc.onhand_amount = n2d(0)
-                    asset_vc.free_amount = n2d(0)
-                    rtn_assets[asset_vc.name] = asset_vc
+            return True, self.get_account_snapshot().assets
+        except:     # pylint: disable-msg=W0702
+            return False, None
 
-            result = True
 
-        except:     # pylint: disable-msg=W0702
-            result = False
-            rtn_assets = None
-        return result, rtn_assets
+class AccountSnapshot(object):
+    '''
+    Account snapshot of margin trading(collateral and positions at once)
+
+    Objects are shared while the snapshot is reused, treat them as read-only.
+    '''
+    __slots__ = ('timestamp',       # 取得完了時刻(epoch秒)
+                 'monotonic',       # 取得完了時刻(time.monotonic)
+                 'margin',          # MarginTradingInfo
+                 'positions',       # pair -> list of PositionInfo
+                 'assets')          # name -> AssetInfo
+
+    def __init__(self, res_collateral, res_positions, *, num, assets, asset_info):
+        self.timestamp = time.time()
+        self.monotonic = time.monotonic()
+        self.margin = MarginTradingInfo(res_collateral, num=num)
+        self.positions = {pair: decode_positions(rows, num) for pair, rows in res_positions.items()}
+
+        # JPY(証拠金残高)
+        rtn_assets = {}
+        asset_jpy = asset_info()
+        asset_jpy.name = assets.JPY.value
+        asset_jpy.onhand_amount = self.margin.margin_deposit                            # 預託証拠金
+        asset_jpy.free_amount = self.margin.margin_deposit - self.margin.required_margin  # -必要証拠金
+        rtn_assets[asset_jpy.name] = asset_jpy
+
+        # 仮想通貨(建玉, ショートポジションの場合は-とする)
+        for pair, positions in self.positions.items():
+            name = pair.split('_')[1]
+            amount = num.zero
+            for position in positions:
+                amount += -position.amount if position.side == BrokerAPI.OrderSide.SELL else position.amount
+            if positions:
+                asset_vc = rtn_assets.get(name)
+                if asset_vc is None:
+                    asset_vc = rtn_assets[name] = asset_info()
+                    asset_vc.name = name
+                    asset_vc.onhand_amount = asset_vc.free_amount = num.zero
+                asset_vc.onhand_amount += amount
+                asset_vc.free_amount += amount
+
+        # 生成されなかった資産情報を擬似的に生成する
+        for asset in assets:
+            if asset.value not in rtn_assets:
+                asset_vc = asset_info()
+                asset_vc.name = asset.value
+                asset_vc.onhand_amount = num.zero
+                asset_vc.free_amount = num.zero
+                rtn_assets[asset_vc.name] = asset_vc
+        self.assets = rtn_assets
+
+    def age(self):
+        '''Return seconds since the snapshot was taken'''
+        return time.monotonic() - self.monotonic
 
 
 class MarginTradingInfo(object):
     '''margin trading information'''
-    margin_deposit = None   # 預入証拠金(JPY)
-    required_margin = None  # 必要証拠金(JPY)
-    margin_rate = None      # 証拠金維持率(%)
-    profit_loss = None      # 損益(JPY)
+    __slots__ = ('margin_deposit',      # 預入証拠金(JPY)
+                 'required_margin',     # 必要証拠金(JPY)
+                 'margin_rate',         # 証拠金維持率(%)
+                 'profit_loss')         # 損益(JPY)
 
-    def __init__(self, info=None):
+    def __init__(self, info=None, *, num=NUM_DECIMAL):
         if info is not None:
-            self.margin_deposit = n2d(info['collateral'])
-            self.required_margin = n2d(info['require_collateral'])
-            self.margin_rate = n2d(info['keep_rate'])
-            self.profit_loss = n2d(info['open_position_pnl'])
+            self.margin_deposit = num.price(info['collateral'])
+            self.required_margin = num.price(info['require_collateral'])
+            self.margin_rate = num.ratio(info['keep_rate'])
+            self.profit_loss = num.price(info['open_position_pnl'])
+        else:
+            self.margin_deposit = None
+            self.required_margin = None
+            self.margin_rate = None
+            self.profit_loss = None
 
     def out_shell(self):
         '''Display information to shell'''
@@ -135,31 +225,25 @@ class MarginTradingInfo(object):
 
 class PositionInfo(object):
     '''Position information'''
-    pair = None
-    side = None
-    price = None
-    amount = None
-    commission = None
-    swap = None
-    required_margin = None
-    open_date = None
-    leverage = None
-    profit_loss = None
-    sfd = None
-
-    def __init__(self, info=None):
+    __slots__ = ('pair', 'side', 'price', 'amount', 'commission', 'swap',
+                 'required_margin', 'open_date', 'leverage', 'profit_loss', 'sfd')
+
+    def __init__(self, info=None, *, num=NUM_DECIMAL):
         if info is not None:
             self.pair = info['product_code']
-            self.side = BrokerAPI.str2side(info['side'])
-            self.price = n2d(info['price'])
-            self.amount = n2d(info['size'])
-            self.commission = n2d(info['commission'])
-            self.swap = n2d(info['swap_point_accumulate'])
-            self.required_margin = n2d(info['require_collateral'])
-            self.open_date = BrokerAPI.str2dt(info['open_date'])
-            self.leverage = n2d(info['leverage'])
-            self.profit_loss = n2d(info['pnl'])
-            self.sfd = n2d(info['sfd'])
+            self.side = BrokerAPI._STR2SIDE.get(info['side'])     # pylint: disable-msg=W0212
+            self.price = num.price(info['price'])
+            self.amount = num.size(info['size'])
+            self.commission = num.price(info['commission'])
+            self.swap = num.price(info['swap_point_accumulate'])
+            self.required_margin = num.price(info['require_collateral'])
+            self.open_date = iso2dt(info['open_date'])
+            self.leverage = num.ratio(info['leverage'])
+            self.profit_loss = num.price(info['pnl'])
+            self.sfd = num.price(info['sfd'])
+        else:
+            for name in self.__slots__:
+                setattr(self, name, None)
 
     def out_shell(self):
         '''Display information to shell'''
@@ -174,3 +258,9 @@ class PositionInfo(object):
         print('leverage=%s' % str(self.leverage))
         print('profit_loss=%s' % str(self.profit_loss))
         print('sfd=%s' % str(self.sfd))
+
+
+def decode_positions(res_positions, num=NUM_DECIMAL):
+    '''Convert get_getpositions response(list) to list of PositionInfo at once'''
+    num = num.cached()
+    return [PositionInfo(info, num=num) for info in res_positions]
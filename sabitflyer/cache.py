@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+'''レスポンスキャッシュモジュール'''
+from collections import OrderedDict
+import threading
+import time
+
+
+class _Flight(object):
+    '''in-flight request shared by concurrent callers'''
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache(object):
+    '''
+    TTL + LRU cache of GET responses(opt-in by PrivateAPI/PublicAPI(cache=...))
+
+    Only the paths in ttls are cached(seconds per path). Concurrent
+    identical GETs share one in-flight request(single-flight). POST
+    requests through the same PrivateAPI invalidate the paths in
+    invalidate_paths(balance, collateral and positions by default).
+
+    Cached responses are shared by callers, so treat them as read-only.
+    Use one cache per PrivateAPI(API key), the key does not include it.
+    '''
+
+    DEFAULT_TTLS = {
+        '/v1/me/getpermissions': 60,
+        '/v1/getmarkets': 60,
+        '/v1/me/getbalance': 1,
+        '/v1/me/getcollateral': 1,
+        '/v1/me/getcollateralaccounts': 1,
+        '/v1/me/getpositions': 1,
+    }
+    INVALIDATE_PATHS = ('/v1/me/getbalance', '/v1/me/getcollateral',
+                        '/v1/me/getcollateralaccounts', '/v1/me/getpositions')
+
+    def __init__(self, ttls=None, *, maxsize=256, invalidate_paths=INVALIDATE_PATHS, metrics=None):
+        self.ttls = dict(self.DEFAULT_TTLS if ttls is None else ttls)
+        self.maxsize = maxsize
+        self.invalidate_paths = frozenset(invalidate_paths)
+        self.__metrics = metrics
+        self.__entries = OrderedDict()     # key -> (path, expire, result)
+        self.__flights = {}                 # key -> _Flight
+        self.__lock = threading.Lock()
+
+    def __count(self, path, result):
+        if self.__metrics is not None:
+            self.__metrics.inc('cache_total', (('endpoint', path), ('result', result)))
+
+    def fetch(self, path, key, func):
+        '''Return cached response of key or call func()(not cached if path has no TTL)'''
+        ttl = self.ttls.get(path)
+        if ttl is None:
+            return func()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    self.__entries.move_to_end(key)
+                    self.__count(path, 'hit')
+                    return entry[2]
+                del self.__entries[key]
+            flight = self.__flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.__flights[key] = _Flight()
+        if not leader:
+            self.__count(path, 'shared')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        self.__count(path, 'miss')
+        try:
+            flight.result = func()
+        except Exception as ex:
+            flight.error = ex
+            raise
+        finally:
+            with self.__lock:
+                # not stored if invalidated while in flight
+                if self.__flights.get(key) is flight:
+                    del self.__flights[key]
+                    if flight.error is None:
+                        self.__entries[key] = (path, time.monotonic() + ttl, flight.result)
+                        while len(self.__entries) > self.maxsize:
+                            self.__entries.popitem(last=False)
+            flight.done.set()
+        return flight.result
+
+    def invalidate(self, paths=None):
+        '''Remove entries of paths(default: invalidate_paths)'''
+        paths = self.invalidate_paths if paths is None else frozenset(paths)
+        with self.__lock:
+            for key in [key for key, entry in self.__entries.items() if entry[0] in paths]:
+                del self.__entries[key]
+            for key in [key for key in self.__flights if key.split('?')[0] in paths]:
+                del self.__flights[key]
+
+    def clear(self):
+        '''Remove all entries'''
+        with self.__lock:
+            self.__entries.clear()
+            self.__flights.clear()
@@ -2,7 +2,11 @@
 '''共通ロジックモジュール'''
 
 import datetime
+import threading
+import time
+from collections import deque
 from decimal import Decimal
+from enum import Enum
 
 
 def error_parser(response):
@@ -36,4 +40,169 @@ def get_dt_long():
 
 def n2d(value) -> Decimal:
     '''数値(int,float)をDecimal型へ変換'''
+    if type(value) is int:  # pylint: disable-msg=C0123
+        return Decimal(value)
     return Decimal(str(value))
+
+
+def n2d_cached():
+    '''同一値の変換結果を共有するn2dを生成(一括変換用)'''
+    cache = {}
+
+    def _n2d(value):
+        try:
+            return cache[value]
+        except KeyError:
+            rtn = cache[value] = n2d(value)
+            return rtn
+    return _n2d
+
+
+def iso2dt(str_dt):
+    '''ISO形式の文字列(YYYY-MM-DDTHH:MM:SS[.f])をdatetime型へ変換(秒未満は切り捨て)'''
+    try:
+        return datetime.datetime(int(str_dt[0:4]), int(str_dt[5:7]), int(str_dt[8:10]),
+                                 int(str_dt[11:13]), int(str_dt[14:16]), int(str_dt[17:19]))
+    except:     # pylint: disable-msg=W0702
+        return None
+
+
+class NumericMode(Enum):
+    '''enumeration of numeric representation'''
+    DECIMAL = 'DECIMAL'     # Decimal(正確)
+    FLOAT = 'FLOAT'         # float(高速)
+    SCALED = 'SCALED'       # 固定小数点の整数(価格: price_scale倍, 数量: size_scale倍)
+
+
+class NumConverter(object):
+    '''
+    Numeric converter by NumericMode
+
+    price(JPY建ての値), size(通貨数量) and ratio(倍率・率) convert API values
+    into the selected representation. In SCALED mode prices are integers of
+    1/price_scale JPY and sizes are integers of 1/size_scale coin(satoshi),
+    ratios stay Decimal.
+    '''
+
+    def __init__(self, mode=NumericMode.DECIMAL, *, price_scale=1, size_scale=100000000):
+        self.mode = mode
+        self.price_scale = price_scale
+        self.size_scale = size_scale
+        if mode == NumericMode.DECIMAL:
+            self.price = self.size = self.ratio = n2d
+            self.zero = Decimal(0)
+        elif mode == NumericMode.FLOAT:
+            self.price = self.size = self.ratio = float
+            self.zero = 0.0
+        elif mode == NumericMode.SCALED:
+            self.price = _scaler(price_scale)
+            self.size = _scaler(size_scale)
+            self.ratio = n2d
+            self.zero = 0
+        else:
+            raise ValueError(mode)
+
+    def cached(self):
+        '''Return converter sharing converted values(for batch decode)'''
+        if self.mode != NumericMode.DECIMAL:
+            return self
+        rtn = NumConverter(self.mode, price_scale=self.price_scale, size_scale=self.size_scale)
+        rtn.price = rtn.size = rtn.ratio = n2d_cached()
+        return rtn
+
+    def price2float(self, value):
+        '''Convert price to float(for order parameters)'''
+        if self.mode == NumericMode.SCALED:
+            return value / self.price_scale
+        return float(value)
+
+    def size2float(self, value):
+        '''Convert size to float(for order parameters)'''
+        if self.mode == NumericMode.SCALED:
+            return value / self.size_scale
+        return float(value)
+
+    def average(self, value_sum, size_sum):
+        '''Return average price from sum(price * size) and sum(size)'''
+        if self.mode == NumericMode.SCALED:
+            return (2 * value_sum + size_sum) // (2 * size_sum)    # 四捨五入
+        return value_sum / size_sum
+
+
+def _scaler(scale):
+    def _scale(value):
+        if type(value) is int:  # pylint: disable-msg=C0123
+            return value * scale
+        return int(round(float(value) * scale))
+    return _scale
+
+
+def make_num(numeric=None) -> NumConverter:
+    '''Return NumConverter from NumericMode/NumConverter(None is DECIMAL)'''
+    if isinstance(numeric, NumConverter):
+        return numeric
+    if numeric is None:
+        return NUM_DECIMAL
+    return NumConverter(numeric)
+
+
+NUM_DECIMAL = NumConverter()
+
+
+class RateBudget(object):
+    '''
+    Rate budget by sliding window(limit requests per period seconds)
+
+    Shared by PublicAPI/PrivateAPI(rate_limits=...) to account requests
+    per IP or per API key.
+    '''
+
+    def __init__(self, limit, period=300):
+        self.limit = limit
+        self.period = period
+        self.__stamps = deque()
+        self.__lock = threading.Lock()
+
+    def __expire(self, now):
+        stamps = self.__stamps
+        while stamps and stamps[0] <= now - self.period:
+            stamps.popleft()
+
+    def remaining(self):
+        '''Return number of requests available now'''
+        with self.__lock:
+            self.__expire(time.time())
+            return self.limit - len(self.__stamps)
+
+    def acquire(self, timeout=None):
+        '''
+        Consume a request(wait until available).
+        Return False if not available within timeout(seconds).
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self.__lock:
+                now = time.time()
+                self.__expire(now)
+                if len(self.__stamps) < self.limit:
+                    self.__stamps.append(now)
+                    return True
+                wait = self.__stamps[0] + self.period - now
+            if deadline is not None:
+                if now >= deadline:
+                    return False
+                wait = min(wait, deadline - now)
+            time.sleep(max(wait, 0.001))
+
+
+def acquire_budgets(rate_limits, timeout=None):
+    '''
+    Consume all budgets(wait until available).
+    Raise exception if not available within timeout(seconds, None waits
+    up to the period of the budget).
+    '''
+    deadline = None if timeout is None else time.time() + timeout
+    for budget in rate_limits:
+        wait = None if deadline is None else max(deadline - time.time(), 0)
+        if not budget.acquire(wait):
+            raise Exception('rate limit exceeded')
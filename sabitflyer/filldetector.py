@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+'''約定検知モジュール(public executions stream)'''
+import threading
+from .common import make_num, NumericMode
+
+
+class FillDetector(object):
+    '''
+    Fill detector by public executions stream
+
+    Holds an index of own live child_order_acceptance_id and matches
+    every execution batch of RealtimeAPI against it, so fills are known
+    without any REST call.
+
+    *** The description of callback ***
+    on_fill(detector, event) is called for every partial/full fill.
+    on_message_executions can be passed to RealtimeAPI as is.
+
+    numeric must be the same as RealtimeAPI(None is raw float).
+    '''
+
+    class FillEvent(object):
+        '''fill event class for callback'''
+        __slots__ = ('order_id', 'pair', 'side', 'price', 'size',
+                     'executed_size', 'executed_ave_price', 'order_size',
+                     'is_full', 'exec_id', 'exec_date')
+
+        def __init__(self, order_id, pair, side, price, size,
+                     executed_size, executed_ave_price, order_size,
+                     is_full, exec_id, exec_date):
+            self.order_id = order_id                        # child_order_acceptance_id
+            self.pair = pair
+            self.side = side                                # 'BUY' or 'SELL'
+            self.price = price                              # 今回の約定価格
+            self.size = size                                # 今回の約定数量
+            self.executed_size = executed_size              # 累計約定数量
+            self.executed_ave_price = executed_ave_price    # 平均約定価格
+            self.order_size = order_size                    # 注文数量(不明時はNone)
+            self.is_full = is_full                          # 全約定
+            self.exec_id = exec_id
+            self.exec_date = exec_date
+
+    class _Entry(object):
+        __slots__ = ('side', 'size', 'executed_size', 'executed_value', 'exec_ids')
+
+        def __init__(self, side, size):
+            self.side = side
+            self.size = size
+            self.executed_size = 0
+            self.executed_value = 0
+            self.exec_ids = set()
+
+    def __init__(self, *, on_fill=None, tolerance=1e-9, numeric=None):
+        self.__cb_on_fill = on_fill
+        self.__num = None if numeric is None else make_num(numeric)
+        if self.__num is None or self.__num.mode == NumericMode.FLOAT:
+            self.__tolerance = tolerance
+            self.__average = lambda value, size: value / size
+        else:
+            self.__tolerance = 0
+            self.__average = self.__num.average
+        self.__orders = {}
+        self.__lock = threading.Lock()
+
+    def add(self, order_id, side=None, size=None):
+        '''Register own order(child_order_acceptance_id) to the index'''
+        if order_id is None:
+            return
+        if hasattr(side, 'value'):
+            side = side.value
+        with self.__lock:
+            if order_id not in self.__orders:
+                if size is not None and self.__num is None:
+                    size = float(size)
+                self.__orders[order_id] = self._Entry(side, size)
+
+    def remove(self, order_id):
+        '''Unregister order from the index(canceled etc.)'''
+        with self.__lock:
+            self.__orders.pop(order_id, None)
+
+    def clear(self):
+        '''Unregister all orders'''
+        with self.__lock:
+            self.__orders.clear()
+
+    def __contains__(self, order_id):
+        return order_id in self.__orders
+
+    def __len__(self):
+        return len(self.__orders)
+
+    def executed(self, order_id):
+        '''Return (executed size, average price) of registered order'''
+        entry = self.__orders.get(order_id)
+        if entry is None or entry.executed_size == 0:
+            return 0, None
+        return entry.executed_size, self.__average(entry.executed_value, entry.executed_size)
+
+    def on_executions(self, pair, data_list):
+        '''Scan executions(list of RealtimeAPI.ExecutionData) and return fill events'''
+        orders = self.__orders
+        if not orders:
+            return []
+
+        events = []
+        with self.__lock:
+            for data in data_list:
+                for side, order_id in (('BUY', data.buy_child_order_acceptance_id),
+                                       ('SELL', data.sell_child_order_acceptance_id)):
+                    entry = orders.get(order_id)
+                    if entry is None or data.order_id in entry.exec_ids:
+                        continue
+                    entry.exec_ids.add(data.order_id)
+                    entry.executed_size += data.size
+                    entry.executed_value += data.price * data.size
+                    is_full = (entry.size is not None
+                               and entry.executed_size >= entry.size - self.__tolerance)
+                    events.append(self.FillEvent(order_id, pair, side,
+                                                 data.price, data.size,
+                                                 entry.executed_size,
+                                                 self.__average(entry.executed_value, entry.executed_size),
+                                                 entry.size, is_full,
+                                                 data.order_id, data.exec_date))
+                    if is_full:
+                        del orders[order_id]
+
+        for event in events:
+            self.__callback(self.__cb_on_fill, event)
+        return events
+
+    def on_message_executions(self, _, pair, data_list):
+        '''callback for RealtimeAPI(on_message_executions)'''
+        self.on_executions(pair, data_list)
+
+    def __callback(self, callback, *args):
+        if callback:
+            try:
+                callback(self, *args)
+            except:     # pylint: disable-msg=W0702
+                import traceback
+                traceback.print_exc()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+'''約定ストリームの欠損補完モジュール(再接続時のREST補完と重複除去)'''
+import threading
+from .common import make_num
+from .realtime import RealtimeAPI
+
+
+class ExecutionGapFiller(object):
+    '''
+    Continuous executions stream across websocket reconnects
+
+    Tracks the last execution id per pair. After a reconnect(on_open
+    after the first one), the first batch of a pair marks the end of the
+    gap and the missing range (last id, first id of the batch) is fetched
+    by PublicAPI.get_executions with after/before cursors(page_size per
+    page, up to max_pages). Backfilled and live executions are merged in
+    id order and executions at or below the last id are dropped, so the
+    consumer sees one ordered stream without duplicates. Several
+    RealtimeAPI(redundant connections) can feed the same filler: the
+    backfill runs without the lock(live batches of the pair are buffered
+    meanwhile) and the consumer is called by one thread at a time.
+
+    *** The description of callback ***
+    on_message_executions(realtime, pair, data_list) receives the merged stream.
+    on_gap(filler, event) is called for every backfill(GapEvent).
+    on_message_executions/on_open can be passed to RealtimeAPI as is.
+
+    numeric must be the same as RealtimeAPI(None is raw float).
+    '''
+
+    class GapEvent(object):
+        '''backfill event for callback'''
+        __slots__ = ('pair', 'after', 'before', 'filled', 'complete', 'error')
+
+        def __init__(self, pair, after, before, filled, complete, error):
+            self.pair = pair
+            self.after = after          # 最後に受信した約定id
+            self.before = before        # 再接続後の最初の約定id
+            self.filled = filled        # 補完した約定数
+            self.complete = complete    # 欠損区間を全て取得した
+            self.error = error          # 取得失敗時の例外(成功時はNone)
+
+    def __init__(self, pub_api, *, on_message_executions=None, on_gap=None,
+                 numeric=None, page_size=500, max_pages=10):
+        self.pub_api = pub_api
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.__cb_on_message_executions = on_message_executions
+        self.__cb_on_gap = on_gap
+        self.__num = None if numeric is None else make_num(numeric)
+        self.__lock = threading.RLock()     # also serializes delivery to the consumer
+        self.__last = {}            # pair -> last execution id
+        self.__pending = set()      # pairs to backfill on the next batch
+        self.__filling = set()      # pairs being backfilled
+        self.__buffer = {}          # pair -> live executions received while backfilling
+        self.__stats = {'gaps': 0, 'filled': 0, 'duplicates': 0}
+
+    def on_open(self, _):
+        '''callback for RealtimeAPI(on_open)'''
+        with self.__lock:
+            self.__pending.update(self.__last)
+
+    def on_message_executions(self, realtime, pair, data_list):
+        '''callback for RealtimeAPI(on_message_executions)'''
+        with self.__lock:
+            if pair in self.__filling:
+                self.__buffer[pair].extend(data_list)   # merged after the backfill
+                return
+            last = self.__last.get(pair)
+            gap = None
+            if pair in self.__pending:
+                first = min((data.order_id for data in data_list if data.order_id > last),
+                            default=None)
+                if first is not None:
+                    self.__pending.discard(pair)
+                    if first > last + 1:
+                        gap = (last, first)
+            if gap is None:
+                self.__deliver(realtime, pair, data_list)
+                return
+            self.__filling.add(pair)
+            self.__buffer[pair] = list(data_list)
+
+        # REST requests without the lock(other pairs and feeds are not blocked)
+        backfill, event = self.__backfill(pair, *gap)
+        if self.__cb_on_gap is not None:
+            try:
+                self.__cb_on_gap(self, event)
+            except:     # pylint: disable-msg=W0702
+                import traceback
+                traceback.print_exc()
+        with self.__lock:
+            self.__stats['gaps'] += 1
+            self.__stats['filled'] += len(backfill)
+            self.__filling.discard(pair)
+            self.__deliver(realtime, pair, backfill + self.__buffer.pop(pair))
+
+    def __deliver(self, realtime, pair, data_list):
+        '''Pass executions after the last id to the consumer in id order(with the lock)'''
+        last = self.__last.get(pair)
+        out = []
+        for data in sorted(data_list, key=lambda data: data.order_id):
+            if last is None or data.order_id > last:
+                out.append(data)
+                last = data.order_id
+        self.__stats['duplicates'] += len(data_list) - len(out)
+        if last is not None:
+            self.__last[pair] = last
+        if out and self.__cb_on_message_executions is not None:
+            self.__cb_on_message_executions(realtime, pair, out)
+
+    def __backfill(self, pair, after, before):
+        '''Fetch executions between after and before(return data list and GapEvent)'''
+        rows = []
+        cursor = before
+        complete = False
+        error = None
+        try:
+            for _ in range(self.max_pages):
+                page = self.pub_api.get_executions(pair, count=self.page_size,
+                                                   before=cursor, after=after)
+                rows.extend(page)
+                if len(page) < self.page_size:
+                    complete = True
+                    break
+                cursor = min(row['id'] for row in page)
+        except Exception as ex:     # pylint: disable-msg=W0703
+            error = ex
+        num = self.__num
+        data_list = [RealtimeAPI.ExecutionData(row, num) for row in rows]
+        return data_list, self.GapEvent(pair, after, before, len(data_list), complete, error)
+
+    def last_id(self, pair):
+        '''Return last execution id of pair(None if nothing received)'''
+        return self.__last.get(pair)
+
+    def stats(self):
+        '''Return dict of gaps, filled and duplicates(dropped executions)'''
+        with self.__lock:
+            return dict(self.__stats)
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+'''取引履歴の差分同期モジュール(SQLite)'''
+import json
+import sqlite3
+import threading
+
+
+class HistoryStore(object):
+    '''
+    Account history store(child orders, parent orders and deposits) on SQLite
+
+    sync() fetches only new or changed rows through PrivateAPI: rows after
+    the newest stored id, the rows open now(ACTIVE) and the stored open rows
+    closed since the last sync(paged by the before cursor). The first sync
+    pulls the whole history. Rows are indexed by id, acceptance id, state
+    and date, so queries are answered locally. A stored open row which is
+    not found any more(aged out of the listing) is closed with the state
+    UNKNOWN, so it is not looked up again.
+
+    Rows are returned as dict of the API response.
+    '''
+
+    PAGE_SIZE = 500
+    LOOKUP_LIMIT = 10       # closed orders looked up one by one(over this, by the window)
+
+    # table -> (columns, open states, state column, date column)
+    TABLES = {
+        'childorders': (('id', 'product_code', 'child_order_id', 'child_order_acceptance_id',
+                         'parent_order_id', 'side', 'child_order_type', 'child_order_state',
+                         'child_order_date'),
+                        ('ACTIVE',), 'child_order_state', 'child_order_date'),
+        'parentorders': (('id', 'product_code', 'parent_order_id', 'parent_order_acceptance_id',
+                          'side', 'parent_order_type', 'parent_order_state', 'parent_order_date'),
+                         ('ACTIVE',), 'parent_order_state', 'parent_order_date'),
+        'deposits': (('id', 'order_id', 'currency_code', 'status', 'event_date'),
+                     ('PENDING',), 'status', 'event_date'),
+    }
+    INDEXES = {
+        'childorders': ('child_order_acceptance_id', 'child_order_id', 'parent_order_id',
+                        'child_order_state', 'child_order_date'),
+        'parentorders': ('parent_order_acceptance_id', 'parent_order_id',
+                         'parent_order_state', 'parent_order_date'),
+        'deposits': ('order_id', 'status', 'event_date'),
+    }
+
+    def __init__(self, path, prv_api, pairs=('BTC_JPY', 'FX_BTC_JPY')):
+        self.prv_api = prv_api
+        self.pairs = tuple(pair.value if hasattr(pair, 'value') else pair for pair in pairs)
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        self.__lock = threading.Lock()
+        with self.__lock, self.__db:
+            for table, (columns, _, _, _) in self.TABLES.items():
+                defs = ', '.join(['id INTEGER PRIMARY KEY'] + ['%s TEXT' % col for col in columns[1:]])
+                self.__db.execute('CREATE TABLE IF NOT EXISTS %s (%s, raw TEXT NOT NULL)' % (table, defs))
+                for col in self.INDEXES[table]:
+                    self.__db.execute('CREATE INDEX IF NOT EXISTS %s_%s ON %s (%s)'
+                                      % (table, col, table, col))
+
+    def close(self):
+        '''Close database'''
+        with self.__lock:
+            self.__db.close()
+
+    # -------------------------------------------------------------------------
+    # sync
+    # -------------------------------------------------------------------------
+    def __select_ids(self, table, product_code, open_only):
+        '''Return ids of open rows, or [max id] if not open_only'''
+        _, open_states, state_col, _ = self.TABLES[table]
+        where = []
+        args = []
+        if product_code is not None:
+            where.append('product_code = ?')
+            args.append(product_code)
+        if open_only:
+            where.append('%s IN (%s)' % (state_col, ','.join('?' * len(open_states))))
+            args.extend(open_states)
+            sql = 'SELECT id, %s FROM %s' % ('child_order_id' if table == 'childorders' else 'NULL', table)
+        else:
+            sql = 'SELECT MAX(id), NULL FROM %s' % table
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        with self.__lock:
+            return [row for row in self.__db.execute(sql, args) if row[0] is not None]
+
+    def __store(self, table, rows):
+        columns = self.TABLES[table][0]
+        sql = 'INSERT OR REPLACE INTO %s (%s, raw) VALUES (%s)' % (
+            table, ', '.join(columns), ', '.join('?' * (len(columns) + 1)))
+        values = [[row.get(col) for col in columns] + [json.dumps(row)] for row in rows]
+        with self.__lock, self.__db:
+            self.__db.executemany(sql, values)
+
+    def __close_unknown(self, table, ids):
+        '''Set state UNKNOWN to the stored open rows of ids(not found any more)'''
+        state_col = self.TABLES[table][2]
+        with self.__lock, self.__db:
+            for row_id in ids:
+                for (raw,) in self.__db.execute('SELECT raw FROM %s WHERE id = ?' % table, (row_id,)):
+                    row = json.loads(raw)
+                    row[state_col] = 'UNKNOWN'
+                    self.__db.execute('UPDATE %s SET %s = ?, raw = ? WHERE id = ?' % (table, state_col),
+                                      ('UNKNOWN', json.dumps(row), row_id))
+
+    def __page(self, table, fetch, after):
+        '''Fetch rows after the cursor page by page and store them(return ids)'''
+        before = None
+        ids = set()
+        while True:
+            page = fetch(count=self.PAGE_SIZE, before=before, after=after)
+            if not page:
+                break
+            self.__store(table, page)
+            ids.update(row['id'] for row in page)
+            if len(page) < self.PAGE_SIZE:
+                break
+            before = min(row['id'] for row in page)
+        return ids
+
+    def __sync(self, table, fetch, product_code=None, fetch_open=None, lookup=None):
+        '''
+        Sync a table:
+            1. rows after the newest stored id
+            2. open rows(fetch_open) to update the stored open rows
+            3. stored open rows no longer open(closed since the last sync) by
+               lookup, or by the window after the oldest of them
+            4. stored open rows not found by 3 are closed as UNKNOWN
+        Without fetch_open, the window after the oldest stored open row is used.
+        '''
+        stored_open = self.__select_ids(table, product_code, True)
+        newest = self.__select_ids(table, product_code, False)
+        fetched = self.__page(table, fetch, newest[0][0] if newest else None)
+        if not stored_open:
+            return len(fetched)
+        if fetch_open is not None:
+            fetched |= self.__page(table, fetch_open, None)
+        closed = [row for row in stored_open if row[0] not in fetched]
+        if not closed:
+            return len(fetched)
+        if lookup is not None and len(closed) <= self.LOOKUP_LIMIT:
+            for _, order_id in closed:
+                rows = lookup(order_id)
+                self.__store(table, rows)
+                fetched.update(row['id'] for row in rows)
+        else:
+            fetched |= self.__page(table, fetch, min(row[0] for row in closed) - 1)
+        self.__close_unknown(table, [row[0] for row in closed if row[0] not in fetched])
+        return len(fetched)
+
+    def sync(self, *, childorders=True, parentorders=True, deposits=True):
+        '''Fetch new or changed rows and return dict of table -> number of fetched rows'''
+        res = {}
+        api = self.prv_api
+        if childorders:
+            res['childorders'] = sum(self.__sync(
+                'childorders',
+                lambda pair=pair, **kw: api.get_childorders(pair, **kw), pair,
+                lambda pair=pair, **kw: api.get_childorders(pair, child_order_state='ACTIVE', **kw),
+                lambda order_id, pair=pair: api.get_childorders(pair, child_order_id=order_id))
+                for pair in self.pairs)
+        if parentorders:
+            res['parentorders'] = sum(self.__sync(
+                'parentorders',
+                lambda pair=pair, **kw: api.get_parentorders(pair, **kw), pair,
+                lambda pair=pair, **kw: api.get_parentorders(pair, parent_order_state='ACTIVE', **kw))
+                for pair in self.pairs)
+        if deposits:
+            res['deposits'] = self.__sync('deposits', api.get_deposits)
+        return res
+
+    # -------------------------------------------------------------------------
+    # query
+    # -------------------------------------------------------------------------
+    def __query(self, table, conditions, since, until, limit):
+        date_col = self.TABLES[table][3]
+        where = []
+        args = []
+        for col, value in conditions:
+            if value is not None:
+                where.append('%s = ?' % col)
+                args.append(value.value if hasattr(value, 'value') else value)
+        if since is not None:
+            where.append('%s >= ?' % date_col)
+            args.append(since)
+        if until is not None:
+            where.append('%s < ?' % date_col)
+            args.append(until)
+        sql = 'SELECT raw FROM %s' % table
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY id DESC'
+        if limit is not None:
+            sql += ' LIMIT %d' % limit
+        with self.__lock:
+            return [json.loads(raw) for (raw,) in self.__db.execute(sql, args)]
+
+    def childorders(self, *, product_code=None, state=None, side=None,
+                    acceptance_id=None, parent_order_id=None,
+                    since=None, until=None, limit=None):
+        '''Return child orders(since/until: ISO date string of child_order_date)'''
+        return self.__query('childorders',
+                            (('product_code', product_code), ('child_order_state', state),
+                             ('side', side), ('child_order_acceptance_id', acceptance_id),
+                             ('parent_order_id', parent_order_id)),
+                            since, until, limit)
+
+    def parentorders(self, *, product_code=None, state=None, side=None,
+                     acceptance_id=None, since=None, until=None, limit=None):
+        '''Return parent orders(since/until: ISO date string of parent_order_date)'''
+        return self.__query('parentorders',
+                            (('product_code', product_code), ('parent_order_state', state),
+                             ('side', side), ('parent_order_acceptance_id', acceptance_id)),
+                            since, until, limit)
+
+    def deposits(self, *, currency_code=None, status=None, since=None, until=None, limit=None):
+        '''Return deposits(since/until: ISO date string of event_date)'''
+        return self.__query('deposits', (('currency_code', currency_code), ('status', status)),
+                            since, until, limit)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+'''複数通貨ペア・複数アカウントの取引所アクセス管理モジュール'''
+import threading
+from .broker import BrokerAPI
+from .brokerfx import BrokerFXAPI
+from .common import RateBudget
+from .private import PrivateAPI
+from .public import PublicAPI
+from .session import SessionPool
+
+
+class BrokerHub(object):
+    '''
+    Broker hub for several pairs and accounts
+
+    All accounts share one SessionPool(warm sessions) and a rate
+    budget per IP. Each account(API key) has its own rate budget, shared
+    by all pairs of the account. broker(account, pair) returns a BrokerAPI
+    (BrokerFXAPI for FX_ pairs) handle bound to the pair.
+
+    pool_size is the number of pooled sessions(requests in parallel). A
+    request waits up to budget_timeout seconds for the rate budgets and
+    fails after that(None waits until available, up to period).
+    '''
+
+    def __init__(self, *,
+                 pool_size=10,
+                 ip_limit=500,
+                 key_limit=500,
+                 period=300,
+                 budget_timeout=5.0,
+                 get_timeout=None,
+                 post_timeout=None,
+                 endpoint=None,
+                 log=True,
+                 numeric=None,
+                 metrics=None):
+        self.session_pool = SessionPool(pool_size, metrics=metrics)
+
+        self.ip_budget = RateBudget(ip_limit, period)
+        self.__key_limit = key_limit
+        self.__period = period
+        self.__budget_timeout = budget_timeout
+        self.__get_timeout = get_timeout
+        self.__post_timeout = post_timeout
+        self.__endpoint = endpoint
+        self.__log = log
+        self.__numeric = numeric
+        self.__metrics = metrics
+
+        self.pub_api = PublicAPI(timeout=get_timeout, endpoint=endpoint,
+                                 session_pool=self.session_pool,
+                                 rate_limits=(self.ip_budget,),
+                                 budget_timeout=budget_timeout)
+        self.__accounts = {}    # name -> (PrivateAPI, RateBudget)
+        self.__brokers = {}     # (name, pair) -> BrokerAPI
+        self.__lock = threading.Lock()
+
+    def add_account(self, name, key, secret):
+        '''Register an account(API key)'''
+        with self.__lock:
+            key_budget = RateBudget(self.__key_limit, self.__period)
+            prv_api = PrivateAPI(key, secret,
+                                 get_timeout=self.__get_timeout,
+                                 post_timeout=self.__post_timeout,
+                                 endpoint=self.__endpoint,
+                                 metrics=self.__metrics,
+                                 session_pool=self.session_pool,
+                                 rate_limits=(self.ip_budget, key_budget),
+                                 budget_timeout=self.__budget_timeout)
+            self.__accounts[name] = (prv_api, key_budget)
+            return prv_api
+
+    def broker(self, name, pair):
+        '''Return broker handle of the account and pair'''
+        pair = pair.value if hasattr(pair, 'value') else pair
+        with self.__lock:
+            broker = self.__brokers.get((name, pair))
+            if broker is None:
+                prv_api, _ = self.__accounts[name]
+                broker_class = BrokerFXAPI if pair.startswith('FX_') else BrokerAPI
+                broker = broker_class(pair, None, None, self.__log,
+                                      get_timeout=self.__get_timeout,
+                                      post_timeout=self.__post_timeout,
+                                      numeric=self.__numeric,
+                                      metrics=self.__metrics,
+                                      prv_api=prv_api,
+                                      pub_api=self.pub_api)
+                self.__brokers[(name, pair)] = broker
+            return broker
+
+    def brokers(self):
+        '''Return dict of (account, pair) -> broker'''
+        with self.__lock:
+            return dict(self.__brokers)
+
+    def remaining(self, name=None):
+        '''Return remaining requests(min of IP and the account budget)'''
+        remaining = self.ip_budget.remaining()
+        if name is not None:
+            remaining = min(remaining, self.__accounts[name][1].remaining())
+        return remaining
+
+    def keep_warm(self, count=None, *, interval=None):
+        '''
+        Open count sessions and keep them warm in background(see SessionPool)
+        Pings are counted on the IP budget.
+        '''
+        endpoint = self.__endpoint if self.__endpoint is not None else PrivateAPI.API_ENDPOINT
+        self.session_pool.start_keepalive(endpoint + '/v1/gethealth',
+                                          count=count, interval=interval,
+                                          rate_limits=(self.ip_budget,))
+
+    def close(self):
+        '''Close the brokers(worker threads of BrokerFXAPI) and the session pool'''
+        for broker in self.brokers().values():
+            if hasattr(broker, 'close'):
+                broker.close()
+        self.session_pool.close()
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+'''注文ラダー管理モジュール(差分による発注・取消)'''
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from .common import NumericMode
+
+
+class LadderManager(object):
+    '''
+    Order ladder manager on BrokerAPI
+
+    requote(desired) compares the desired orders(list of (side, price, size))
+    with the live orders placed by this manager and sends only the difference:
+    live orders with the same side/price/remaining size are kept(queue
+    position retained), the others are canceled and missing ones are placed.
+    Cancels are sent first(concurrently), then new orders nearest to the
+    touch first.
+
+    With fill_detector(FillDetector), placed orders are registered to it and
+    the remaining size of live orders follows the executions stream, so
+    partially filled orders are requoted and fully filled ones are forgotten.
+    Without it, each requote reconciles the live orders with one
+    get_childorders(ACTIVE) listing: orders not listed are forgotten(filled
+    or canceled) unless placed within grace seconds(not listed yet), and
+    the remaining size is the outstanding size.
+
+    Sizes are compared in the units of broker.num(tolerance applies to
+    FLOAT only). numeric of fill_detector must be None(raw float) or the
+    same as the broker.
+    '''
+
+    class RequoteResult(object):
+        '''result of requote'''
+        __slots__ = ('kept', 'placed', 'canceled', 'failed', 'requests', 'elapsed')
+
+        def __init__(self):
+            self.kept = []          # order_id
+            self.placed = []        # (order_id, side, price, size)
+            self.canceled = []      # order_id
+            self.failed = []        # ('place' or 'cancel', side, price, size)
+            self.requests = 0
+            self.elapsed = 0.0
+
+    class _Live(object):
+        __slots__ = ('side', 'price', 'size', 'remaining', 'placed_at')
+
+        def __init__(self, side, price, size):
+            self.side = side
+            self.price = price
+            self.size = size
+            self.remaining = size       # by the listing(without fill_detector)
+            self.placed_at = time.monotonic()
+
+    def __init__(self, broker, *, fill_detector=None, max_workers=4, tolerance=1e-9, grace=2.0):
+        self.broker = broker
+        self.grace = grace
+        self.__detector = fill_detector
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.__tolerance = tolerance
+        self.__live = {}            # order_id -> _Live
+        self.__lock = threading.Lock()
+        self.__stats = {'requotes': 0, 'requests': 0, 'kept': 0, 'placed': 0,
+                        'canceled': 0, 'failed': 0, 'desired': 0, 'elapsed': 0.0}
+
+    @staticmethod
+    def __side(side):
+        return side.value if hasattr(side, 'value') else side
+
+    def __remaining(self, order_id, live):
+        '''Return remaining size(None if no longer live)'''
+        detector = self.__detector
+        if detector is None:
+            return live.remaining
+        if order_id not in detector:
+            return None     # fully filled
+        executed, _ = detector.executed(order_id)
+        if not executed:
+            return live.size
+        if type(executed) is type(live.size):   # pylint: disable-msg=C0123
+            return live.size - executed
+        num = self.broker.num   # raw float of the detector(rounded to satoshi)
+        return num.size(round(num.size2float(live.size) - executed, 8))
+
+    def live_orders(self):
+        '''Return dict of order_id -> (side, price, remaining size)'''
+        with self.__lock:
+            items = list(self.__live.items())
+        orders = {}
+        for order_id, live in items:
+            remaining = self.__remaining(order_id, live)
+            if remaining is not None:
+                orders[order_id] = (live.side, live.price, remaining)
+        return orders
+
+    def __sync_live(self):
+        '''Reconcile live orders with the ACTIVE child orders(without fill_detector)'''
+        try:
+            res_infos = self.broker.prv_api.get_childorders(self.broker.trade_pair,
+                                                            child_order_state='ACTIVE')
+        except Exception:   # pylint: disable-msg=W0703
+            return False    # keep the live orders as they are
+        size = self.broker.num.size
+        outstanding = {info['child_order_acceptance_id']: size(info['outstanding_size'])
+                       for info in res_infos}
+        now = time.monotonic()
+        with self.__lock:
+            for order_id, live in list(self.__live.items()):
+                if order_id in outstanding:
+                    live.remaining = outstanding[order_id]
+                elif now - live.placed_at > self.grace:
+                    del self.__live[order_id]
+        return True
+
+    def __same_size(self, size, remaining):
+        '''Compare sizes in the units of broker.num'''
+        if self.broker.num.mode == NumericMode.FLOAT:
+            return abs(size - remaining) <= self.__tolerance
+        return size == remaining
+
+    def __diff(self, desired):
+        '''Return (kept, cancels, places)'''
+        wanted = {}
+        for side, price, size in desired:
+            wanted.setdefault((self.__side(side), price), []).append(size)
+        kept = []
+        cancels = []
+        with self.__lock:
+            for order_id, live in list(self.__live.items()):
+                remaining = self.__remaining(order_id, live)
+                if remaining is None:
+                    del self.__live[order_id]
+                    continue
+                sizes = wanted.get((live.side, live.price))
+                match = None
+                if sizes:
+                    for index, size in enumerate(sizes):
+                        if self.__same_size(size, remaining):
+                            match = index
+                            break
+                if match is None:
+                    cancels.append(order_id)
+                else:
+                    del sizes[match]
+                    kept.append(order_id)
+        places = [(side, price, size) for (side, price), sizes in wanted.items() for size in sizes]
+        # nearest to the touch first
+        places.sort(key=lambda order: -order[1] if order[0] == 'BUY' else order[1])
+        return kept, cancels, places
+
+    def __cancel(self, order_id):
+        result = self.broker.order_cancel(order_id)
+        if result:
+            with self.__lock:
+                self.__live.pop(order_id, None)
+            if self.__detector is not None:
+                self.__detector.remove(order_id)
+        return result
+
+    def __place(self, side, price, size):
+        if side == 'BUY':
+            result, order_id = self.broker.order_buy_limit(price, size)
+        else:
+            result, order_id = self.broker.order_sell_limit(price, size)
+        if result:
+            if self.__detector is not None:
+                self.__detector.add(order_id, side, size)
+            with self.__lock:
+                self.__live[order_id] = self._Live(side, price, size)
+        return order_id if result else None
+
+    def requote(self, desired):
+        '''Reconcile live orders with desired list of (side, price, size)'''
+        start = time.perf_counter()
+        res = self.RequoteResult()
+        listed = 0
+        if self.__detector is None and self.__live:
+            self.__sync_live()
+            listed = 1
+        kept, cancels, places = self.__diff(desired)
+        res.kept = kept
+
+        futures = [(order_id, self.__executor.submit(self.__cancel, order_id)) for order_id in cancels]
+        for order_id, future in futures:
+            if future.result():
+                res.canceled.append(order_id)
+            else:
+                with self.__lock:
+                    live = self.__live.get(order_id)
+                if live is not None:
+                    res.failed.append(('cancel', live.side, live.price, live.size))
+        futures = [(order, self.__executor.submit(self.__place, *order)) for order in places]
+        for order, future in futures:
+            order_id = future.result()
+            if order_id is None:
+                res.failed.append(('place',) + order)
+            else:
+                res.placed.append((order_id,) + order)
+
+        res.requests = listed + len(cancels) + len(places)
+        res.elapsed = time.perf_counter() - start
+        with self.__lock:
+            stats = self.__stats
+            stats['requotes'] += 1
+            stats['requests'] += res.requests
+            stats['kept'] += len(res.kept)
+            stats['placed'] += len(res.placed)
+            stats['canceled'] += len(res.canceled)
+            stats['failed'] += len(res.failed)
+            stats['desired'] += len(desired)
+            stats['elapsed'] += res.elapsed
+        return res
+
+    def cancel_all(self):
+        '''Cancel all live orders placed by this manager'''
+        return self.requote([])
+
+    def stats(self):
+        '''
+        Return statistics:
+            requotes, requests, kept, placed, canceled, failed, elapsed(sum)
+            requests_per_requote, requotes_per_sec, queue_retained(kept / desired)
+        '''
+        with self.__lock:
+            stats = dict(self.__stats)
+        requotes = stats['requotes']
+        stats['requests_per_requote'] = stats['requests'] / requotes if requotes else 0.0
+        stats['requotes_per_sec'] = requotes / stats['elapsed'] if stats['elapsed'] > 0 else 0.0
+        stats['queue_retained'] = stats['kept'] / stats['desired'] if stats['desired'] else 0.0
+        return stats
+
+    def close(self):
+        '''Shutdown worker threads(live orders are left as they are)'''
+        self.__executor.shutdown()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+'''証拠金維持率の推定モジュール(realtime mark-to-market)'''
+import threading
+import time
+
+
+class MarginEstimator(object):
+    '''
+    Margin keep rate estimator on BrokerFXAPI
+
+    Loads collateral and positions once(anchor) and updates unrealized PnL
+    and keep rate from the mark price of every RealtimeAPI ticker/execution
+    of the pair, so margin checks cost no API request. Positions are
+    aggregated to net size and cost, so an update is O(1).
+
+    The difference between the REST PnL and the modeled PnL at the anchor
+    (sfd, rounding etc.) is kept as an offset. Re-anchor periodically by
+    start()(background thread), or by reanchor() after own fills.
+
+    *** The description of callback ***
+    on_update(estimator, estimate) is called after every mark price update.
+    on_message_ticker/on_message_executions can be passed to RealtimeAPI as is.
+    '''
+
+    class Estimate(object):
+        '''estimated margin state(float)'''
+        __slots__ = ('mark_price', 'margin_deposit', 'required_margin',
+                     'profit_loss', 'keep_rate', 'net_size', 'anchor_age')
+
+        def __init__(self, mark_price, margin_deposit, required_margin,
+                     profit_loss, keep_rate, net_size, anchor_age):
+            self.mark_price = mark_price            # 評価価格
+            self.margin_deposit = margin_deposit    # 預入証拠金(JPY)
+            self.required_margin = required_margin  # 必要証拠金(JPY)
+            self.profit_loss = profit_loss          # 評価損益(JPY)
+            self.keep_rate = keep_rate              # 証拠金維持率(建玉なしはNone)
+            self.net_size = net_size                # 建玉数量(売りは-)
+            self.anchor_age = anchor_age            # anchorからの経過秒
+
+    def __init__(self, broker, *, reanchor_interval=60, on_update=None):
+        self.broker = broker
+        self.pair = broker.trade_pair
+        self.reanchor_interval = reanchor_interval
+        self.last_error = None      # keep rate(REST) - keep rate(estimated) at the last anchor
+        self.__cb_on_update = on_update
+        self.__lock = threading.Lock()
+        self.__anchored = None
+        self.__deposit = 0.0
+        self.__required = 0.0
+        self.__net_size = 0.0
+        self.__cost = 0.0           # sum of signed size * price
+        self.__offset = 0.0
+        self.__mark = None
+        self.__thread = None
+        self.__stop = threading.Event()
+
+    def reanchor(self):
+        '''Load collateral and positions by REST(raise exception on failure)'''
+        snapshot = self.broker.get_account_snapshot(0)
+        margin = snapshot.margin
+        net_size = 0.0
+        cost = 0.0
+        for position in snapshot.positions.get(self.pair, []):
+            size = float(position.amount)
+            if position.side == self.broker.OrderSide.SELL:
+                size = -size
+            net_size += size
+            cost += size * float(position.price)
+        rest_pnl = float(margin.profit_loss)
+        with self.__lock:
+            if self.__anchored is not None and margin.margin_rate is not None:
+                estimate = self.__estimate(time.monotonic())
+                if estimate.keep_rate is not None:
+                    self.last_error = float(margin.margin_rate) - estimate.keep_rate
+            self.__deposit = float(margin.margin_deposit)
+            self.__required = float(margin.required_margin)
+            self.__net_size = net_size
+            self.__cost = cost
+            mark = self.__mark
+            self.__offset = rest_pnl - (net_size * mark - cost) if mark is not None else 0.0
+            if mark is None and net_size != 0:
+                # no tick yet: mark price implied by the REST PnL
+                self.__mark = (rest_pnl + cost) / net_size
+            self.__anchored = time.monotonic()
+
+    def __estimate(self, now):
+        mark = self.__mark
+        pnl = self.__offset
+        if mark is not None:
+            pnl += self.__net_size * mark - self.__cost
+        keep_rate = None
+        if self.__required > 0:
+            keep_rate = (self.__deposit + pnl) / self.__required
+        return self.Estimate(mark, self.__deposit, self.__required, pnl, keep_rate,
+                             self.__net_size, now - self.__anchored)
+
+    def estimate(self):
+        '''Return current Estimate(None before the first anchor)'''
+        with self.__lock:
+            if self.__anchored is None:
+                return None
+            return self.__estimate(time.monotonic())
+
+    def keep_rate(self):
+        '''Return estimated keep rate(None if no position or not anchored)'''
+        estimate = self.estimate()
+        return None if estimate is None else estimate.keep_rate
+
+    def update(self, price):
+        '''Update mark price'''
+        with self.__lock:
+            self.__mark = float(price)
+            if self.__anchored is None or self.__cb_on_update is None:
+                return
+            estimate = self.__estimate(time.monotonic())
+        try:
+            self.__cb_on_update(self, estimate)
+        except:     # pylint: disable-msg=W0702
+            import traceback
+            traceback.print_exc()
+
+    def on_message_ticker(self, _, pair, data):
+        '''callback for RealtimeAPI(on_message_ticker)'''
+        if pair == self.pair:
+            self.update(data.ltp)
+
+    def on_message_executions(self, _, pair, data_list):
+        '''callback for RealtimeAPI(on_message_executions)'''
+        if pair == self.pair and data_list:
+            self.update(data_list[-1].price)
+
+    def start(self):
+        '''Anchor now and re-anchor every reanchor_interval seconds in background'''
+        self.reanchor()
+        self.__stop.clear()
+
+        def _run():
+            while not self.__stop.wait(self.reanchor_interval):
+                try:
+                    self.reanchor()
+                except:     # pylint: disable-msg=W0702
+                    import traceback
+                    traceback.print_exc()   # retry at the next interval
+
+        self.__thread = threading.Thread(target=_run, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        '''Stop background re-anchor'''
+        if self.__thread is None:
+            return
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+'''計測モジュール(レイテンシ・結果の集計とPrometheus text形式の出力)'''
+import bisect
+import threading
+import time
+
+
+class Histogram(object):
+    '''latency histogram(cumulative buckets as Prometheus)'''
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        '''Add a value'''
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        '''Estimate quantile(upper bound of the bucket)'''
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        total = 0
+        for index, count in enumerate(self.counts):
+            total += count
+            if total >= rank:
+                return self.bounds[index] if index < len(self.bounds) else float('inf')
+        return float('inf')
+
+
+class Metrics(object):
+    '''
+    Metrics registry
+
+    Pass to PrivateAPI/BrokerAPI(metrics=...) to record:
+        sabitflyer_request_seconds{endpoint, phase}     sign/send/first_byte/parse/total
+        sabitflyer_requests_total{endpoint, outcome}    ok or error class
+        sabitflyer_retries_total{endpoint, reason}      reason 'landed': found by lookup, not resent
+        sabitflyer_reconnects_total{endpoint}
+        sabitflyer_session_acquire_total{state}         new/warm/cold
+        sabitflyer_broker_call_seconds{method}
+        sabitflyer_broker_calls_total{method, result}
+    Nothing is recorded(and no cost is paid) when metrics is None.
+    '''
+
+    BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+               0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, *, prefix='sabitflyer', buckets=BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self.__histograms = {}      # (name, labels) -> Histogram
+        self.__counters = {}        # (name, labels) -> value
+        self.__lock = threading.Lock()
+        self.__exporter = None
+
+    def observe(self, name, labels, value):
+        '''Add a value to histogram(labels is tuple of (key, value))'''
+        key = (name, labels)
+        with self.__lock:
+            hist = self.__histograms.get(key)
+            if hist is None:
+                hist = self.__histograms[key] = Histogram(self.buckets)
+            hist.observe(value)
+
+    def inc(self, name, labels, value=1):
+        '''Increment counter(labels is tuple of (key, value))'''
+        key = (name, labels)
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def reset(self):
+        '''Clear all values'''
+        with self.__lock:
+            self.__histograms.clear()
+            self.__counters.clear()
+
+    def snapshot(self):
+        '''
+        Return copy of values as dict:
+            {'counters': {(name, labels): value},
+             'histograms': {(name, labels): {'count', 'sum', 'p50', 'p99', 'buckets'}}}
+        '''
+        with self.__lock:
+            return {
+                'counters': dict(self.__counters),
+                'histograms': {
+                    key: {'count': hist.count, 'sum': hist.sum,
+                          'p50': hist.quantile(0.5), 'p99': hist.quantile(0.99),
+                          'buckets': list(zip(self.buckets + (float('inf'),), hist.counts))}
+                    for key, hist in self.__histograms.items()
+                }
+            }
+
+    def to_prometheus(self):
+        '''Return values as Prometheus text exposition format'''
+        lines = []
+        with self.__lock:
+            counters = sorted(self.__counters.items())
+            histograms = sorted(self.__histograms.items(), key=lambda item: item[0])
+            declared = set()
+            for (name, labels), value in counters:
+                full = '%s_%s' % (self.prefix, name)
+                if full not in declared:
+                    declared.add(full)
+                    lines.append('# TYPE %s counter' % full)
+                lines.append('%s%s %s' % (full, _labels(labels), value))
+            for (name, labels), hist in histograms:
+                full = '%s_%s' % (self.prefix, name)
+                if full not in declared:
+                    declared.add(full)
+                    lines.append('# TYPE %s histogram' % full)
+                total = 0
+                for bound, count in zip(self.buckets + (float('inf'),), hist.counts):
+                    total += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('%s_bucket%s %d' % (full, _labels(labels + (('le', le),)), total))
+                lines.append('%s_sum%s %r' % (full, _labels(labels), hist.sum))
+                lines.append('%s_count%s %d' % (full, _labels(labels), hist.count))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='0.0.0.0'):
+        '''Start HTTP exporter(/metrics) in background'''
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):   # pylint: disable-msg=C0103
+                '''GET Method'''
+                data = metrics.to_prometheus().encode('utf8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *_):      # pylint: disable-msg=W0221
+                pass
+
+        self.__exporter = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=self.__exporter.serve_forever, daemon=True).start()
+        return self.__exporter
+
+    def wrap_call(self, func, method):
+        '''Wrap a BrokerAPI method(result is bool or tuple starting with bool)'''
+        labels = (('method', method),)
+        labels_ok = labels + (('result', 'ok'),)
+        labels_fail = labels + (('result', 'fail'),)
+
+        def _wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            rtn = func(*args, **kwargs)
+            self.observe('broker_call_seconds', labels, time.perf_counter() - start)
+            result = rtn[0] if isinstance(rtn, tuple) else rtn
+            self.inc('broker_calls_total', labels_ok if result else labels_fail)
+            return rtn
+        _wrapper.__name__ = getattr(func, '__name__', method)
+        _wrapper.__doc__ = getattr(func, '__doc__', None)
+        return _wrapper
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for key, value in labels)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+'''取引所状態監視モジュール'''
+import threading
+import time
+from .broker import BrokerAPI
+from .public import PublicAPI
+
+
+class HealthMonitor(object):
+    '''
+    Background exchange health monitor
+
+    Polls getboardstate in a background thread and keeps the latest
+    HealthStatus/StateStatus, so the status can be read without any REST call.
+    acquire() is used before order submission: it waits(or fails) while the
+    venue is paused and keeps the minimum order interval while it is busy.
+    A failed poll keeps the last known status(result is False and updated
+    is the time of the last success) until max_failures consecutive
+    failures, then the status is regarded as STOP/CLOSED.
+
+    *** The description of callback ***
+    on_change(monitor, health, state) is called when the status changes.
+    '''
+
+    PAUSE_HEALTH = (BrokerAPI.HealthStatus.NO_ORDER,
+                    BrokerAPI.HealthStatus.STOP)
+    PAUSE_STATE = (BrokerAPI.StateStatus.CLOSED,
+                   BrokerAPI.StateStatus.STARTING,
+                   BrokerAPI.StateStatus.MATURED)
+    THROTTLE = {
+        BrokerAPI.HealthStatus.VERY_BUSY: 0.5,
+        BrokerAPI.HealthStatus.SUPER_BUSY: 2.0
+    }
+
+    def __init__(self, pair, *,
+                 interval=5,
+                 timeout=None,
+                 max_failures=3,
+                 pause_health=PAUSE_HEALTH,
+                 pause_state=PAUSE_STATE,
+                 throttle=None,
+                 on_change=None,
+                 pub_api=None,
+                 endpoint=None):
+        self.__pair = pair.value if hasattr(pair, 'value') else pair
+        self.__interval = interval
+        self.__max_failures = max_failures
+        self.__pub_api = pub_api if pub_api is not None else PublicAPI(timeout=timeout, endpoint=endpoint)
+        self.__pause_health = pause_health
+        self.__pause_state = pause_state
+        self.__throttle = self.THROTTLE if throttle is None else throttle
+        self.__cb_on_change = on_change
+
+        # cached status
+        self.result = False
+        self.health = BrokerAPI.HealthStatus.STOP
+        self.state = BrokerAPI.StateStatus.CLOSED
+        self.updated = None
+        self.failures = 0       # consecutive poll failures
+
+        self.__cond = threading.Condition()
+        self.__last_order = 0.0
+        self.__thread = None
+        self.__stop_event = threading.Event()
+
+    def start(self):
+        '''To start monitoring(first status is fetched synchronously)'''
+        if self.__thread is not None:
+            return
+        self.poll()
+        self.__stop_event.clear()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        '''To stop monitoring'''
+        self.__stop_event.set()
+        if self.__thread is not None:
+            self.__thread.join()
+        self.__thread = None
+
+    def __run(self):
+        while not self.__stop_event.wait(self.__interval):
+            self.poll()
+
+    def poll(self):
+        '''Fetch status from getboardstate and update the cache'''
+        try:
+            res_dct = self.__pub_api.get_boardstate(self.__pair)
+            health = BrokerAPI.cvt_status_health(res_dct['health'])
+            state = BrokerAPI.cvt_status_state(res_dct['state'])
+            result = True
+        except:     # pylint: disable-msg=W0702
+            self.failures += 1
+            if self.failures < self.__max_failures:
+                self.result = False     # keep the last known status
+                return
+            health = BrokerAPI.HealthStatus.STOP
+            state = BrokerAPI.StateStatus.CLOSED
+            result = False
+        else:
+            self.failures = 0
+        self.update(health, state, result)
+
+    def update(self, health, state, result=True):
+        '''Update the cache(also usable from other status sources)'''
+        with self.__cond:
+            changed = (health != self.health or state != self.state)
+            self.result = result
+            self.health = health
+            self.state = state
+            self.updated = time.time()
+            self.__cond.notify_all()
+        if changed:
+            self.__callback(self.__cb_on_change, health, state)
+
+    def status(self):
+        '''Return cached (result, health, state)'''
+        return self.result, self.health, self.state
+
+    def is_orderable(self):
+        '''Return False while order submission is paused'''
+        return (self.health not in self.__pause_health
+                and self.state not in self.__pause_state)
+
+    def acquire(self, timeout=0):
+        '''
+        Wait for order submission.
+        Return False if the venue is still paused after timeout(seconds).
+        '''
+        with self.__cond:
+            if not self.__cond.wait_for(self.is_orderable, timeout):
+                return False
+            # reserve the next order slot
+            now = time.time()
+            self.__last_order = max(now, self.__last_order + self.__throttle.get(self.health, 0))
+            wait = self.__last_order - now
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def __callback(self, callback, *args):
+        if callback:
+            try:
+                callback(self, *args)
+            except:     # pylint: disable-msg=W0702
+                import traceback
+                traceback.print_exc()
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+'''板情報の分析モジュール(配列による板の保持と流動性指標)'''
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from operator import mul
+
+
+class OrderBook(object):
+    '''
+    Array-backed order book of a pair with liquidity analytics
+
+    Each side is kept as sorted columns(array of float): key(price for
+    asks, -price for bids, so the best level is at index 0) and size.
+    A board update costs a binary search and an insert/delete per level.
+    Cumulative size and notional are rebuilt lazily from the first
+    changed level and only as deep as a query needs(in C by accumulate),
+    so imbalance, depth, VWAP-to-size and impact queries near the touch
+    are a binary search on them, whatever the depth of the book.
+
+    Values are float. on_message_board_snapshot/on_message_board can be
+    passed to RealtimeAPI as is, load() takes get_depth response.
+    '''
+
+    class Impact(object):
+        '''expected result of a market order'''
+        __slots__ = ('side', 'size', 'filled', 'vwap', 'worst_price', 'slippage', 'levels')
+
+        def __init__(self, side, size, filled, vwap, worst_price, slippage, levels):
+            self.side = side                # 'BUY' or 'SELL'
+            self.size = size                # 注文数量
+            self.filled = filled            # 板で約定可能な数量(板不足時はsize未満)
+            self.vwap = vwap                # 平均約定価格(板なしはNone)
+            self.worst_price = worst_price  # 最後に約定する価格
+            self.slippage = slippage        # best価格からの不利な乖離率(vwap / best - 1, 売りは符号反転)
+            self.levels = levels            # 約定する価格の数
+
+    class _Side(object):
+        __slots__ = ('sign', 'keys', 'sizes', 'cum_size', 'cum_value', 'valid')
+
+        def __init__(self, sign):
+            self.sign = sign        # +1: asks, -1: bids
+            self.keys = array('d')
+            self.sizes = array('d')
+            self.cum_size = array('d')
+            self.cum_value = array('d')
+            self.valid = 0          # number of levels whose cumulative values are valid
+
+    CUMULATE_LEVELS = 16    # levels cumulated at least by estimate()
+
+    def __init__(self, pair=None):
+        self.pair = pair
+        self.mid_price = None
+        self.clear()
+
+    def clear(self):
+        '''Remove all levels'''
+        self.__bids = self._Side(-1)
+        self.__asks = self._Side(1)
+
+    # -------------------------------------------------------------------------
+    # update
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def __set(side, price, size):
+        key = side.sign * price
+        keys = side.keys
+        index = bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            if size > 0:
+                side.sizes[index] = size
+            else:
+                del keys[index]
+                del side.sizes[index]
+        elif size > 0:
+            keys.insert(index, key)
+            side.sizes.insert(index, size)
+        else:
+            return
+        if index < side.valid:
+            side.valid = index
+
+    def apply(self, bids, asks, *, snapshot=False, mid_price=None):
+        '''Apply levels(list of {'price', 'size'}, size 0 removes the level)'''
+        if snapshot:
+            self.clear()
+        bid_side = self.__bids
+        ask_side = self.__asks
+        for levels, side, other in ((bids, bid_side, ask_side), (asks, ask_side, bid_side)):
+            for level in levels:
+                price = float(level['price'])
+                size = float(level['size'])
+                self.__set(side, price, size)
+                # a level crossing the new one is stale(left by a missed delta)
+                key = side.sign * price
+                while size > 0 and other.keys and -other.keys[0] >= key:
+                    self.__set(other, other.sign * other.keys[0], 0)
+        if mid_price is not None:
+            self.mid_price = float(mid_price)
+        elif bid_side.keys and ask_side.keys:
+            self.mid_price = (ask_side.keys[0] - bid_side.keys[0]) / 2
+        return self
+
+    def load(self, res_depth):
+        '''Replace levels by get_depth response(dict)'''
+        return self.apply(res_depth['bids'], res_depth['asks'], snapshot=True,
+                          mid_price=res_depth.get('mid_price'))
+
+    def on_message_board_snapshot(self, _, pair, data):
+        '''callback for RealtimeAPI(on_message_board_snapshot)'''
+        if self.pair is None or pair == self.pair:
+            self.apply(data.bids, data.asks, snapshot=True, mid_price=data.mid_price)
+
+    def on_message_board(self, _, pair, data):
+        '''callback for RealtimeAPI(on_message_board)'''
+        if self.pair is None or pair == self.pair:
+            self.apply(data.bids, data.asks, mid_price=data.mid_price)
+
+    @staticmethod
+    def __cumulate(side, count):
+        '''Extend cumulative columns to the first count levels(from the first changed level)'''
+        start = side.valid
+        count = min(count, len(side.sizes))
+        if start >= count:
+            return count
+        size_base = side.cum_size[start - 1] if start > 0 else 0.0
+        value_base = side.cum_value[start - 1] if start > 0 else 0.0
+        sizes = side.sizes[start:count]
+        del side.cum_size[start:]
+        del side.cum_value[start:]
+        side.cum_size.extend(accumulate(sizes, initial=size_base))
+        side.cum_value.extend(accumulate(map(mul, side.keys[start:count], sizes), initial=value_base))
+        del side.cum_size[start]        # drop the initial value
+        del side.cum_value[start]
+        side.valid = count
+        return count
+
+    def __side(self, side):
+        '''Return the side taken by a market order of side(BUY takes asks)'''
+        if hasattr(side, 'value'):
+            side = side.value
+        return self.__asks if side == 'BUY' else self.__bids
+
+    # -------------------------------------------------------------------------
+    # analytics
+    # -------------------------------------------------------------------------
+    def levels(self, side, count=None):
+        '''Return list of (price, size) of 'bids' or 'asks' from the best'''
+        book = self.__bids if side == 'bids' else self.__asks
+        count = len(book.keys) if count is None else count
+        return [(book.sign * key, size) for key, size in zip(book.keys[:count], book.sizes[:count])]
+
+    @property
+    def best_bid(self):
+        '''[property] best bid price(None if empty)'''
+        return -self.__bids.keys[0] if self.__bids.keys else None
+
+    @property
+    def best_ask(self):
+        '''[property] best ask price(None if empty)'''
+        return self.__asks.keys[0] if self.__asks.keys else None
+
+    @property
+    def spread(self):
+        '''[property] best ask - best bid(None if a side is empty)'''
+        if not self.__bids.keys or not self.__asks.keys:
+            return None
+        return self.__asks.keys[0] + self.__bids.keys[0]
+
+    def microprice(self):
+        '''Return best prices weighted by the opposite size(None if a side is empty)'''
+        bids = self.__bids
+        asks = self.__asks
+        if not bids.keys or not asks.keys:
+            return None
+        bid_size = bids.sizes[0]
+        ask_size = asks.sizes[0]
+        return (-bids.keys[0] * ask_size + asks.keys[0] * bid_size) / (bid_size + ask_size)
+
+    def depth(self, side, *, levels=None, distance=None):
+        '''
+        Return cumulative size of 'bids' or 'asks' within levels from the best
+        or within distance(price) from the best(all levels if neither)
+        '''
+        book = self.__bids if side == 'bids' else self.__asks
+        count = len(book.keys)
+        if count == 0:
+            return 0.0
+        if levels is not None:
+            count = min(count, levels)
+        if distance is not None:
+            count = min(count, bisect_right(book.keys, book.keys[0] + distance))
+        count = self.__cumulate(book, count)
+        return book.cum_size[count - 1] if count > 0 else 0.0
+
+    def imbalance(self, *, levels=1, distance=None):
+        '''Return (bid depth - ask depth) / (bid depth + ask depth) in -1..1(0 if empty)'''
+        bid = self.depth('bids', levels=levels, distance=distance)
+        ask = self.depth('asks', levels=levels, distance=distance)
+        total = bid + ask
+        return (bid - ask) / total if total > 0 else 0.0
+
+    def estimate(self, side, size):
+        '''Return Impact of a market order of side and size'''
+        if hasattr(side, 'value'):
+            side = side.value
+        book = self.__side(side)
+        size = float(size)
+        count = len(book.keys)
+        if count == 0 or size <= 0:
+            return self.Impact(side, size, 0.0, None, None, None, 0)
+        upto = self.__cumulate(book, max(book.valid, self.CUMULATE_LEVELS))
+        while upto < count and book.cum_size[upto - 1] < size:
+            upto = self.__cumulate(book, upto * 2)
+        index = bisect_left(book.cum_size, size, 0, upto)
+        if index >= count:
+            index = count - 1
+            filled = book.cum_size[index]
+            value = book.cum_value[index]
+        else:
+            filled = size
+            prev_size = book.cum_size[index - 1] if index > 0 else 0.0
+            prev_value = book.cum_value[index - 1] if index > 0 else 0.0
+            value = prev_value + book.keys[index] * (size - prev_size)
+        vwap = book.sign * value / filled
+        best = book.sign * book.keys[0]
+        slippage = (vwap / best - 1) * book.sign
+        return self.Impact(side, size, filled, vwap, book.sign * book.keys[index],
+                           slippage, index + 1)
+
+    def vwap(self, side, size):
+        '''Return VWAP of a market order of side and size(None if empty)'''
+        return self.estimate(side, size).vwap
+
+    def impact_curve(self, side, sizes):
+        '''Return list of Impact for each size'''
+        return [self.estimate(side, size) for size in sizes]
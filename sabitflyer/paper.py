@@ -0,0 +1,772 @@
+# -*- coding: utf-8 -*-
+'''ペーパートレードモジュール'''
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from enum import Enum
+from .broker import BrokerAPI
+from .brokerfx import BrokerFXAPI
+from .private import PrivateAPI
+
+
+class QueueModel(Enum):
+    '''enumeration of queue position model(limit order at the same price)'''
+    TOUCH = 'TOUCH'         # 同値の約定で約定(楽観的)
+    BOARD = 'BOARD'         # 発注時の板数量が同値で約定した後に約定
+    THROUGH = 'THROUGH'     # 指値を超える約定でのみ約定(悲観的)
+
+
+class PaperPrivateAPI(PrivateAPI):
+    '''
+    Paper trading private API class
+
+    Simulates the exchange in-process with the same methods and response
+    format as PrivateAPI. Orders are filled by matching against the board
+    and executions given from RealtimeAPI callbacks(numeric=None) or
+    recorded data. Orders and parent orders expire at expire_date
+    (minute_to_expire, 30 days by default) by the simulation time.
+
+    *** The description of callback ***
+    on_message_board, on_message_board_snapshot and on_message_executions
+    can be passed to RealtimeAPI as is.
+    on_fill(api, order, price, size) is called for every fill.
+    '''
+
+    class _Order(object):
+        __slots__ = ('id', 'aid', 'oid', 'pair', 'side', 'type', 'price', 'size',
+                     'executed', 'value', 'commission', 'state', 'active_at', 'cancel_at',
+                     'queue_ahead', 'date', 'expire', 'parent', 'leg')
+
+    class _Parent(object):
+        __slots__ = ('id', 'aid', 'oid', 'pair', 'method', 'parameters', 'stages', 'stage',
+                     'state', 'date', 'expire', 'minute_to_expire', 'active_at')
+
+    class _Leg(object):
+        __slots__ = ('prms', 'state', 'child', 'extreme')
+
+        def __init__(self, prms):
+            self.prms = prms
+            self.state = 'WAIT'     # WAIT, ARMED, PLACED, DONE, CANCELED
+            self.child = None
+            self.extreme = None     # TRAIL用の最高値/最安値
+
+    def __init__(self, *,
+                 collateral=1000000,
+                 balances=None,
+                 leverage=4,
+                 latency=0.0,
+                 queue_model=QueueModel.BOARD,
+                 commission_rate=0.0,
+                 clock=time.time,
+                 on_fill=None):
+        super().__init__('', '')
+        self.__collateral = float(collateral)
+        self.__balances = dict(balances) if balances is not None else {'JPY': float(collateral)}
+        self.__leverage = leverage
+        self.__latency = latency
+        self.__queue_model = queue_model
+        self.__commission_rate = commission_rate
+        self.__clock = clock
+        self.__now = None
+        self.__cb_on_fill = on_fill
+
+        self.__lock = threading.RLock()
+        self.__seq = 0
+        self.__orders = {}          # aid -> _Order
+        self.__order_ids = {}       # child_order_id -> aid
+        self.__open = []            # ACTIVE orders
+        self.__parents = {}         # aid -> _Parent
+        self.__parent_ids = {}      # parent_order_id -> aid
+        self.__positions = {}       # pair -> list of [side, price, size, date]
+        self.__bids = {}            # pair -> {price: size}
+        self.__asks = {}            # pair -> {price: size}
+        self.__ltp = {}             # pair -> last price
+        self.__executions = {}      # pair -> deque of recent executions
+        self.fills = []             # (time, aid, pair, side, price, size)
+
+    # -------------------------------------------------------------------------
+    # time
+    # -------------------------------------------------------------------------
+    def now(self):
+        '''Return simulation time(UNIX time)'''
+        if self.__now is not None:
+            return self.__now
+        return self.__clock()
+
+    def set_time(self, now):
+        '''Set simulation time(for recorded data, clock is not used after this)'''
+        with self.__lock:
+            self.__now = now
+            self.__process()
+
+    def __new_id(self, header):
+        self.__seq += 1
+        dt_str = datetime.utcfromtimestamp(self.now()).strftime('%Y%m%d-%H%M%S')
+        return self.__seq, '%s%s-%06d' % (header, dt_str, self.__seq)
+
+    def __date(self, now=None):
+        return datetime.utcfromtimestamp(self.now() if now is None else now).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+
+    # -------------------------------------------------------------------------
+    # market data
+    # -------------------------------------------------------------------------
+    def on_message_board_snapshot(self, _, pair, data):
+        '''callback for RealtimeAPI(on_message_board_snapshot)'''
+        self.update_board(pair, data.bids, data.asks, snapshot=True)
+
+    def on_message_board(self, _, pair, data):
+        '''callback for RealtimeAPI(on_message_board)'''
+        self.update_board(pair, data.bids, data.asks)
+
+    def on_message_executions(self, _, pair, data_list):
+        '''callback for RealtimeAPI(on_message_executions)'''
+        for data in data_list:
+            self.execute(pair, data.side, data.price, data.size, data.order_id)
+
+    def update_board(self, pair, bids, asks, *, snapshot=False):
+        '''Update board by list of {'price', 'size'}'''
+        with self.__lock:
+            if snapshot or pair not in self.__bids:
+                self.__bids[pair] = {}
+                self.__asks[pair] = {}
+            for levels, book in ((bids, self.__bids[pair]), (asks, self.__asks[pair])):
+                for level in levels:
+                    if level['size'] > 0:
+                        book[level['price']] = level['size']
+                    else:
+                        book.pop(level['price'], None)
+            self.__process()
+
+    def execute(self, pair, side, price, size, exec_id=None, exec_date=None):
+        '''Match an execution(side is taker side) against open orders'''
+        with self.__lock:
+            self.__process()
+            self.__ltp[pair] = price
+            recent = self.__executions.setdefault(pair, deque(maxlen=500))
+            recent.appendleft({'id': exec_id, 'side': side, 'price': price, 'size': size,
+                               'exec_date': exec_date if exec_date is not None else self.__date(),
+                               'buy_child_order_acceptance_id': '',
+                               'sell_child_order_acceptance_id': ''})
+            self.__trigger_legs(pair, price)
+
+            remain = size
+            for order in list(self.__open):
+                if remain <= 0:
+                    break
+                if order.pair != pair or order.state != 'ACTIVE' or order.active_at > self.now():
+                    continue
+                fill = 0
+                if order.type == 'MARKET':
+                    fill = order.size - order.executed
+                elif order.side == 'BUY' and price <= order.price:
+                    fill = self.__limit_fill(order, side == 'BUY', price, remain)
+                elif order.side == 'SELL' and price >= order.price:
+                    fill = self.__limit_fill(order, side == 'SELL', price, remain)
+                fill = min(fill, remain)
+                if fill > 0:
+                    remain -= fill
+                    self.__fill(order, price, fill)
+
+    def __limit_fill(self, order, same_side, price, size):
+        '''Return fillable size of limit order by the execution'''
+        if price != order.price:    # 指値を超えた約定
+            return order.size - order.executed
+        if same_side or self.__queue_model == QueueModel.THROUGH:
+            return 0
+        if self.__queue_model == QueueModel.TOUCH:
+            return order.size - order.executed
+        order.queue_ahead -= size
+        if order.queue_ahead >= 0:
+            return 0
+        fill = min(-order.queue_ahead, order.size - order.executed)
+        order.queue_ahead = 0
+        return fill
+
+    def get_ltp(self, pair):
+        '''Return last traded price'''
+        return self.__ltp.get(pair)
+
+    def get_board(self, pair):
+        '''Return board as getboard format'''
+        with self.__lock:
+            bids = sorted(self.__bids.get(pair, {}).items(), reverse=True)
+            asks = sorted(self.__asks.get(pair, {}).items())
+            mid_price = (bids[0][0] + asks[0][0]) / 2 if bids and asks else self.__ltp.get(pair, 0)
+            return {'mid_price': mid_price,
+                    'bids': [{'price': p, 'size': s} for p, s in bids],
+                    'asks': [{'price': p, 'size': s} for p, s in asks]}
+
+    def get_executions(self, pair):
+        '''Return recent executions as getexecutions format'''
+        return list(self.__executions.get(pair, []))
+
+    # -------------------------------------------------------------------------
+    # matching
+    # -------------------------------------------------------------------------
+    def __process(self):
+        '''Activate, cancel and expire orders whose time has passed'''
+        now = self.now()
+        for parent in list(self.__parents.values()):
+            if parent.state != 'ACTIVE':
+                continue
+            if parent.expire <= now:
+                self.__cancel_parent(parent, 'EXPIRED')
+            elif parent.stage < 0 and parent.active_at <= now:
+                self.__next_stage(parent)
+        for order in list(self.__open):
+            if order.cancel_at is not None and order.cancel_at <= now:
+                self.__close(order, 'CANCELED')
+            elif order.expire <= now and order.parent is None:
+                self.__close(order, 'EXPIRED')
+            elif order.active_at <= now and order.queue_ahead is None:
+                self.__activate(order)
+
+    def __activate(self, order):
+        '''Take liquidity from the board and rest the remainder'''
+        bids = self.__bids.get(order.pair)
+        asks = self.__asks.get(order.pair)
+        order.queue_ahead = 0
+        if bids is None:
+            return
+        if order.side == 'BUY':
+            book, prices = asks, sorted(asks)
+        else:
+            book, prices = bids, sorted(bids, reverse=True)
+        for price in prices:
+            if order.state != 'ACTIVE':
+                break
+            if order.type == 'LIMIT' and (price > order.price if order.side == 'BUY' else price < order.price):
+                break
+            fill = min(book[price], order.size - order.executed)
+            book[price] -= fill
+            if book[price] <= 0:
+                del book[price]
+            self.__fill(order, price, fill)
+        if order.state == 'ACTIVE' and order.type == 'LIMIT':
+            same = bids if order.side == 'BUY' else asks
+            order.queue_ahead = same.get(order.price, 0)
+
+    def __fill(self, order, price, size):
+        size = round(size, 8)
+        if size <= 0:
+            return
+        order.executed = round(order.executed + size, 8)
+        order.value += price * size
+        order.commission += size * self.__commission_rate
+        now = self.now()
+        self.fills.append((now, order.aid, order.pair, order.side, price, size))
+        self.__on_fill(order, price, size)
+        if order.executed >= order.size:
+            self.__close(order, 'COMPLETED')
+        if order.parent is not None:
+            self.__parent_fill(self.__parents[order.parent], order)
+        self.__callback(self.__cb_on_fill, order.aid, price, size)
+
+    def __close(self, order, state):
+        order.state = state
+        order.cancel_at = None
+        if order in self.__open:
+            self.__open.remove(order)
+        if order.parent is not None and state == 'CANCELED':
+            parent = self.__parents[order.parent]
+            leg = parent.stages[parent.stage][order.leg]
+            if leg.state == 'PLACED':
+                leg.state = 'CANCELED'
+                self.__parent_check(parent)
+
+    def __on_fill(self, order, price, size):
+        '''Update balances and positions'''
+        sign = 1 if order.side == 'BUY' else -1
+        if order.pair.startswith('FX_'):
+            self.__position_fill(order.pair, order.side, price, size)
+        else:
+            coin, currency = order.pair.split('_')
+            self.__balances[coin] = self.__balances.get(coin, 0.0) + sign * size \
+                - size * self.__commission_rate
+            self.__balances[currency] = self.__balances.get(currency, 0.0) - sign * price * size
+
+    def __position_fill(self, pair, side, price, size):
+        '''FIFO netting of positions'''
+        positions = self.__positions.setdefault(pair, [])
+        while size > 1e-12 and positions and positions[0][0] != side:
+            pos = positions[0]
+            close = min(pos[2], size)
+            sign = 1 if pos[0] == 'BUY' else -1
+            self.__collateral += sign * (price - pos[1]) * close
+            pos[2] -= close
+            size -= close
+            if pos[2] <= 1e-12:
+                positions.pop(0)
+        if size > 1e-12:
+            positions.append([side, price, size, self.__date()])
+
+    # -------------------------------------------------------------------------
+    # parent order
+    # -------------------------------------------------------------------------
+    def __next_stage(self, parent):
+        parent.stage += 1
+        if parent.stage >= len(parent.stages):
+            parent.state = 'COMPLETED'
+            return
+        for leg in parent.stages[parent.stage]:
+            leg.state = 'ARMED'
+        self.__trigger_legs(parent.pair, self.__ltp.get(parent.pair), parent)
+
+    def __trigger_legs(self, pair, price, target=None):
+        '''Place child orders of legs whose condition is satisfied'''
+        parents = [target] if target is not None else list(self.__parents.values())
+        for parent in parents:
+            if parent.state != 'ACTIVE' or parent.pair != pair or parent.stage < 0:
+                continue
+            for index, leg in enumerate(parent.stages[parent.stage]):
+                if leg.state != 'ARMED':
+                    continue
+                prms = leg.prms
+                ctype = prms['condition_type']
+                if ctype in ('LIMIT', 'MARKET'):
+                    self.__place_leg(parent, index, leg, ctype, prms.get('price'))
+                elif price is None:
+                    continue
+                elif ctype in ('STOP', 'STOP_LIMIT'):
+                    trigger = prms['trigger_price']
+                    if (prms['side'] == 'BUY' and price >= trigger) or \
+                       (prms['side'] == 'SELL' and price <= trigger):
+                        if ctype == 'STOP':
+                            self.__place_leg(parent, index, leg, 'MARKET', None)
+                        else:
+                            self.__place_leg(parent, index, leg, 'LIMIT', prms['price'])
+                elif ctype == 'TRAIL':
+                    offset = prms['offset']
+                    if prms['side'] == 'BUY':
+                        leg.extreme = price if leg.extreme is None else min(leg.extreme, price)
+                        hit = price >= leg.extreme + offset
+                    else:
+                        leg.extreme = price if leg.extreme is None else max(leg.extreme, price)
+                        hit = price <= leg.extreme - offset
+                    if hit:
+                        self.__place_leg(parent, index, leg, 'MARKET', None)
+
+    def __place_leg(self, parent, index, leg, child_type, price):
+        leg.state = 'PLACED'
+        order = self.__new_order(parent.pair, child_type, leg.prms['side'], price, leg.prms['size'],
+                                 parent.minute_to_expire, latency=0)
+        order.parent = parent.aid
+        order.leg = index
+        leg.child = order.aid
+        self.__activate(order)
+
+    def __parent_fill(self, parent, order):
+        stage = parent.stages[parent.stage]
+        if len(stage) > 1:      # OCO: 片方が約定したらもう片方を取り消す
+            for index, leg in enumerate(stage):
+                if index != order.leg and leg.state in ('WAIT', 'ARMED', 'PLACED'):
+                    self.__cancel_leg(leg)
+        if order.state == 'COMPLETED':
+            stage[order.leg].state = 'DONE'
+            self.__parent_check(parent)
+
+    def __parent_check(self, parent):
+        '''Proceed or finish the parent order by the state of the legs'''
+        stage = parent.stages[parent.stage]
+        if any(leg.state == 'DONE' for leg in stage):
+            if all(leg.state in ('DONE', 'CANCELED') for leg in stage):
+                self.__next_stage(parent)
+        elif all(leg.state == 'CANCELED' for leg in stage):
+            parent.state = 'CANCELED'
+
+    def __cancel_leg(self, leg, state='CANCELED'):
+        if leg.state == 'PLACED':
+            child = self.__orders[leg.child]
+            if child.state == 'ACTIVE':
+                child.state = state
+                if child in self.__open:
+                    self.__open.remove(child)
+        leg.state = 'CANCELED'
+
+    def __cancel_parent(self, parent, state='CANCELED'):
+        '''Cancel(or expire) all legs of the parent order'''
+        for stage in parent.stages:
+            for leg in stage:
+                if leg.state in ('WAIT', 'ARMED', 'PLACED'):
+                    self.__cancel_leg(leg, state)
+        parent.state = state
+
+    # -------------------------------------------------------------------------
+    # order
+    # -------------------------------------------------------------------------
+    def __new_order(self, pair, child_type, side, price, size, minute_to_expire, latency=None):
+        if size is None or size <= 0:
+            raise Exception({'status': -110, 'error_message': 'The minimum order size is 0.001 BTC.'})
+        if child_type == 'LIMIT' and (price is None or price <= 0):
+            raise Exception({'status': -111, 'error_message': 'Invalid price.'})
+        order = self._Order()
+        order.id, order.aid = self.__new_id('JRF')
+        order.oid = 'JOR' + order.aid[3:]
+        order.pair = pair
+        order.side = side
+        order.type = child_type
+        order.price = price if child_type == 'LIMIT' else 0
+        order.size = size
+        order.executed = 0.0
+        order.value = 0.0
+        order.commission = 0.0
+        order.state = 'ACTIVE'
+        now = self.now()
+        order.active_at = now + (self.__latency if latency is None else latency)
+        order.cancel_at = None
+        order.queue_ahead = None
+        order.date = now
+        order.expire = now + 60 * (minute_to_expire if minute_to_expire is not None else 43200)
+        order.parent = None
+        order.leg = None
+        self.__orders[order.aid] = order
+        self.__order_ids[order.oid] = order.aid
+        self.__open.append(order)
+        return order
+
+    def __order_row(self, order):
+        average = order.value / order.executed if order.executed > 0 else 0
+        if order.state in ('COMPLETED', 'CANCELED', 'EXPIRED'):
+            outstanding = 0
+        else:
+            outstanding = order.size - order.executed
+        return {
+            'id': order.id,
+            'child_order_id': order.oid,
+            'product_code': order.pair,
+            'side': order.side,
+            'child_order_type': order.type,
+            'price': order.price,
+            'average_price': average,
+            'size': order.size,
+            'child_order_state': order.state,
+            'expire_date': self.__date(order.expire),
+            'child_order_date': self.__date(order.date),
+            'child_order_acceptance_id': order.aid,
+            'outstanding_size': outstanding,
+            'cancel_size': order.size - order.executed if order.state in ('CANCELED', 'EXPIRED') else 0,
+            'executed_size': order.executed,
+            'total_commission': order.commission
+        }
+
+    def send_childorder(self, product_code,
+                        child_order_type, side,
+                        price, size,
+                        *, minute_to_expire=None, time_in_force=None):
+        '''新規注文を出す'''
+        with self.__lock:
+            order = self.__new_order(product_code, child_order_type, side, price, size, minute_to_expire)
+            self.__process()
+            return {'child_order_acceptance_id': order.aid}
+
+    def send_cancelchildorder(self, product_code,
+                              *,
+                              child_order_acceptance_id=None,
+                              child_order_id=None):
+        '''注文をキャンセルする'''
+        with self.__lock:
+            if child_order_acceptance_id is None:
+                child_order_acceptance_id = self.__order_ids.get(child_order_id)
+            order = self.__orders.get(child_order_acceptance_id)
+            if order is not None and order.state == 'ACTIVE' and order.cancel_at is None:
+                order.cancel_at = self.now() + self.__latency
+                self.__process()
+            return None
+
+    def send_cancelallchildorders(self, product_code):
+        '''全ての注文をキャンセルする'''
+        with self.__lock:
+            for order in list(self.__open):
+                if order.pair == product_code and order.parent is None:
+                    self.send_cancelchildorder(product_code, child_order_acceptance_id=order.aid)
+            return None
+
+    def get_childorders(self, product_code, *,
+                        count=None, before=None, after=None,
+                        child_order_state=None,
+                        child_order_id=None,
+                        child_order_acceptance_id=None,
+                        parent_order_id=None):
+        '''注文の一覧を取得'''
+        with self.__lock:
+            self.__process()
+            if child_order_id is not None:
+                child_order_acceptance_id = self.__order_ids.get(child_order_id)
+            if child_order_acceptance_id is not None:
+                order = self.__orders.get(child_order_acceptance_id)
+                orders = [order] if order is not None else []
+            elif parent_order_id is not None:
+                parent = self.__parents.get(self.__parent_ids.get(parent_order_id))
+                orders = [] if parent is None else \
+                    [o for o in self.__orders.values() if o.parent == parent.aid]
+            else:
+                orders = list(self.__orders.values())
+            rows = []
+            for order in reversed(orders):
+                if order.pair != product_code:
+                    continue
+                if before is not None and order.id >= before:
+                    continue
+                if after is not None and order.id <= after:
+                    continue
+                if child_order_state is not None and order.state != child_order_state:
+                    continue
+                rows.append(self.__order_row(order))
+                if len(rows) >= (count if count is not None else 100):
+                    break
+            return rows
+
+    def send_parentorder(self, order_method, parameters,
+                         *, minute_to_expire=None, time_in_force=None):
+        '''新規特殊注文を出す'''
+        shapes = {'SIMPLE': (1,), 'IFD': (1, 1), 'OCO': (2,), 'IFDOCO': (1, 2)}
+        shape = shapes.get(order_method)
+        if shape is None or len(parameters) != sum(shape):
+            raise Exception({'status': -500, 'error_message': 'Invalid parameters.'})
+        with self.__lock:
+            parent = self._Parent()
+            parent.id, parent.aid = self.__new_id('JRF')
+            parent.oid = 'JCO' + parent.aid[3:]
+            parent.pair = parameters[0]['product_code']
+            parent.method = order_method
+            parent.parameters = parameters
+            legs = [self._Leg(prms) for prms in parameters]
+            parent.stages = [legs[:shape[0]]] + ([legs[shape[0]:]] if len(shape) > 1 else [])
+            parent.stage = -1
+            parent.state = 'ACTIVE'
+            now = self.now()
+            parent.date = now
+            parent.minute_to_expire = minute_to_expire
+            parent.expire = now + 60 * (minute_to_expire if minute_to_expire is not None else 43200)
+            parent.active_at = now + self.__latency
+            self.__parents[parent.aid] = parent
+            self.__parent_ids[parent.oid] = parent.aid
+            self.__process()
+            return {'parent_order_acceptance_id': parent.aid}
+
+    def send_cancelparentorder(self, product_code,
+                               *,
+                               parent_order_acceptance_id=None,
+                               parent_order_id=None):
+        '''特殊注文をキャンセルする'''
+        with self.__lock:
+            if parent_order_acceptance_id is None:
+                parent_order_acceptance_id = self.__parent_ids.get(parent_order_id)
+            parent = self.__parents.get(parent_order_acceptance_id)
+            if parent is not None and parent.state == 'ACTIVE':
+                self.__cancel_parent(parent)
+            return None
+
+    def __parent_row(self, parent):
+        first = parent.parameters[0]
+        children = [o for o in self.__orders.values() if o.parent == parent.aid]
+        executed = sum(o.executed for o in children)
+        value = sum(o.value for o in children)
+        return {
+            'id': parent.id,
+            'parent_order_id': parent.oid,
+            'product_code': parent.pair,
+            'side': first['side'],
+            'parent_order_type': first['condition_type'],
+            'price': first.get('price', 0),
+            'average_price': value / executed if executed > 0 else 0,
+            'size': first['size'],
+            'parent_order_state': parent.state,
+            'expire_date': self.__date(parent.expire),
+            'parent_order_date': self.__date(parent.date),
+            'parent_order_acceptance_id': parent.aid,
+            'outstanding_size': first['size'] if parent.state == 'ACTIVE' else 0,
+            'cancel_size': 0,
+            'executed_size': executed,
+            'total_commission': sum(o.commission for o in children)
+        }
+
+    def get_parentorders(self, product_code, *,
+                         count=None, before=None, after=None,
+                         parent_order_state=None):
+        '''親注文の一覧を取得'''
+        with self.__lock:
+            self.__process()
+            rows = []
+            for parent in reversed(list(self.__parents.values())):
+                if parent.pair != product_code:
+                    continue
+                if before is not None and parent.id >= before:
+                    continue
+                if after is not None and parent.id <= after:
+                    continue
+                if parent_order_state is not None and parent.state != parent_order_state:
+                    continue
+                rows.append(self.__parent_row(parent))
+                if len(rows) >= (count if count is not None else 100):
+                    break
+            return rows
+
+    def get_parentorder(self, *,
+                        parent_order_id=None,
+                        parent_order_acceptance_id=None):
+        '''get detail of parent order'''
+        with self.__lock:
+            if parent_order_acceptance_id is None:
+                parent_order_acceptance_id = self.__parent_ids.get(parent_order_id)
+            parent = self.__parents.get(parent_order_acceptance_id)
+            if parent is None:
+                raise Exception({'status': -111, 'error_message': 'Order not found'})
+            return {
+                'id': parent.id,
+                'parent_order_id': parent.oid,
+                'order_method': parent.method,
+                'minute_to_expire': parent.minute_to_expire,
+                'parameters': parent.parameters,
+                'parent_order_acceptance_id': parent.aid
+            }
+
+    # -------------------------------------------------------------------------
+    # account
+    # -------------------------------------------------------------------------
+    def get_markets(self):
+        '''Return markets of the simulated boards(getmarkets format)'''
+        with self.__lock:
+            pairs = sorted(set(self.__bids) | set(self.__ltp))
+        return [{'product_code': pair, 'market_type': 'FX' if pair.startswith('FX_') else 'Spot'}
+                for pair in pairs]
+
+    def get_permissions(self):
+        '''API キーの権限を取得'''
+        return ['/v1/me/getbalance', '/v1/me/getcollateral', '/v1/me/getpositions',
+                '/v1/me/sendchildorder', '/v1/me/cancelchildorder', '/v1/me/getchildorders',
+                '/v1/me/sendparentorder', '/v1/me/cancelparentorder', '/v1/me/getparentorders']
+
+    def get_getbalance(self):
+        '''資産残高を取得'''
+        with self.__lock:
+            self.__process()
+            locked = {}
+            for order in self.__open:
+                if order.pair.startswith('FX_'):
+                    continue
+                coin, currency = order.pair.split('_')
+                remain = order.size - order.executed
+                if order.side == 'BUY':
+                    locked[currency] = locked.get(currency, 0.0) + remain * order.price
+                else:
+                    locked[coin] = locked.get(coin, 0.0) + remain
+            return [{'currency_code': code, 'amount': amount, 'available': amount - locked.get(code, 0.0)}
+                    for code, amount in self.__balances.items()]
+
+    def get_getcollateral(self):
+        '''証拠金の状態を取得'''
+        with self.__lock:
+            self.__process()
+            pnl = 0.0
+            require = 0.0
+            for pair, positions in self.__positions.items():
+                ltp = self.__ltp.get(pair)
+                for side, price, size, _ in positions:
+                    sign = 1 if side == 'BUY' else -1
+                    pnl += sign * ((ltp if ltp is not None else price) - price) * size
+                    require += price * size / self.__leverage
+            return {
+                'collateral': self.__collateral,
+                'open_position_pnl': pnl,
+                'require_collateral': require,
+                'keep_rate': (self.__collateral + pnl) / require if require > 0 else 0
+            }
+
+    def get_getcollateralaccounts(self):
+        '''証拠金の状態を取得'''
+        return [{'currency_code': 'JPY', 'amount': self.__collateral}]
+
+    def get_deposits(self, *, count=None, before=None, after=None):
+        '''入金履歴を取得'''
+        return []
+
+    def get_getpositions(self, product_code):
+        '''建玉の一覧を取得'''
+        with self.__lock:
+            self.__process()
+            ltp = self.__ltp.get(product_code)
+            rows = []
+            for side, price, size, date in self.__positions.get(product_code, []):
+                sign = 1 if side == 'BUY' else -1
+                rows.append({
+                    'product_code': product_code,
+                    'side': side,
+                    'price': price,
+                    'size': size,
+                    'commission': 0,
+                    'swap_point_accumulate': 0,
+                    'require_collateral': price * size / self.__leverage,
+                    'open_date': date,
+                    'leverage': self.__leverage,
+                    'pnl': sign * ((ltp if ltp is not None else price) - price) * size,
+                    'sfd': 0
+                })
+            return rows
+
+    def __callback(self, callback, *args):
+        if callback:
+            try:
+                callback(self, *args)
+            except:     # pylint: disable-msg=W0702
+                import traceback
+                traceback.print_exc()
+
+
+class _PaperBrokerMixin(object):
+    '''
+    Public data of paper broker(served from the simulated board)
+
+    All methods of the broker are served in-process(no network access):
+    get_markets lists the simulated pairs and get_chats is always empty.
+    '''
+
+    def __init__(self, pair, paper_api=None, log=False, *, numeric=None, health_monitor=None, **kwargs):
+        if paper_api is None:
+            paper_api = PaperPrivateAPI(**kwargs)
+        super().__init__(pair, '', '', log, numeric=numeric, health_monitor=health_monitor,
+                         prv_api=paper_api)
+        self.broker_name = 'paper'
+
+    def get_markets(self):
+        '''マーケットの一覧取得'''
+        return True, self.prv_api.get_markets()
+
+    def get_depth_data(self):
+        ''' 板情報の取得 '''
+        return True, self.prv_api.get_board(self.trade_pair)
+
+    def get_ticker(self):
+        '''Tickerの取得'''
+        board = self.prv_api.get_board(self.trade_pair)
+        return True, {
+            'product_code': self.trade_pair,
+            'best_bid': board['bids'][0]['price'] if board['bids'] else 0,
+            'best_ask': board['asks'][0]['price'] if board['asks'] else 0,
+            'ltp': self.prv_api.get_ltp(self.trade_pair)
+        }
+
+    def get_executions(self):
+        ''' 約定履歴の取得 '''
+        return True, self.prv_api.get_executions(self.trade_pair)
+
+    def get_depth_status(self):
+        ''' 板の状態の取得 '''
+        return True, self.HealthStatus.NORMAL, self.StateStatus.RUNNING
+
+    def get_broker_status(self):
+        ''' 取引所の状態の取得 '''
+        return True, self.HealthStatus.NORMAL
+
+    def get_chats(self):
+        ''' チャットの取得 '''
+        return True, []
+
+
+class PaperBrokerAPI(_PaperBrokerMixin, BrokerAPI):
+    '''取引所アクセス仮想APIクラス(ペーパートレード)'''
+
+
+class PaperBrokerFXAPI(_PaperBrokerMixin, BrokerFXAPI):
+    '''取引所アクセス仮想APIクラスfor 証拠金取引(ペーパートレード)'''
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+'''特殊注文(親注文)の一括追跡モジュール'''
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from .broker import BrokerAPI, decode_orders
+
+
+class ParentOrderTracker(object):
+    '''
+    Bulk tracker of parent orders(IFD/OCO/IFDOCO) on BrokerAPI
+
+    Keeps parent_order_acceptance_id -> parent_order_id -> child legs
+    indexes. refresh() lists parent orders by get_parentorders(paged by
+    the before cursor, back to the oldest open tracked parent) and looks
+    up the child orders(get_childorders(parent_order_id=...)) concurrently,
+    only for new parents, parents whose state or executed size has changed
+    and ACTIVE parents whose legs may be stale: no active leg known(the
+    next stage of IFD/IFDOCO, a triggered STOP_LIMIT/TRAIL or legs not
+    visible yet) after leg_interval seconds, doubled on every lookup
+    without an active leg up to leg_max_age(untriggered STOP/TRAIL legs
+    are not listed until they trigger), or legs older than leg_max_age
+    seconds. The mapping of ids comes with the listing, so
+    parent_aid_to_oid is not needed.
+
+    Queries(parent/legs/state) are O(1) on the indexes without requests.
+    With track_all, every parent seen while ACTIVE is tracked, otherwise
+    only the acceptance ids given to track().
+    '''
+
+    class Parent(object):
+        '''tracked parent order'''
+        __slots__ = ('acceptance_id', 'parent_order_id', 'id', 'order_type', 'side',
+                     'state', 'executed_size', 'outstanding_size', 'legs', 'version', 'fetched_at',
+                     'interval')
+
+        def __init__(self, acceptance_id):
+            self.acceptance_id = acceptance_id  # parent_order_acceptance_id
+            self.parent_order_id = None         # 一覧に現れるまではNone
+            self.id = None                      # 一覧のページング用id
+            self.order_type = None              # parent_order_type(最初の注文の執行条件)
+            self.side = None
+            self.state = None                   # ACTIVE/COMPLETED/CANCELED/EXPIRED/REJECTED
+            self.executed_size = None
+            self.outstanding_size = None
+            self.legs = []                      # 子注文(OrderInfo)のリスト
+            self.version = None                 # 子注文取得時の(state, executed, outstanding, cancel)
+            self.fetched_at = None              # 子注文の取得時刻(monotonic)
+            self.interval = None                # 有効な子注文が無い場合の再取得間隔(秒)
+
+        @property
+        def is_open(self):
+            '''[property] True if not listed yet or ACTIVE'''
+            return self.state is None or self.state == 'ACTIVE'
+
+    ACTIVE_LEG_STATES = (BrokerAPI.OrderState.UNFILLED, BrokerAPI.OrderState.PARTIALLY_FILLED)
+
+    def __init__(self, broker, *, track_all=True, page_size=100, max_pages=5, max_workers=4,
+                 leg_interval=5.0, leg_max_age=120.0):
+        self.broker = broker
+        self.track_all = track_all
+        self.leg_interval = leg_interval
+        self.leg_max_age = leg_max_age
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.__lock = threading.Lock()
+        self.__parents = {}         # parent_order_acceptance_id -> Parent
+        self.__parent_ids = {}      # parent_order_id -> parent_order_acceptance_id
+        self.__seeded = False
+        self.__stats = {'refreshes': 0, 'requests': 0, 'lookups': 0, 'truncated': 0}
+
+    def close(self):
+        '''Shutdown worker threads'''
+        self.__executor.shutdown(wait=True)
+
+    # -------------------------------------------------------------------------
+    # tracking
+    # -------------------------------------------------------------------------
+    def track(self, acceptance_id):
+        '''Track parent order of acceptance_id(as returned by so_send)'''
+        with self.__lock:
+            if acceptance_id not in self.__parents:
+                self.__parents[acceptance_id] = self.Parent(acceptance_id)
+
+    def forget(self, acceptance_id):
+        '''Stop tracking parent order of acceptance_id'''
+        with self.__lock:
+            parent = self.__parents.pop(acceptance_id, None)
+            if parent is not None and parent.parent_order_id is not None:
+                self.__parent_ids.pop(parent.parent_order_id, None)
+
+    def prune(self):
+        '''Forget closed parent orders(return their acceptance ids)'''
+        with self.__lock:
+            closed = [aid for aid, parent in self.__parents.items() if not parent.is_open]
+        for aid in closed:
+            self.forget(aid)
+        return closed
+
+    def __list(self):
+        '''List parent orders back to the oldest open tracked parent'''
+        prv_api = self.broker.prv_api
+        pair = self.broker.trade_pair
+        # the first listing of track_all seeds all ACTIVE parents, after that
+        # new parents are on the first page(newer than any listed one)
+        seed = self.track_all and not self.__seeded
+        with self.__lock:
+            oldest = min((parent.id for parent in self.__parents.values()
+                          if parent.is_open and parent.id is not None), default=None)
+        rows = []
+        before = None
+        # max_pages bounds the seed listing only: the later ones must reach
+        # the oldest open parent, or its state would never be updated
+        pages = 0
+        while not seed or pages < self.max_pages:
+            pages += 1
+            page = prv_api.get_parentorders(pair, count=self.page_size, before=before,
+                                            parent_order_state='ACTIVE' if seed else None)
+            with self.__lock:
+                self.__stats['requests'] += 1
+            rows.extend(page)
+            if len(page) < self.page_size:
+                break
+            before = min(row['id'] for row in page)
+            if not seed and (oldest is None or before <= oldest):
+                break
+        else:
+            with self.__lock:
+                self.__stats['truncated'] += 1     # older ACTIVE parents are not seeded
+        self.__seeded = True
+        return rows
+
+    def refresh(self):
+        '''
+        Update tracked parent orders and their legs
+        (PrivateAPI使用回数: 一覧のページ数 + 子注文を取得する親注文数 回, 子注文は並列に取得)
+        Child orders are fetched for parents which changed, and for each
+        ACTIVE parent at least once per leg_max_age(and at the backed-off
+        interval while no active leg is known), so the steady cost is about
+        number of ACTIVE parents / leg_max_age requests per second.
+
+        Return list of Parent whose legs were updated. Raise exception on failure.
+        '''
+        size = self.broker.num.size
+        rows = self.__list()
+        now = time.monotonic()
+        changed = []
+        with self.__lock:
+            self.__stats['refreshes'] += 1
+            for row in rows:
+                aid = row['parent_order_acceptance_id']
+                parent = self.__parents.get(aid)
+                if parent is None:
+                    if not self.track_all or row['parent_order_state'] != 'ACTIVE':
+                        continue
+                    parent = self.__parents[aid] = self.Parent(aid)
+                parent.parent_order_id = row['parent_order_id']
+                parent.id = row['id']
+                parent.order_type = row['parent_order_type']
+                parent.side = row['side']
+                parent.state = row['parent_order_state']
+                parent.executed_size = size(row['executed_size'])
+                parent.outstanding_size = size(row['outstanding_size'])
+                self.__parent_ids[parent.parent_order_id] = aid
+                version = (row['parent_order_state'], row['executed_size'],
+                           row['outstanding_size'], row['cancel_size'])
+                if version != parent.version:
+                    parent.version = version
+                    parent.interval = self.leg_interval
+                    changed.append(parent)
+                elif parent.state == 'ACTIVE' and self.__stale(parent, now):
+                    changed.append(parent)
+        if changed:
+            self.__lookup(changed)
+        return changed
+
+    def __stale(self, parent, now):
+        '''Return True if legs of ACTIVE parent may be missing or outdated'''
+        if parent.fetched_at is None:
+            return True
+        age = now - parent.fetched_at
+        if age >= self.leg_max_age:
+            return True
+        if age < parent.interval or any(leg.order_state in self.ACTIVE_LEG_STATES
+                                        for leg in parent.legs):
+            return False
+        # back off while no leg is listed(untriggered STOP/TRAIL)
+        parent.interval = min(parent.interval * 2, self.leg_max_age)
+        return True
+
+    def __lookup(self, parents):
+        '''Fetch child orders of parents concurrently'''
+        prv_api = self.broker.prv_api
+        pair = self.broker.trade_pair
+        num = self.broker.num
+        futures = [self.__executor.submit(prv_api.get_childorders, pair,
+                                          parent_order_id=parent.parent_order_id)
+                   for parent in parents]
+        error = None
+        for parent, future in zip(parents, futures):
+            try:
+                legs = decode_orders(future.result(), num)
+            except Exception as ex:     # pylint: disable-msg=W0703
+                parent.version = None   # retry on the next refresh
+                error = ex
+                continue
+            with self.__lock:
+                parent.legs = legs
+                parent.fetched_at = time.monotonic()
+        with self.__lock:
+            self.__stats['requests'] += len(parents)
+            self.__stats['lookups'] += len(parents)
+        if error is not None:
+            raise error
+
+    # -------------------------------------------------------------------------
+    # query
+    # -------------------------------------------------------------------------
+    def parent(self, *, acceptance_id=None, parent_order_id=None):
+        '''Return Parent(None if not tracked)'''
+        if acceptance_id is None:
+            acceptance_id = self.__parent_ids.get(parent_order_id)
+        return self.__parents.get(acceptance_id)
+
+    def parent_order_id(self, acceptance_id):
+        '''Return parent_order_id of acceptance_id(None if not listed yet)'''
+        parent = self.__parents.get(acceptance_id)
+        return None if parent is None else parent.parent_order_id
+
+    def legs(self, *, acceptance_id=None, parent_order_id=None):
+        '''Return child orders(list of OrderInfo) of the parent(empty if unknown)'''
+        parent = self.parent(acceptance_id=acceptance_id, parent_order_id=parent_order_id)
+        return [] if parent is None else parent.legs
+
+    def state(self, *, acceptance_id=None, parent_order_id=None):
+        '''Return parent_order_state(None if unknown)'''
+        parent = self.parent(acceptance_id=acceptance_id, parent_order_id=parent_order_id)
+        return None if parent is None else parent.state
+
+    def parents(self, *, open_only=False):
+        '''Return list of tracked Parent'''
+        with self.__lock:
+            return [parent for parent in self.__parents.values()
+                    if not open_only or parent.is_open]
+
+    def stats(self):
+        '''
+        Return dict of refreshes, requests, lookups(child order requests) and
+        truncated(seed listings cut at max_pages)
+        '''
+        with self.__lock:
+            return dict(self.__stats)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+'''建玉台帳モジュール(列指向の集計と約定による差分更新)'''
+from array import array
+
+
+class PositionBook(object):
+    '''
+    Columnar position book of a pair
+
+    load() converts get_getpositions response(one row per fill) to columns
+    (array of float) and aggregates long/short size, VWAP entry price,
+    commission, swap, sfd, PnL and required margin in a single pass.
+    apply_fill() updates the book by own fills(FIFO close as the exchange)
+    without re-listing, and the aggregates are kept incrementally, so
+    summary() costs the same with 10 or 10,000 rows.
+
+    Values are float. on_fill can be passed to FillDetector(on_fill=...) as is.
+    '''
+
+    class Summary(object):
+        '''aggregated positions(float)'''
+        __slots__ = ('long_size', 'long_price', 'short_size', 'short_price', 'net_size',
+                     'commission', 'swap', 'sfd', 'profit_loss', 'required_margin', 'rows')
+
+        def __init__(self, long_size, long_price, short_size, short_price, net_size,
+                     commission, swap, sfd, profit_loss, required_margin, rows):
+            self.long_size = long_size              # 買い建玉数量
+            self.long_price = long_price            # 買い建玉平均価格(なしはNone)
+            self.short_size = short_size            # 売り建玉数量
+            self.short_price = short_price          # 売り建玉平均価格(なしはNone)
+            self.net_size = net_size                # 建玉数量(売りは-)
+            self.commission = commission
+            self.swap = swap
+            self.sfd = sfd
+            self.profit_loss = profit_loss          # 評価損益(markなしは取得時のpnl合計)
+            self.required_margin = required_margin
+            self.rows = rows                        # 建玉行数
+
+    COMPACT_ROWS = 1024     # compact closed rows at the head over this count
+
+    def __init__(self, pair, *, leverage=None):
+        self.pair = pair
+        self.leverage = leverage    # required margin of new rows(None: average of loaded rows)
+        self.realized = 0.0         # realized PnL by apply_fill
+        self.clear()
+
+    def clear(self):
+        '''Remove all rows'''
+        self.__head = 0
+        self.__sign = array('b')        # +1: BUY, -1: SELL
+        self.__price = array('d')
+        self.__size = array('d')        # remaining size
+        self.__commission = array('d')
+        self.__swap = array('d')
+        self.__sfd = array('d')
+        self.__required = array('d')
+        self.__pnl = array('d')
+        self.__tot = [0.0] * 8          # long size/value, short size/value, commission, swap, sfd, pnl
+        self.__required_total = 0.0
+
+    def load(self, res_positions):
+        '''Replace rows by get_getpositions response(list)'''
+        self.clear()
+        sign = self.__sign
+        price = self.__price
+        size = self.__size
+        commission = self.__commission
+        swap = self.__swap
+        sfd = self.__sfd
+        required = self.__required
+        pnl = self.__pnl
+        long_size = long_value = short_size = short_value = 0.0
+        tot_commission = tot_swap = tot_sfd = tot_pnl = tot_required = 0.0
+        leverage = 0.0
+        for row in res_positions:
+            row_price = float(row['price'])
+            row_size = float(row['size'])
+            if row['side'] == 'BUY':
+                sign.append(1)
+                long_size += row_size
+                long_value += row_price * row_size
+            else:
+                sign.append(-1)
+                short_size += row_size
+                short_value += row_price * row_size
+            price.append(row_price)
+            size.append(row_size)
+            value = float(row['commission'])
+            commission.append(value)
+            tot_commission += value
+            value = float(row['swap_point_accumulate'])
+            swap.append(value)
+            tot_swap += value
+            value = float(row['sfd'])
+            sfd.append(value)
+            tot_sfd += value
+            value = float(row['require_collateral'])
+            required.append(value)
+            tot_required += value
+            value = float(row['pnl'])
+            pnl.append(value)
+            tot_pnl += value
+            leverage += float(row['leverage'])
+        self.__tot = [long_size, long_value, short_size, short_value,
+                      tot_commission, tot_swap, tot_sfd, tot_pnl]
+        self.__required_total = tot_required
+        if self.leverage is None and len(size) > 0:
+            self.leverage = leverage / len(size)
+        return self
+
+    def __len__(self):
+        return len(self.__size) - self.__head
+
+    def apply_fill(self, side, price, size):
+        '''Apply own fill(close opposite rows FIFO, then open the rest)'''
+        if hasattr(side, 'value'):
+            side = side.value
+        fill_sign = 1 if side == 'BUY' else -1
+        price = float(price)
+        remain = float(size)
+        tot = self.__tot
+        sizes = self.__size
+        head = self.__head
+        while remain > 1e-12 and head < len(sizes) and self.__sign[head] != fill_sign:
+            row_size = sizes[head]
+            close = min(row_size, remain)
+            row_price = self.__price[head]
+            ratio = close / row_size
+            if fill_sign == 1:      # close short
+                tot[2] -= close
+                tot[3] -= row_price * close
+                self.realized += (row_price - price) * close
+            else:                   # close long
+                tot[0] -= close
+                tot[1] -= row_price * close
+                self.realized += (price - row_price) * close
+            for column, index in ((self.__commission, 4), (self.__swap, 5),
+                                  (self.__sfd, 6), (self.__pnl, 7)):
+                part = column[head] * ratio
+                column[head] -= part
+                tot[index] -= part
+            part = self.__required[head] * ratio
+            self.__required[head] -= part
+            self.__required_total -= part
+            sizes[head] = row_size - close
+            remain -= close
+            if sizes[head] <= 1e-12:
+                head += 1
+        self.__head = head
+        if remain > 1e-12:
+            self.__sign.append(fill_sign)
+            self.__price.append(price)
+            sizes.append(remain)
+            for column in (self.__commission, self.__swap, self.__sfd, self.__pnl):
+                column.append(0.0)
+            required = price * remain / self.leverage if self.leverage else 0.0
+            self.__required.append(required)
+            self.__required_total += required
+            if fill_sign == 1:
+                tot[0] += remain
+                tot[1] += price * remain
+            else:
+                tot[2] += remain
+                tot[3] += price * remain
+        if head > self.COMPACT_ROWS:
+            self.__compact()
+
+    def __compact(self):
+        '''Drop closed rows at the head'''
+        head = self.__head
+        for column in (self.__sign, self.__price, self.__size, self.__commission,
+                       self.__swap, self.__sfd, self.__required, self.__pnl):
+            del column[:head]
+        self.__head = 0
+
+    def on_fill(self, _, event):
+        '''callback for FillDetector(on_fill)'''
+        if event.pair == self.pair:
+            self.apply_fill(event.side, event.price, event.size)
+
+    def summary(self, mark_price=None):
+        '''Return Summary(profit_loss is valued at mark_price if given)'''
+        long_size, long_value, short_size, short_value, commission, swap, sfd, pnl = self.__tot
+        if long_size <= 1e-12:
+            long_size = long_value = 0.0
+        if short_size <= 1e-12:
+            short_size = short_value = 0.0
+        if mark_price is not None:
+            mark_price = float(mark_price)
+            pnl = (long_size * mark_price - long_value) + (short_value - short_size * mark_price)
+        return self.Summary(long_size, long_value / long_size if long_size else None,
+                            short_size, short_value / short_size if short_size else None,
+                            long_size - short_size, commission, swap, sfd, pnl,
+                            self.__required_total, len(self))
+
+    def rows(self):
+        '''Return open rows as list of (side, price, size)'''
+        head = self.__head
+        return [('BUY' if sign == 1 else 'SELL', price, size)
+                for sign, price, size in zip(self.__sign[head:], self.__price[head:], self.__size[head:])]
@@ -1,26 +1,54 @@
 # -*- coding: utf-8 -*-
 '''private API module'''
+import threading
 import time
-from datetime import datetime
+from collections import deque
+from datetime import datetime, timedelta
 import json
 from urllib.parse import urlencode
 from hashlib import sha256
 import hmac
-import requests
-from .common import error_parser
+from .common import error_parser, acquire_budgets, iso2dt
+from .retry import RetryPolicy
+from .session import SessionPool
 
 
 class PrivateAPI(object):
     '''private API class'''
 
-    def __init__(self, api_key, api_secret, *, get_timeout=None, post_timeout=None):
-        '''イニシャライザー'''
-        self.__api_endpoint = "https://api.bitflyer.com"
+    API_ENDPOINT = "https://api.bitflyer.com"
+    VERIFY_COUNT = 20       # recent orders looked up before retrying an order
+    VERIFY_SKEW = 2         # tolerance(seconds) of clock between client and exchange
+
+    def __init__(self, api_key, api_secret, *, get_timeout=None, post_timeout=None, endpoint=None,
+                 metrics=None, session_pool=None, rate_limits=(), on_reconnect=None,
+                 retry_policy=None, cache=None, budget_timeout=None):
+        '''
+        イニシャライザー
+
+        session_pool: SessionPool shared by threads(and other PrivateAPI/PublicAPI)
+        on_reconnect: callback(path, exception) called when a broken session is replaced
+        retry_policy: RetryPolicy(default: RetryPolicy(), RetryPolicy(max_attempts=1) for no retry)
+        cache: ResponseCache of GET responses(invalidated by POST requests)
+        budget_timeout: seconds to wait for rate_limits(None: until available)
+        '''
+        self.__api_endpoint = endpoint if endpoint is not None else self.API_ENDPOINT
         self.__api_key = api_key
         self.__api_secret = api_secret
         self.__get_timeout = get_timeout
         self.__post_timeout = post_timeout
-        self.__session = None
+        if session_pool is None:
+            session_pool = SessionPool(metrics=metrics)
+        self.__session_pool = session_pool
+        self.__on_reconnect = on_reconnect
+        self.__metrics = metrics
+        self.__rate_limits = rate_limits
+        self.__budget_timeout = budget_timeout
+        self.__retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.__sent_ids = deque(maxlen=self.VERIFY_COUNT * 5)
+        self.__sending = {}         # order key -> [Lock, number of senders]
+        self.__sending_lock = threading.Lock()
+        self.__cache = cache
 
     def __make_header(self, query_data):
         '''リクエストヘッダーの生成'''
@@ -36,45 +64,233 @@ class PrivateAPI(object):
             'Content-Type': 'application/json'
         }
 
-    def __get_session(self):
-        if self.__session is None:
-            self.__session = requests.Session()
-        return self.__session
-
     def __get_query(self, path, query_dct):
         '''GET Method'''
         query = ''
         if len(query_dct) > 0:  # pylint: disable-msg=C1801
             query = '?' + urlencode(query_dct)
-        headers = self.__make_header('GET' + path + query)
-        uri = self.__api_endpoint + path + query
-        try:
-            response = self.__get_session().get(uri, headers=headers, timeout=self.__get_timeout)
-        except requests.exceptions.ConnectionError:
-            # If session disconnect, reconnect the session and command retry.
-            with open('error_session.log', 'a') as ferr:
-                ferr.write(str(datetime.now()) + '\n')
-            self.__session = None
-            response = self.__get_session().get(uri, headers=headers, timeout=self.__get_timeout)
-        return error_parser(response)
+        if self.__cache is not None:
+            return self.__cache.fetch(path, path + query, lambda: self.__request(
+                'GET', path, query, '', self.__get_timeout))
+        return self.__request('GET', path, query, '', self.__get_timeout)
 
-
-    def __post_query(self, path, query_dct):
+    def __post_query(self, path, query_dct, verify=None):
         '''POST Method'''
         data = ''
         if len(query_dct) > 0:  # pylint: disable-msg=C1801
             data = json.dumps(query_dct)
-        headers = self.__make_header('POST' + path + data)
-        uri = self.__api_endpoint + path
+        if self.__cache is None:
+            return self.__request('POST', path, '', data, self.__post_timeout, verify)
+        try:
+            return self.__request('POST', path, '', data, self.__post_timeout, verify)
+        finally:
+            # invalidate even if failed(the request may have reached the exchange)
+            self.__cache.invalidate()
+
+    def __request(self, method, path, query, data, timeout, verify=None):
+        '''
+        Send request(retry by the policy) and parse response
+
+        verify(since) is called before retrying a request which may have
+        reached the exchange, and its result(not None) is returned instead
+        of sending the request again.
+        '''
+        import requests     # loaded on the first request(see SessionPool)
+        policy = self.__retry_policy
+        metrics = self.__metrics
+        labels = (('endpoint', path),)
+        start = time.monotonic()
+        since = datetime.utcnow()
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.__rate_limits:
+                acquire_budgets(self.__rate_limits, self.__budget_timeout)
+            try:
+                response = self.__attempt(method, path, query, data, timeout, labels)
+            except requests.exceptions.RequestException as ex:
+                reason, ambiguous = policy.classify(error=ex)
+                if reason is None:
+                    raise
+                delay = policy.delay(path, attempt)
+                if not policy.allow(path, attempt, start, delay):
+                    raise
+            else:
+                reason, ambiguous = policy.classify(status_code=response.status_code)
+                delay = 0 if reason is None else policy.delay(path, attempt)
+                if reason is None or not policy.allow(path, attempt, start, delay):
+                    break
+            if ambiguous and verify is not None:
+                landed = self.__verify(path, verify, since)
+                if landed is not None:
+                    return landed
+            if metrics is not None:
+                metrics.inc('retries_total', labels + (('reason', reason),))
+            if policy.on_retry is not None:
+                policy.on_retry(path, attempt, reason, delay)
+            time.sleep(delay)
+
+        if metrics is None:
+            return error_parser(response)
+        parse_start = time.perf_counter()
+        try:
+            return error_parser(response)
+        finally:
+            end = time.perf_counter()
+            metrics.observe('request_seconds', labels + (('phase', 'parse'),), end - parse_start)
+            metrics.observe('request_seconds', labels + (('phase', 'total'),),
+                            time.monotonic() - start)
+
+    def __attempt(self, method, path, query, data, timeout, labels):
+        '''Sign and send request once'''
+        metrics = self.__metrics
+        if metrics is None:
+            headers = self.__make_header(method + path + query + data)
+            return self.__send(method, path + query, data, headers, timeout)
+
+        # with metrics
+        start = time.perf_counter()
+        headers = self.__make_header(method + path + query + data)
+        signed = time.perf_counter()
+        try:
+            response = self.__send(method, path + query, data, headers, timeout)
+        except Exception as ex:
+            metrics.inc('requests_total', labels + (('outcome', type(ex).__name__),))
+            raise
+        sent = time.perf_counter()
+        metrics.observe('request_seconds', labels + (('phase', 'sign'),), signed - start)
+        metrics.observe('request_seconds', labels + (('phase', 'send'),), sent - signed)
+        metrics.observe('request_seconds', labels + (('phase', 'first_byte'),),
+                        response.elapsed.total_seconds())
+        outcome = 'ok' if response.status_code == 200 else 'HTTP%d' % response.status_code
+        metrics.inc('requests_total', labels + (('outcome', outcome),))
+        return response
+
+    def __send(self, method, uri_path, data, headers, timeout):
+        '''Send request by a session borrowed from the pool'''
+        import requests
+        uri = self.__api_endpoint + uri_path
+        pool = self.__session_pool
+        session = pool.acquire()
         try:
-            response = self.__get_session().post(uri, data=data, headers=headers, timeout=self.__post_timeout)
-        except requests.exceptions.ConnectionError:
-            # If session disconnect, reconnect the session and command retry.
-            with open('error_session.log', 'a') as ferr:
-                ferr.write(str(datetime.now()) + '\n')
-            self.__session = None
-            response = self.__get_session().post(uri, data=data, headers=headers, timeout=self.__post_timeout)
-        return error_parser(response)
+            response = session.request(method, uri, data=data or None,
+                                       headers=headers, timeout=timeout)
+        except requests.exceptions.ConnectionError as ex:
+            # If session disconnect, replace only this session(retry is up to the policy).
+            pool.discard(session)
+            self.__report_reconnect(uri_path.split('?')[0], ex)
+            raise
+        except Exception:
+            pool.release(session)
+            raise
+        pool.release(session)
+        return response
+
+    def __report_reconnect(self, path, ex):
+        '''Report reconnect to metrics and callback'''
+        if self.__metrics is not None:
+            self.__metrics.inc('reconnects_total', (('endpoint', path),))
+        if self.__on_reconnect is not None:
+            self.__on_reconnect(path, ex)
+
+    def __verify(self, path, verify, since):
+        '''Look up whether the previous attempt landed(raise if unknown)'''
+        policy = self.__retry_policy
+        for index in range(policy.verify_attempts):
+            if index > 0:
+                time.sleep(policy.verify_interval)
+            landed = verify(since - timedelta(seconds=self.VERIFY_SKEW))
+            if landed is not None:
+                if self.__metrics is not None:
+                    self.__metrics.inc('retries_total', (('endpoint', path), ('reason', 'landed')))
+                return landed
+        return None
+
+    def __remember(self, res, key):
+        '''Remember acceptance id sent by this instance'''
+        if isinstance(res, dict) and key in res:
+            self.__sent_ids.append(res[key])
+        return res
+
+    def __send_order(self, path, query_dct, verify, key):
+        '''
+        Send order(serialized with identical orders) and remember its acceptance id
+
+        An order found by verify is claimed only if it is not in the sent ids.
+        Identical orders of this instance are sent one at a time, so the
+        order of a concurrent identical send(response not received yet)
+        cannot be claimed as landed. Identical orders sent by other
+        instances or processes in the same time window still can be.
+        '''
+        order_key = path + json.dumps(query_dct, sort_keys=True)
+        with self.__sending_lock:
+            entry = self.__sending.setdefault(order_key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                res = self.__post_query(path, query_dct, verify)
+                return self.__remember(res, key)
+        finally:
+            with self.__sending_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.__sending[order_key]
+
+    def __find_childorder(self, query_dct, since):
+        '''Return response of sendchildorder if the order is found in recent orders'''
+        rows = self.get_childorders(query_dct['product_code'], count=self.VERIFY_COUNT)
+        for row in rows:
+            if row['child_order_acceptance_id'] in self.__sent_ids:
+                continue
+            date = iso2dt(row.get('child_order_date', ''))
+            if date is None or date < since:
+                continue
+            if (row['side'] == query_dct['side']
+                    and row['child_order_type'] == query_dct['child_order_type']
+                    and float(row['size']) == float(query_dct['size'])
+                    and (query_dct['price'] is None
+                         or float(row['price']) == float(query_dct['price']))):
+                return {'child_order_acceptance_id': row['child_order_acceptance_id']}
+        return None
+
+    def __find_parentorder(self, query_dct, since):
+        '''Return response of sendparentorder if the order is found in recent orders'''
+        first = query_dct['parameters'][0]
+        types = (query_dct['order_method'], first['condition_type'])
+        rows = self.get_parentorders(first['product_code'], count=self.VERIFY_COUNT)
+        for row in rows:
+            if row['parent_order_acceptance_id'] in self.__sent_ids:
+                continue
+            date = iso2dt(row.get('parent_order_date', ''))
+            if date is None or date < since:
+                continue
+            if (row['parent_order_type'] in types
+                    and row['side'] == first['side']
+                    and float(row['size']) == float(first['size'])):
+                return {'parent_order_acceptance_id': row['parent_order_acceptance_id']}
+        return None
+
+    @property
+    def cache(self):
+        '''[property] ResponseCache(None if not cached)'''
+        return self.__cache
+
+    @property
+    def session_pool(self):
+        '''[property] SessionPool'''
+        return self.__session_pool
+
+    def keep_warm(self, count=None, *, interval=None, rate_limits=()):
+        '''
+        Open count sessions to the API host and keep them warm in background
+        by GET /v1/gethealth(every stale_after / 4 seconds by default)
+
+        Pings are public requests counted on rate_limits(the budget per IP,
+        up to count requests per interval).
+        '''
+        self.__session_pool.start_keepalive(self.__api_endpoint + '/v1/gethealth',
+                                            count=count, interval=interval,
+                                            rate_limits=rate_limits)
 
     def get_permissions(self):
         '''API キーの権限を取得'''
@@ -173,7 +389,9 @@ class PrivateAPI(object):
             query_dct['minute_to_expire'] = minute_to_expire
         if time_in_force is not None:
             query_dct['time_in_force'] = time_in_force
-        return self.__post_query(path, query_dct)
+        return self.__send_order(path, query_dct,
+                                 lambda since: self.__find_parentorder(query_dct, since),
+                                 'parent_order_acceptance_id')
 
     def send_cancelparentorder(self, product_code,
                                *,
@@ -205,7 +423,9 @@ class PrivateAPI(object):
             query_dct['minute_to_expire'] = minute_to_expire
         if time_in_force is not None:
             query_dct['time_in_force'] = time_in_force
-        return self.__post_query(path, query_dct)
+        return self.__send_order(path, query_dct,
+                                 lambda since: self.__find_childorder(query_dct, since),
+                                 'child_order_acceptance_id')
 
     def send_childorder_limit_buy(self, product_code,
                                   price, size,
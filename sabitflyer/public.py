@@ -1,20 +1,49 @@
 # -*- coding: utf-8 -*-
 '''public API module'''
-
-import requests
-from .common import error_parser
+from urllib.parse import urlsplit
+from .common import error_parser, acquire_budgets
 
 
 class PublicAPI(object):
     '''public API class'''
 
-    def __init__(self, *, timeout=None):
-        self.__api_endpoint = "https://api.bitflyer.com"
+    API_ENDPOINT = "https://api.bitflyer.com"
+
+    def __init__(self, *, timeout=None, endpoint=None, session_pool=None, rate_limits=(), cache=None,
+                 budget_timeout=None):
+        self.__api_endpoint = endpoint if endpoint is not None else self.API_ENDPOINT
         self.__timeout = timeout
+        self.__session_pool = session_pool
+        self.__rate_limits = rate_limits
+        self.__budget_timeout = budget_timeout
+        self.__cache = cache
 
     def __query(self, query_url):
         '''query'''
-        response = requests.get(query_url, timeout=self.__timeout)
+        if self.__cache is not None:
+            url = urlsplit(query_url)
+            key = url.path + ('?' + url.query if url.query else '')
+            return self.__cache.fetch(url.path, key, lambda: self.__get(query_url))
+        return self.__get(query_url)
+
+    def __get(self, query_url):
+        '''GET Method'''
+        import requests     # loaded on the first request
+        if self.__rate_limits:
+            acquire_budgets(self.__rate_limits, self.__budget_timeout)
+        pool = self.__session_pool
+        if pool is None:
+            return error_parser(requests.get(query_url, timeout=self.__timeout))
+        session = pool.acquire()
+        try:
+            response = session.get(query_url, timeout=self.__timeout)
+        except requests.exceptions.ConnectionError:
+            pool.discard(session)
+            raise
+        except Exception:
+            pool.release(session)
+            raise
+        pool.release(session)
         return error_parser(response)
 
     def get_by_url(self, url):
@@ -39,10 +68,16 @@ class PublicAPI(object):
         query = '?product_code=' + pair
         return self.__query(self.__api_endpoint + path + query)
 
-    def get_executions(self, pair):
+    def get_executions(self, pair, *, count=None, before=None, after=None):
         ''' 約定履歴の取得 '''
         path = '/v1/getexecutions'
         query = '?product_code=' + pair
+        if count is not None:
+            query += '&count=%d' % count
+        if before is not None:
+            query += '&before=%d' % before
+        if after is not None:
+            query += '&after=%d' % after
         return self.__query(self.__api_endpoint + path + query)
 
     def get_boardstate(self, pair):
@@ -3,7 +3,7 @@
 
 from enum import Enum
 import json
-import websocket
+from .common import make_num
 
 
 class RealtimeAPI(object):
@@ -11,10 +11,15 @@ class RealtimeAPI(object):
     Realtime API for bitFlyer by JSON-RPC 2.0 over WebSocket
 
     *** The description of callback ***
-    on_message and on_close are normal callbacks from websocket.
+    on_message, on_close and on_open(after subscribing) are normal callbacks
+    from websocket.
     on_message_board, on_message_board_snapshot, on_message_ticker
     and on_message_executions are special callbacks created
     by parsing message.
+
+    *** The description of numeric ***
+    numeric(NumericMode or NumConverter) converts prices and sizes of
+    the special callback data. None passes the received values as is.
     '''
 
     WS_URL = 'wss://ws.lightstream.bitflyer.com/json-rpc'
@@ -47,14 +52,21 @@ class RealtimeAPI(object):
 
     class BoardData(object):
         '''board data class for callback'''
-        def __init__(self, msg):
-            self.mid_price = msg['mid_price']
-            self.bids = msg['bids']
-            self.asks = msg['asks']
+        def __init__(self, msg, num=None):
+            if num is None:
+                self.mid_price = msg['mid_price']
+                self.bids = msg['bids']
+                self.asks = msg['asks']
+            else:
+                price = num.price
+                size = num.size
+                self.mid_price = price(msg['mid_price'])
+                self.bids = [{'price': price(lv['price']), 'size': size(lv['size'])} for lv in msg['bids']]
+                self.asks = [{'price': price(lv['price']), 'size': size(lv['size'])} for lv in msg['asks']]
 
     class TickerData(object):
         '''ticker data class for callback'''
-        def __init__(self, msg):
+        def __init__(self, msg, num=None):
             self.product_code = msg['product_code']
             self.timestamp = msg['timestamp']
             self.tick_id = msg['tick_id']
@@ -67,14 +79,28 @@ class RealtimeAPI(object):
             self.ltp = msg['ltp']
             self.volume = msg['volume']
             self.volume_by_product = msg['volume_by_product']
+            if num is not None:
+                self.best_bid = num.price(self.best_bid)
+                self.best_ask = num.price(self.best_ask)
+                self.ltp = num.price(self.ltp)
+                self.best_bid_size = num.size(self.best_bid_size)
+                self.best_ask_size = num.size(self.best_ask_size)
+                self.total_bid_depth = num.size(self.total_bid_depth)
+                self.total_ask_depth = num.size(self.total_ask_depth)
+                self.volume = num.size(self.volume)
+                self.volume_by_product = num.size(self.volume_by_product)
 
     class ExecutionData(object):
         '''executions data class for callback'''
-        def __init__(self, msg):
+        def __init__(self, msg, num=None):
             self.order_id = msg['id']
             self.side = msg['side']
-            self.price = msg['price']
-            self.size = msg['size']
+            if num is None:
+                self.price = msg['price']
+                self.size = msg['size']
+            else:
+                self.price = num.price(msg['price'])
+                self.size = num.size(msg['size'])
             self.exec_date = msg['exec_date']
             self.buy_child_order_acceptance_id = \
                 msg['buy_child_order_acceptance_id']
@@ -91,8 +117,11 @@ class RealtimeAPI(object):
                  on_message_executions=None,
                  on_close=None,
                  on_error=None,
+                 on_open=None,
                  ping_interval=30,
-                 ping_timeout=10):
+                 ping_timeout=10,
+                 numeric=None,
+                 ws_url=None):
 
         # callback
         self.__cb_on_message = on_message
@@ -102,13 +131,18 @@ class RealtimeAPI(object):
         self.__cb_on_message_executions = on_message_executions
         self.__cb_on_close = on_close
         self.__cb_on_error = on_error
+        self.__cb_on_open = on_open
 
         # listen channels
         self.listen_channels = []
         for channel in channel_list:
             self.listen_channels.append(channel.value)
 
+        # numeric representation
+        self.__num = None if numeric is None else make_num(numeric)
+
         # websocket
+        self.__ws_url = ws_url if ws_url is not None else self.WS_URL
         self.__ws = None
         self.__ws_ping_interval = ping_interval
         self.__ws_ping_timeout = ping_timeout
@@ -116,6 +150,7 @@ class RealtimeAPI(object):
     def __ws_on_open(self, ws):  # pylint: disable-msg=C0103
         for channel in self.listen_channels:
             ws.send(json.dumps({"method": "subscribe", "params": {"channel": channel}}))
+        self.__callback(self.__cb_on_open)
 
     def __parse_channel(self, channel):
         '''Separate channel name into header and pair.'''
@@ -162,21 +197,21 @@ class RealtimeAPI(object):
             pass
 
     def __ws_on_message_board_snapshot(self, rcv_pair, rcv_message):
-        data = self.BoardData(rcv_message)
+        data = self.BoardData(rcv_message, self.__num)
         self.__callback(self.__cb_on_message_board_snapshot, rcv_pair, data)
 
     def __ws_on_message_board(self, rcv_pair, rcv_message):
-        data = self.BoardData(rcv_message)
+        data = self.BoardData(rcv_message, self.__num)
         self.__callback(self.__cb_on_message_board, rcv_pair, data)
 
     def __ws_on_message_ticker(self, rcv_pair, rcv_message):
-        data = self.TickerData(rcv_message)
+        data = self.TickerData(rcv_message, self.__num)
         self.__callback(self.__cb_on_message_ticker, rcv_pair, data)
 
     def __ws_on_message_executions(self, rcv_pair, rcv_message):
         data_list = []
         for execution in rcv_message:
-            data = self.ExecutionData(execution)
+            data = self.ExecutionData(execution, self.__num)
             data_list.append(data)
         self.__callback(self.__cb_on_message_executions, rcv_pair, data_list)
 
@@ -199,7 +234,8 @@ class RealtimeAPI(object):
         if self.__ws is not None:
             self.stop()
 
-        self.__ws = websocket.WebSocketApp(self.WS_URL,
+        import websocket    # loaded on demand(websocket-client)
+        self.__ws = websocket.WebSocketApp(self.__ws_url,
                                            on_message=self.__ws_on_message,
                                            on_open=self.__ws_on_open,
                                            on_close=self.__ws_on_close,
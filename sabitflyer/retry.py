@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+'''リトライポリシーモジュール'''
+import random
+import threading
+import time
+from .common import RateBudget
+
+
+class RetryPolicy(object):
+    '''
+    Retry policy of PrivateAPI(retry_policy=...)
+
+    Retry on ConnectionError, Timeout, HTTP 5xx and 429 with full jitter
+    exponential backoff, until max_attempts or deadline(seconds from the
+    first attempt) is reached. Each endpoint has its own retry budget
+    (budget retries per period seconds), so a failing endpoint cannot
+    flood the exchange with retries.
+
+    endpoints overrides the settings per path:
+        RetryPolicy(endpoints={'/v1/me/cancelallchildorders': {'max_attempts': 1}})
+
+    on_retry(path, attempt, reason, delay) is called before each retry.
+    '''
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, *,
+                 max_attempts=3,
+                 base_delay=0.1,
+                 max_delay=2.0,
+                 deadline=5.0,
+                 budget=20,
+                 period=60,
+                 verify_attempts=2,
+                 verify_interval=0.5,
+                 endpoints=None,
+                 on_retry=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.budget = budget
+        self.period = period
+        self.verify_attempts = verify_attempts
+        self.verify_interval = verify_interval
+        self.endpoints = endpoints if endpoints is not None else {}
+        self.on_retry = on_retry
+        self.__budgets = {}     # path -> RateBudget
+        self.__lock = threading.Lock()
+
+    def __setting(self, path, name):
+        return self.endpoints.get(path, {}).get(name, getattr(self, name))
+
+    @staticmethod
+    def classify(error=None, status_code=None):
+        '''
+        Return (reason, ambiguous) of failure, reason is None if not retryable.
+        ambiguous is True if the request may have reached the exchange.
+        '''
+        if error is not None:
+            import requests     # already loaded by PrivateAPI
+            if isinstance(error, requests.exceptions.ConnectTimeout):
+                return 'ConnectTimeout', False
+            if isinstance(error, (requests.exceptions.ConnectionError,
+                                  requests.exceptions.Timeout)):
+                return type(error).__name__, True
+            return None, False
+        if status_code == 429:
+            return 'HTTP429', False
+        if status_code in RetryPolicy.RETRY_STATUS:
+            return 'HTTP%d' % status_code, True
+        return None, False
+
+    def delay(self, path, attempt):
+        '''Return backoff(seconds) before the attempt + 1'''
+        cap = min(self.__setting(path, 'max_delay'),
+                  self.__setting(path, 'base_delay') * 2 ** (attempt - 1))
+        return random.uniform(0, cap)
+
+    def allow(self, path, attempt, start, delay):
+        '''Return True if the attempt + 1 is allowed(consume the endpoint budget)'''
+        if attempt >= self.__setting(path, 'max_attempts'):
+            return False
+        if time.monotonic() + delay - start > self.__setting(path, 'deadline'):
+            return False
+        with self.__lock:
+            budget = self.__budgets.get(path)
+            if budget is None:
+                budget = self.__budgets[path] = RateBudget(self.__setting(path, 'budget'),
+                                                           self.__setting(path, 'period'))
+        return budget.acquire(timeout=0)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+'''HTTPセッション管理モジュール'''
+from collections import deque
+import threading
+import time
+
+
+class SessionPool(object):
+    '''
+    Bounded pool of requests.Session
+
+    A session is used by one thread at a time(acquire/release), so several
+    threads can send requests in parallel without sharing a session.
+    Sessions are created lazily up to size and reused LIFO to keep the
+    connections warm. A broken session is discarded without affecting the
+    sessions used by other threads.
+
+    warm()/start_keepalive() open sessions in advance and ping idle ones
+    periodically, so an order after an idle period does not pay for
+    DNS/TCP/TLS setup. Each ping is a request counted on rate_limits
+    (RateBudget per IP): up to size requests per interval, and a ping is
+    skipped instead of waiting while the budget is exhausted. With metrics, each acquire is counted as
+        sabitflyer_session_acquire_total{state}   new/warm/cold
+    where cold means idle for stale_after seconds or more.
+    '''
+
+    def __init__(self, size=4, *, pool_maxsize=1, metrics=None, stale_after=30):
+        self.size = size
+        self.stale_after = stale_after
+        self.__pool_maxsize = pool_maxsize
+        self.__metrics = metrics
+        self.__idle = deque()       # [session, last used(monotonic)], newest on right
+        self.__created = 0
+        self.__cond = threading.Condition()
+        self.__keepalive = None
+        self.__keepalive_stop = threading.Event()
+
+    def __new_session(self):
+        import requests     # loaded on demand(cold start of short-lived processes)
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.__pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def __count(self, state):
+        if self.__metrics is not None:
+            self.__metrics.inc('session_acquire_total', (('state', state),))
+
+    def acquire(self, timeout=None):
+        '''Borrow a session(wait if all sessions are in use)'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__cond:
+            while not self.__idle:
+                if self.__created < self.size:
+                    self.__created += 1
+                    break
+                wait = None if deadline is None else deadline - time.monotonic()
+                if wait is not None and wait <= 0:
+                    raise Exception('no session available in pool')
+                self.__cond.wait(wait)
+            else:
+                session, last_used = self.__idle.pop()
+                idle = time.monotonic() - last_used
+                self.__count('warm' if idle < self.stale_after else 'cold')
+                return session
+        self.__count('new')
+        return self.__new_session()
+
+    def release(self, session):
+        '''Return a borrowed session'''
+        with self.__cond:
+            self.__idle.append([session, time.monotonic()])
+            self.__cond.notify()
+
+    def discard(self, session):
+        '''Close a broken session(a new one is created on demand)'''
+        try:
+            session.close()
+        finally:
+            with self.__cond:
+                self.__created -= 1
+                self.__cond.notify()
+
+    @property
+    def created(self):
+        '''[property] number of sessions created and not discarded'''
+        return self.__created
+
+    @staticmethod
+    def __budget(rate_limits):
+        '''Consume a request of all budgets without waiting(False if exhausted)'''
+        return all(budget.acquire(0) for budget in rate_limits)
+
+    def __ping(self, session, url, timeout):
+        '''Send lightweight request(False if the connection is dead)'''
+        import requests
+        try:
+            session.get(url, timeout=timeout).close()
+            return True
+        except requests.exceptions.RequestException:
+            return False
+
+    def warm(self, url, count=None, *, timeout=5, rate_limits=()):
+        '''Open count(default: size) sessions by GET url'''
+        count = self.size if count is None else min(count, self.size)
+        with self.__cond:
+            count -= len(self.__idle)
+        sessions = []
+        for _ in range(max(count, 0)):
+            with self.__cond:
+                if self.__created >= self.size:
+                    break
+                self.__created += 1
+            sessions.append(self.__new_session())
+        for session in sessions:
+            if not self.__budget(rate_limits):
+                self.release(session)   # opened on the first request
+            elif self.__ping(session, url, timeout):
+                self.release(session)
+            else:
+                self.discard(session)
+        return len(sessions)
+
+    def keepalive(self, url, *, timeout=5, rate_limits=()):
+        '''
+        Ping sessions idle for stale_after / 2 or more once(oldest first)
+
+        A session whose connection is dead is replaced by a new warm one.
+        Return number of replaced sessions.
+        '''
+        replaced = 0
+        threshold = self.stale_after / 2
+        with self.__cond:
+            count = len(self.__idle)
+        for _ in range(count):
+            with self.__cond:
+                if not self.__idle or time.monotonic() - self.__idle[0][1] < threshold:
+                    break
+                if not self.__budget(rate_limits):
+                    break
+                session, _ = self.__idle.popleft()
+            if self.__ping(session, url, timeout):
+                self.release(session)
+                continue
+            if self.__metrics is not None:
+                self.__metrics.inc('keepalive_failures_total', ())
+            self.discard(session)
+            # replace it directly(warm() counts the other idle sessions)
+            with self.__cond:
+                if self.__created >= self.size or not self.__budget(rate_limits):
+                    continue
+                self.__created += 1
+            session = self.__new_session()
+            if self.__ping(session, url, timeout):
+                self.release(session)
+                replaced += 1
+            else:
+                self.discard(session)
+        return replaced
+
+    def start_keepalive(self, url, *, count=None, interval=None, timeout=5, rate_limits=()):
+        '''Warm count sessions and keep them warm in background'''
+        if self.__keepalive is not None:
+            return
+        self.warm(url, count, timeout=timeout, rate_limits=rate_limits)
+        interval = self.stale_after / 4 if interval is None else interval
+        self.__keepalive_stop.clear()
+
+        def _run():
+            while not self.__keepalive_stop.wait(interval):
+                self.keepalive(url, timeout=timeout, rate_limits=rate_limits)
+
+        self.__keepalive = threading.Thread(target=_run, daemon=True)
+        self.__keepalive.start()
+
+    def stop_keepalive(self):
+        '''Stop background keepalive'''
+        if self.__keepalive is None:
+            return
+        self.__keepalive_stop.set()
+        self.__keepalive.join()
+        self.__keepalive = None
+
+    def close(self):
+        '''Stop keepalive and close idle sessions'''
+        self.stop_keepalive()
+        while True:
+            with self.__cond:
+                if not self.__idle:
+                    return
+                session, _ = self.__idle.pop()
+            self.discard(session)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+'''SFD(現物とFXの価格乖離)監視モジュール'''
+import calendar
+import threading
+import time
+from .realtime import RealtimeAPI
+
+
+def iso2epoch(str_dt):
+    '''ISO形式の文字列(YYYY-MM-DDTHH:MM:SS[.f][Z])をepoch秒へ変換(失敗時はNone)'''
+    try:
+        epoch = calendar.timegm((int(str_dt[0:4]), int(str_dt[5:7]), int(str_dt[8:10]),
+                                 int(str_dt[11:13]), int(str_dt[14:16]), int(str_dt[17:19])))
+        if len(str_dt) > 20 and str_dt[19] == '.':
+            epoch += float('0.' + str_dt[20:].rstrip('Z'))
+        return epoch
+    except:     # pylint: disable-msg=W0702
+        return None
+
+
+class SFDMonitor(object):
+    '''
+    SFD monitor by spot(BTC_JPY) and FX(FX_BTC_JPY) realtime streams
+
+    Keeps the last price and exchange timestamp of both pairs and the
+    divergence ratio (fx - spot) / spot updated in O(1) per tick.
+    The ratio is aligned when the timestamps of both prices are within
+    max_skew seconds, and band crossings are only detected on aligned
+    ratios.
+
+    *** The description of callback ***
+    on_cross(monitor, event) is called when |ratio| crosses a band.
+    on_message_ticker/on_message_executions can be passed to RealtimeAPI as is.
+    '''
+
+    BANDS = (0.05, 0.10, 0.15, 0.20)    # SFD徴収の乖離率の区分
+
+    class CrossEvent(object):
+        '''band crossing event for callback'''
+        __slots__ = ('band', 'prev_band', 'threshold', 'ratio', 'spot', 'fx', 'timestamp')
+
+        def __init__(self, band, prev_band, threshold, ratio, spot, fx, timestamp):
+            self.band = band                # 現在の区分(0: 区分なし, 1..: BANDS[band - 1]以上)
+            self.prev_band = prev_band
+            self.threshold = threshold      # 跨いだ境界の乖離率(新しい区分側)
+            self.ratio = ratio              # 乖離率((fx - spot) / spot)
+            self.spot = spot
+            self.fx = fx
+            self.timestamp = timestamp      # 新しい方の約定時刻(epoch秒)
+
+    def __init__(self, *, bands=BANDS, max_skew=1.0, hysteresis=0.0, on_cross=None,
+                 spot_pair='BTC_JPY', fx_pair='FX_BTC_JPY'):
+        self.bands = tuple(sorted(bands))
+        self.max_skew = max_skew
+        self.hysteresis = hysteresis
+        self.spot_pair = spot_pair
+        self.fx_pair = fx_pair
+        self.__cb_on_cross = on_cross
+        self.__lock = threading.Lock()
+        self.__spot = None
+        self.__spot_ts = None
+        self.__fx = None
+        self.__fx_ts = None
+        self.__ratio = None
+        self.__aligned = False
+        self.__band = 0
+
+    def channels(self, ticker=True):
+        '''Return RealtimeAPI.ListenChannel list to subscribe'''
+        channel = RealtimeAPI.ListenChannel
+        if ticker:
+            return [channel['TICKER_' + self.spot_pair], channel['TICKER_' + self.fx_pair]]
+        return [channel['EXECUTIONS_' + self.spot_pair], channel['EXECUTIONS_' + self.fx_pair]]
+
+    def update(self, pair, price, timestamp=None):
+        '''Update last price of pair(timestamp: epoch seconds, None is now)'''
+        if timestamp is None:
+            timestamp = time.time()
+        event = None
+        with self.__lock:
+            if pair == self.spot_pair:
+                self.__spot = float(price)
+                self.__spot_ts = timestamp
+            elif pair == self.fx_pair:
+                self.__fx = float(price)
+                self.__fx_ts = timestamp
+            else:
+                return
+            spot = self.__spot
+            fx = self.__fx
+            if spot is None or fx is None or spot <= 0:
+                return
+            ratio = self.__ratio = (fx - spot) / spot
+            self.__aligned = abs(self.__fx_ts - self.__spot_ts) <= self.max_skew
+            if self.__aligned:
+                event = self.__check_band(ratio, max(self.__fx_ts, self.__spot_ts))
+        if event is not None and self.__cb_on_cross is not None:
+            try:
+                self.__cb_on_cross(self, event)
+            except:     # pylint: disable-msg=W0702
+                import traceback
+                traceback.print_exc()
+
+    def __check_band(self, ratio, timestamp):
+        '''Return CrossEvent if the band is changed'''
+        prev = self.__band
+        divergence = abs(ratio)
+        band = prev
+        bands = self.bands
+        while band < len(bands) and divergence >= bands[band]:
+            band += 1
+        while band > 0 and divergence < bands[band - 1] - self.hysteresis:
+            band -= 1
+        if band == prev:
+            return None
+        self.__band = band
+        threshold = bands[band - 1] if band > prev else bands[band]
+        return self.CrossEvent(band, prev, threshold, ratio, self.__spot, self.__fx, timestamp)
+
+    def on_message_ticker(self, _, pair, data):
+        '''callback for RealtimeAPI(on_message_ticker)'''
+        self.update(pair, data.ltp, iso2epoch(data.timestamp))
+
+    def on_message_executions(self, _, pair, data_list):
+        '''callback for RealtimeAPI(on_message_executions)'''
+        if data_list:
+            data = data_list[-1]
+            self.update(pair, data.price, iso2epoch(data.exec_date))
+
+    @property
+    def ratio(self):
+        '''[property] divergence ratio((fx - spot) / spot, None if unknown)'''
+        return self.__ratio
+
+    @property
+    def aligned(self):
+        '''[property] True if the timestamps of both prices are within max_skew'''
+        return self.__aligned
+
+    @property
+    def band(self):
+        '''[property] current band(0: below BANDS[0])'''
+        return self.__band
+
+    def allows(self, side, max_band=1):
+        '''
+        Return False if an FX order of side widens the divergence at band
+        max_band or over(BUY at FX premium, SELL at FX discount), or the
+        ratio is unknown or not aligned.
+        '''
+        if hasattr(side, 'value'):
+            side = side.value
+        with self.__lock:
+            ratio = self.__ratio
+            if ratio is None or not self.__aligned:
+                return False
+            if self.__band < max_band:
+                return True
+        return (side == 'BUY') == (ratio < 0)
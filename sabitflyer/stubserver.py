@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+'''ローカル擬似bitFlyerサーバーモジュール(REST + JSON-RPC over WebSocket)'''
+import base64
+import hmac
+import json
+import random
+import socket
+import struct
+import threading
+import time
+from hashlib import sha1, sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+from .paper import PaperPrivateAPI
+
+_WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+_INT_PRMS = ('count', 'before', 'after', 'minute_to_expire')
+
+_PRIVATE_GET = {
+    '/v1/me/getpermissions': 'get_permissions',
+    '/v1/me/getbalance': 'get_getbalance',
+    '/v1/me/getcollateral': 'get_getcollateral',
+    '/v1/me/getcollateralaccounts': 'get_getcollateralaccounts',
+    '/v1/me/getdeposits': 'get_deposits',
+    '/v1/me/getchildorders': 'get_childorders',
+    '/v1/me/getparentorders': 'get_parentorders',
+    '/v1/me/getparentorder': 'get_parentorder',
+    '/v1/me/getpositions': 'get_getpositions',
+}
+
+_PRIVATE_POST = {
+    '/v1/me/sendchildorder': 'send_childorder',
+    '/v1/me/cancelchildorder': 'send_cancelchildorder',
+    '/v1/me/cancelallchildorders': 'send_cancelallchildorders',
+    '/v1/me/sendparentorder': 'send_parentorder',
+    '/v1/me/cancelparentorder': 'send_cancelparentorder',
+}
+
+
+class StubServer(object):
+    '''
+    Local bitFlyer stand-in server
+
+    Serves the REST endpoints used by PublicAPI/PrivateAPI(private requests
+    are verified by HMAC header and executed on PaperPrivateAPI) and the
+    lightstream JSON-RPC subscribe protocol on ws_url.
+    Latency, errors, 429 and disconnects can be injected by rate.
+
+    PublicAPI(endpoint=server.endpoint), PrivateAPI(..., endpoint=server.endpoint)
+    and RealtimeAPI(..., ws_url=server.ws_url) target the server.
+    '''
+
+    def __init__(self, api_key='key', api_secret='secret', *,
+                 host='127.0.0.1',
+                 port=0,
+                 exchange=None,
+                 latency=0.0,
+                 error_rate=0.0,
+                 throttle_rate=0.0,
+                 disconnect_rate=0.0,
+                 seed=None):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.exchange = exchange if exchange is not None else PaperPrivateAPI()
+        self.latency = latency                  # 応答遅延(sec)
+        self.error_rate = error_rate            # HTTP 500の発生率
+        self.throttle_rate = throttle_rate      # HTTP 429の発生率
+        self.disconnect_rate = disconnect_rate  # 応答せず切断する率(WebSocketはメッセージ毎)
+        self.health = 'NORMAL'
+        self.state = 'RUNNING'
+        self.requests = 0
+        self.__random = random.Random(seed)
+        self.__clients = []
+        self.__clients_lock = threading.Lock()
+        self.__replay_thread = None
+        self.__replay_stop = threading.Event()
+
+        self.__httpd = ThreadingHTTPServer((host, port), self.__handler_class())
+        self.__httpd.daemon_threads = True
+        self.__thread = None
+
+    @property
+    def endpoint(self):
+        '''[property] REST endpoint'''
+        host, port = self.__httpd.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    @property
+    def ws_url(self):
+        '''[property] WebSocket URL'''
+        host, port = self.__httpd.server_address[:2]
+        return 'ws://%s:%d/json-rpc' % (host, port)
+
+    def start(self):
+        '''To start serving in background'''
+        self.__thread = threading.Thread(target=self.__httpd.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        '''To stop serving'''
+        self.stop_replay()
+        self.disconnect_clients()
+        self.__httpd.shutdown()
+        self.__httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def inject(self):
+        '''Return injected fault('disconnect', 429, 500 or None)'''
+        if self.latency > 0:
+            time.sleep(self.latency)
+        rnd = self.__random.random()
+        if rnd < self.disconnect_rate:
+            return 'disconnect'
+        rnd -= self.disconnect_rate
+        if rnd < self.throttle_rate:
+            return 429
+        rnd -= self.throttle_rate
+        if rnd < self.error_rate:
+            return 500
+        return None
+
+    # -------------------------------------------------------------------------
+    # REST
+    # -------------------------------------------------------------------------
+    def verify(self, method, path, body, headers):
+        '''Verify HMAC headers of private API'''
+        timestamp = headers.get('ACCESS-TIMESTAMP', '')
+        plain_text = timestamp + method + path + body
+        sign = hmac.new(self.api_secret.encode('utf8'), plain_text.encode('utf8'), sha256).hexdigest()
+        return (headers.get('ACCESS-KEY') == self.api_key
+                and hmac.compare_digest(sign, headers.get('ACCESS-SIGN', '')))
+
+    def dispatch(self, method, path, body, headers):
+        '''Return (status code, response object) of a request'''
+        url = urlsplit(path)
+        prms = dict(parse_qsl(url.query))
+        if url.path.startswith('/v1/me/'):
+            if not self.verify(method, path, body, headers):
+                return 401, {'status': -500, 'error_message': 'Invalid signature', 'data': None}
+            if method == 'GET':
+                name = _PRIVATE_GET.get(url.path)
+            else:
+                name = _PRIVATE_POST.get(url.path)
+                prms = json.loads(body) if body else {}
+            if name is None:
+                return 404, {'status': -1, 'error_message': 'Not found', 'data': None}
+            for key in _INT_PRMS:
+                if key in prms:
+                    prms[key] = int(prms[key])
+            try:
+                return 200, getattr(self.exchange, name)(**prms)
+            except Exception as ex:     # pylint: disable-msg=W0703
+                error = ex.args[0] if ex.args and isinstance(ex.args[0], dict) else \
+                    {'status': -500, 'error_message': str(ex), 'data': None}
+                return 400, error
+        return self.__public(url.path, prms)
+
+    def __public(self, path, prms):
+        pair = prms.get('product_code', 'BTC_JPY')
+        if path in ('/v1/getmarkets', '/v1/markets'):
+            return 200, [{'product_code': 'BTC_JPY'}, {'product_code': 'FX_BTC_JPY'}]
+        if path in ('/v1/getboard', '/v1/board'):
+            return 200, self.exchange.get_board(pair)
+        if path in ('/v1/getticker', '/v1/ticker'):
+            board = self.exchange.get_board(pair)
+            return 200, {
+                'product_code': pair,
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()),
+                'best_bid': board['bids'][0]['price'] if board['bids'] else 0,
+                'best_ask': board['asks'][0]['price'] if board['asks'] else 0,
+                'best_bid_size': board['bids'][0]['size'] if board['bids'] else 0,
+                'best_ask_size': board['asks'][0]['size'] if board['asks'] else 0,
+                'ltp': self.exchange.get_ltp(pair) or 0
+            }
+        if path in ('/v1/getexecutions', '/v1/executions'):
+            rows = self.exchange.get_executions(pair)
+            if 'before' in prms:
+                rows = [row for row in rows if row['id'] is not None and row['id'] < int(prms['before'])]
+            if 'after' in prms:
+                rows = [row for row in rows if row['id'] is not None and row['id'] > int(prms['after'])]
+            return 200, rows[:int(prms.get('count', 100))]
+        if path == '/v1/getboardstate':
+            return 200, {'health': self.health, 'state': self.state}
+        if path == '/v1/gethealth':
+            return 200, {'status': self.health}
+        if path == '/v1/getchats':
+            return 200, []
+        return 404, {'status': -1, 'error_message': 'Not found', 'data': None}
+
+    # -------------------------------------------------------------------------
+    # WebSocket
+    # -------------------------------------------------------------------------
+    def publish(self, channel, message):
+        '''Send channelMessage to subscribed clients'''
+        frame = _ws_frame(json.dumps({'jsonrpc': '2.0', 'method': 'channelMessage',
+                                      'params': {'channel': channel, 'message': message}}))
+        with self.__clients_lock:
+            clients = [client for client in self.__clients if channel in client.channels]
+        for client in clients:
+            if self.disconnect_rate > 0 and self.__random.random() < self.disconnect_rate:
+                client.close()
+                continue
+            client.send(frame)
+
+    def disconnect_clients(self):
+        '''Disconnect all WebSocket clients'''
+        with self.__clients_lock:
+            clients = list(self.__clients)
+        for client in clients:
+            client.close()
+
+    def replay(self, data, *, speed=1.0, loop=False):
+        '''
+        Replay MarketData(sweep module) to subscribers in background.
+        speed is the multiplier of recorded time(None is as fast as possible).
+        Executions are also matched on the exchange.
+        '''
+        from .sweep import KIND_EXECUTION, KIND_BOARD
+
+        def _publish_board(pair, bids, asks, snapshot):
+            self.exchange.update_board(pair, bids, asks, snapshot=snapshot)
+            mid_price = self.exchange.get_board(pair)['mid_price']
+            channel = 'lightning_board_snapshot_' if snapshot else 'lightning_board_'
+            self.publish(channel + pair, {'mid_price': mid_price, 'bids': bids, 'asks': asks})
+
+        def _run():
+            pair = data.pair
+            values = data.values
+            while not self.__replay_stop.is_set():
+                start = time.time()
+                first_ts = None
+                # levels of the same timestamp are one board message(as MarketData.replay)
+                bids = []
+                asks = []
+                snapshot = False
+                board_ts = None
+                for pos in range(0, len(values), 6):
+                    if self.__replay_stop.is_set():
+                        return
+                    ts, kind, a, b, c, d = values[pos:pos + 6]
+                    if board_ts is not None and (kind != KIND_BOARD or ts != board_ts or a == 1.0):
+                        _publish_board(pair, bids, asks, snapshot)
+                        bids = []
+                        asks = []
+                        board_ts = None
+                    if first_ts is None:
+                        first_ts = ts
+                    if speed is not None:
+                        wait = (ts - first_ts) / speed - (time.time() - start)
+                        if wait > 0:
+                            time.sleep(wait)
+                    if kind == KIND_EXECUTION:
+                        side = {1.0: 'BUY', -1.0: 'SELL'}.get(b, '')
+                        self.exchange.execute(pair, side, c, d, int(a))
+                        self.publish('lightning_executions_' + pair, [{
+                            'id': int(a), 'side': side, 'price': c, 'size': d,
+                            'exec_date': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()),
+                            'buy_child_order_acceptance_id': '',
+                            'sell_child_order_acceptance_id': ''}])
+                    elif kind == KIND_BOARD:
+                        if board_ts is None:
+                            board_ts = ts
+                            snapshot = (a == 1.0)
+                        if b == 1.0:
+                            bids.append({'price': c, 'size': d})
+                        elif b == -1.0:
+                            asks.append({'price': c, 'size': d})
+                if board_ts is not None:
+                    _publish_board(pair, bids, asks, snapshot)
+                if not loop:
+                    return
+
+        self.stop_replay()
+        self.__replay_stop.clear()
+        self.__replay_thread = threading.Thread(target=_run, daemon=True)
+        self.__replay_thread.start()
+        return self.__replay_thread
+
+    def stop_replay(self):
+        '''To stop replay'''
+        self.__replay_stop.set()
+        if self.__replay_thread is not None:
+            self.__replay_thread.join()
+        self.__replay_thread = None
+
+    def _add_client(self, client):
+        with self.__clients_lock:
+            self.__clients.append(client)
+
+    def _remove_client(self, client):
+        with self.__clients_lock:
+            if client in self.__clients:
+                self.__clients.remove(client)
+
+    def __handler_class(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # ヘッダーとボディの分割送信で遅延ACK待ちにならないようにする
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *_):      # pylint: disable-msg=W0221
+                pass
+
+            def do_GET(self):   # pylint: disable-msg=C0103
+                '''GET Method'''
+                if self.headers.get('Upgrade', '').lower() == 'websocket':
+                    self.__websocket()
+                else:
+                    self.__rest('GET', '')
+
+            def do_POST(self):  # pylint: disable-msg=C0103
+                '''POST Method'''
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length).decode('utf8') if length > 0 else ''
+                self.__rest('POST', body)
+
+            def __rest(self, method, body):
+                server.requests += 1
+                fault = server.inject()
+                if fault == 'disconnect':
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                if fault is not None:
+                    self.__respond(fault, {'status': -1, 'error_message': 'injected error', 'data': None})
+                    return
+                status, res = server.dispatch(method, self.path, body, self.headers)
+                self.__respond(status, res)
+
+            def __respond(self, status, res):
+                data = b'' if res is None else json.dumps(res).encode('utf8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def __websocket(self):
+                key = self.headers.get('Sec-WebSocket-Key', '')
+                accept = base64.b64encode(sha1((key + _WS_GUID).encode('ascii')).digest()).decode('ascii')
+                self.send_response(101)
+                self.send_header('Upgrade', 'websocket')
+                self.send_header('Connection', 'Upgrade')
+                self.send_header('Sec-WebSocket-Accept', accept)
+                self.end_headers()
+                self.wfile.flush()
+                client = _WSClient(self.connection, self.rfile)
+                server._add_client(client)     # pylint: disable-msg=W0212
+                try:
+                    client.serve()
+                finally:
+                    server._remove_client(client)  # pylint: disable-msg=W0212
+                    self.close_connection = True
+
+        return _Handler
+
+
+class _WSClient(object):
+    '''WebSocket connection of a subscriber'''
+
+    def __init__(self, conn, rfile):
+        self.conn = conn
+        self.rfile = rfile
+        self.channels = set()
+        self.__lock = threading.Lock()
+        self.__closed = False
+
+    def send(self, frame):
+        '''Send a frame(ignore if closed)'''
+        with self.__lock:
+            if self.__closed:
+                return
+            try:
+                self.conn.sendall(frame)
+            except OSError:
+                self.__closed = True
+
+    def close(self):
+        '''Close the connection'''
+        self.send(_ws_frame(b'', opcode=0x8))
+        with self.__lock:
+            self.__closed = True
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def serve(self):
+        '''Receive frames until closed'''
+        while True:
+            try:
+                opcode, payload = _ws_read(self.rfile)
+            except (OSError, ValueError, struct.error):
+                return
+            if opcode == 0x8:       # close
+                self.close()
+                return
+            elif opcode == 0x9:     # ping
+                self.send(_ws_frame(payload, opcode=0xA))
+            elif opcode == 0x1:     # text
+                self.__on_message(payload.decode('utf8'))
+
+    def __on_message(self, text):
+        try:
+            msg = json.loads(text)
+        except ValueError:
+            return
+        channel = msg.get('params', {}).get('channel')
+        if msg.get('method') == 'subscribe' and channel:
+            self.channels.add(channel)
+            result = True
+        elif msg.get('method') == 'unsubscribe' and channel:
+            self.channels.discard(channel)
+            result = True
+        else:
+            result = False
+        if 'id' in msg:
+            self.send(_ws_frame(json.dumps({'jsonrpc': '2.0', 'id': msg['id'], 'result': result})))
+
+
+def _ws_frame(payload, opcode=0x1):
+    '''Make unmasked server frame'''
+    if isinstance(payload, str):
+        payload = payload.encode('utf8')
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def _ws_read(rfile):
+    '''Read a client frame and return (opcode, payload)'''
+    head = rfile.read(2)
+    if len(head) < 2:
+        raise ValueError('closed')
+    opcode = head[0] & 0x0F
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', rfile.read(8))[0]
+    mask = rfile.read(4) if head[1] & 0x80 else None
+    payload = rfile.read(length)
+    if mask is not None:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
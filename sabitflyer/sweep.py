@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+'''パラメータスイープモジュール(記録データ x プロセスプール)'''
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .broker import decode_orders
+from .brokerfx import decode_positions
+from .paper import PaperBrokerAPI, PaperBrokerFXAPI
+
+_MAGIC = b'SABFREC1'
+_HEADER = struct.Struct('<8s16s8x')     # magic, pair
+_RECORD = struct.Struct('<6d')          # ts, kind, a, b, c, d
+_FIELDS = 6
+
+KIND_EXECUTION = 0.0    # a: id, b: side(1: BUY, -1: SELL, 0: ''), c: price, d: size
+KIND_BOARD = 1.0        # a: snapshot(1: first level of snapshot), b: side(1: bid, -1: ask), c: price, d: size
+
+_SIDE2NUM = {'BUY': 1.0, 'SELL': -1.0}
+_NUM2SIDE = {1.0: 'BUY', -1.0: 'SELL'}
+
+
+class MarketRecorder(object):
+    '''
+    Recorder of board/executions
+
+    on_message_board, on_message_board_snapshot and on_message_executions
+    can be passed to RealtimeAPI(numeric=None) as is.
+    '''
+
+    def __init__(self, path, pair):
+        self.__pair = pair.value if hasattr(pair, 'value') else pair
+        self.__file = open(path, 'wb')
+        self.__file.write(_HEADER.pack(_MAGIC, self.__pair.encode('ascii')))
+
+    def close(self):
+        '''Close the file'''
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def write_board(self, ts, bids, asks, snapshot=False):
+        '''Write board(list of {'price', 'size'})'''
+        buf = []
+        for side, levels in ((1.0, bids), (-1.0, asks)):
+            for level in levels:
+                buf.append(_RECORD.pack(ts, KIND_BOARD, 1.0 if snapshot and not buf else 0.0,
+                                        side, level['price'], level['size']))
+        if snapshot and not buf:
+            buf.append(_RECORD.pack(ts, KIND_BOARD, 1.0, 0.0, 0.0, 0.0))
+        self.__file.write(b''.join(buf))
+
+    def write_execution(self, ts, exec_id, side, price, size):
+        '''Write an execution'''
+        self.__file.write(_RECORD.pack(ts, KIND_EXECUTION, exec_id, _SIDE2NUM.get(side, 0.0), price, size))
+
+    def on_message_board_snapshot(self, _, pair, data):
+        '''callback for RealtimeAPI(on_message_board_snapshot)'''
+        if pair == self.__pair:
+            self.write_board(time.time(), data.bids, data.asks, snapshot=True)
+
+    def on_message_board(self, _, pair, data):
+        '''callback for RealtimeAPI(on_message_board)'''
+        if pair == self.__pair:
+            self.write_board(time.time(), data.bids, data.asks)
+
+    def on_message_executions(self, _, pair, data_list):
+        '''callback for RealtimeAPI(on_message_executions)'''
+        if pair == self.__pair:
+            now = time.time()
+            for data in data_list:
+                self.write_execution(now, data.order_id, data.side, data.price, data.size)
+
+
+class MarketData(object):
+    '''Memory-mapped recorded board/executions(read only, zero copy)'''
+
+    def __init__(self, path):
+        with open(path, 'rb') as fdata:
+            self.__mmap = mmap.mmap(fdata.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, pair = _HEADER.unpack_from(self.__mmap, 0)
+        if magic != _MAGIC:
+            raise ValueError('not a recorded market data: %s' % path)
+        self.path = path
+        self.pair = pair.rstrip(b'\0').decode('ascii')
+        size = len(self.__mmap) - _HEADER.size
+        size -= size % _RECORD.size
+        self.values = memoryview(self.__mmap)[_HEADER.size:_HEADER.size + size].cast('d')
+
+    def __len__(self):
+        return len(self.values) // _FIELDS
+
+    def replay(self, api, *, on_board=None, on_execution=None):
+        '''Feed the data to PaperPrivateAPI(and strategy callbacks)'''
+        pair = self.pair
+        values = self.values
+        bids = []
+        asks = []
+        snapshot = False
+        board_ts = None
+        for pos in range(0, len(values), _FIELDS):
+            ts, kind, a, b, c, d = values[pos:pos + _FIELDS]
+            if board_ts is not None and (kind != KIND_BOARD or ts != board_ts or a == 1.0):
+                api.update_board(pair, bids, asks, snapshot=snapshot)
+                if on_board is not None:
+                    on_board(board_ts)
+                bids = []
+                asks = []
+                board_ts = None
+            api.set_time(ts)
+            if kind == KIND_EXECUTION:
+                side = _NUM2SIDE.get(b, '')
+                api.execute(pair, side, c, d, int(a))
+                if on_execution is not None:
+                    on_execution(ts, side, c, d)
+            else:
+                if board_ts is None:
+                    board_ts = ts
+                    snapshot = (a == 1.0)
+                if b == 1.0:
+                    bids.append({'price': c, 'size': d})
+                elif b == -1.0:
+                    asks.append({'price': c, 'size': d})
+        if board_ts is not None:
+            api.update_board(pair, bids, asks, snapshot=snapshot)
+            if on_board is not None:
+                on_board(board_ts)
+
+
+class RunResult(object):
+    '''result of a run'''
+
+    def __init__(self, params, orders, positions, fills, pnl, elapsed):
+        self.params = params            # parameter set(dict)
+        self.orders = orders            # list of OrderInfo
+        self.positions = positions      # list of PositionInfo(FX only)
+        self.fills = fills              # number of fills
+        self.pnl = pnl                  # 損益(JPY, 評価損益含む)
+        self.elapsed = elapsed          # 実行時間(sec)
+
+    def row(self):
+        '''Return summary as dict'''
+        rtn = dict(self.params)
+        rtn.update({'orders': len(self.orders), 'fills': self.fills,
+                    'position': sum(pi.amount * (1 if pi.side.value == 'BUY' else -1)
+                                    for pi in self.positions),
+                    'pnl': self.pnl, 'elapsed': self.elapsed})
+        return rtn
+
+
+def run_one(data, strategy_factory, params, *, numeric=None, **paper_kwargs):
+    '''
+    Replay the data with a strategy.
+    strategy_factory(broker, params) returns an object which may have
+    on_board(ts), on_execution(ts, side, price, size) and on_finish().
+    '''
+    start = time.time()
+    if data.pair.startswith('FX_'):
+        broker = PaperBrokerFXAPI(data.pair, numeric=numeric, **paper_kwargs)
+    else:
+        broker = PaperBrokerAPI(data.pair, numeric=numeric, **paper_kwargs)
+    api = broker.prv_api
+    balances = {row['currency_code']: row['amount'] for row in api.get_getbalance()}
+    collateral = api.get_getcollateral()['collateral']
+
+    strategy = strategy_factory(broker, params)
+    data.replay(api,
+                on_board=getattr(strategy, 'on_board', None),
+                on_execution=getattr(strategy, 'on_execution', None))
+    if hasattr(strategy, 'on_finish'):
+        strategy.on_finish()
+
+    orders = []
+    rows = api.get_childorders(data.pair, count=1000)
+    while rows:
+        orders.extend(rows)
+        rows = api.get_childorders(data.pair, count=1000, before=rows[-1]['id'])
+    ltp = api.get_ltp(data.pair) or 0
+    if data.pair.startswith('FX_'):
+        res_cll = api.get_getcollateral()
+        pnl = res_cll['collateral'] - collateral + res_cll['open_position_pnl']
+        positions = decode_positions(api.get_getpositions(data.pair), broker.num)
+    else:
+        pnl = 0.0
+        for row in api.get_getbalance():
+            delta = row['amount'] - balances.get(row['currency_code'], 0.0)
+            pnl += delta if row['currency_code'] == 'JPY' else delta * ltp
+        positions = []
+    return RunResult(params, decode_orders(orders, broker.num), positions,
+                     len(api.fills), pnl, time.time() - start)
+
+
+_WORKER_DATA = None
+
+
+def _init_worker(path):
+    global _WORKER_DATA     # pylint: disable-msg=W0603
+    _WORKER_DATA = MarketData(path)
+
+
+def _run_worker(strategy_factory, params, numeric, paper_kwargs):
+    return run_one(_WORKER_DATA, strategy_factory, params, numeric=numeric, **paper_kwargs)
+
+
+class SweepResult(object):
+    '''aggregated results of a sweep'''
+
+    def __init__(self, results):
+        self.results = results
+
+    def rows(self, sort_key='pnl', reverse=True):
+        '''Return list of summary rows sorted by sort_key'''
+        return sorted((res.row() for res in self.results), key=lambda row: row[sort_key], reverse=reverse)
+
+    def best(self, sort_key='pnl'):
+        '''Return the best RunResult'''
+        return max(self.results, key=lambda res: res.row()[sort_key])
+
+    def to_table(self, sort_key='pnl', reverse=True):
+        '''Return summary table as text'''
+        rows = self.rows(sort_key, reverse)
+        if not rows:
+            return ''
+        columns = list(rows[0].keys())
+        cells = [[str(row[col]) for col in columns] for row in rows]
+        widths = [max(len(col), *(len(cell[i]) for cell in cells)) for i, col in enumerate(columns)]
+        lines = ['  '.join(col.rjust(w) for col, w in zip(columns, widths))]
+        for cell in cells:
+            lines.append('  '.join(c.rjust(w) for c, w in zip(cell, widths)))
+        return '\n'.join(lines)
+
+
+def run_sweep(path, strategy_factory, param_list, *, processes=None, numeric=None, **paper_kwargs):
+    '''
+    Run strategy_factory with every parameter set over the recorded data.
+    Each worker process maps the file once, so the data pages are shared
+    and only parameters and results are pickled.
+    strategy_factory must be picklable(module level function or class).
+    '''
+    processes = processes if processes is not None else os.cpu_count()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(path,)) as executor:
+        futures = [executor.submit(_run_worker, strategy_factory, params, numeric, paper_kwargs)
+                   for params in param_list]
+        return SweepResult([future.result() for future in futures])